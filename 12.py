@@ -1,8 +1,6 @@
-import face_recognition
 import cv2
 import os
 import numpy as np
-from ultralytics import YOLO
 import tkinter as tk
 import tkinter.font as tkfont
 import tkinter.ttk as ttk
@@ -14,11 +12,87 @@ import time
 import requests, io, datetime
 import json
 import math
+import hashlib
+import queue
+import socket
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from detectors import DEFAULT_INPUT_SIZE, ModelManager, load_detector
+from diagnostics import Diagnostics
+from events import ACCESS_DENIED, ACCESS_GRANTED, AUTH_FAILED, make_event
+from metrics import MetricsExporter, PipelineMetrics
+from pipeline import (ENROLLMENT_PROFILE, ENV_IMAGE_SIZE, KIOSK_PROFILE, SECURITY_DEFAULT_SIZE,
+                      SECURITY_PROFILE, SECURITY_TARGET_FPS, UNKNOWN_ENV_NAME, FrameScheduler,
+                      KioskRecognizer, ResultSink, SecurityPipeline, SecurityRunner, VideoSource,
+                      count_valid_permissions, draw_metrics_overlay, encode_photo, get_profile,
+                      has_permission, point_in_poly)
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # Адрес API вашего сервера
 API_HOST = 'http://192.168.109.200:5001'     # или 'http://<IP_СЕРВЕРА>:5001'
 API_URL  = API_HOST + '/api'
-YOLO_WEIGHTS = 'yolov5s.pt'
+# Детектор людей: веса .pt (ultralytics) или экспортированная модель .onnx.
+# На рабочих местах без GPU быстрее ONNX через onnxruntime или OpenCV DNN
+# с уменьшенным входом, например FR_DETECTOR_SIZE=416
+YOLO_WEIGHTS = os.environ.get('FR_DETECTOR_MODEL', 'yolov5s.pt')
+DETECTOR_BACKEND = os.environ.get('FR_DETECTOR_BACKEND', 'auto')
+DETECTOR_INPUT_SIZE = int(os.environ.get('FR_DETECTOR_SIZE', DEFAULT_INPUT_SIZE))
+DETECTOR_THREADS = int(os.environ.get('FR_DETECTOR_THREADS', '0')) or None
+# Целевая частота кадров службы безопасности; на слабых машинах дорогие
+# стадии выполняются реже, чтобы изображение не отставало
+SECURITY_FPS = float(os.environ.get('FR_SECURITY_FPS', SECURITY_TARGET_FPS))
+# Когда загружать и прогревать YOLO: 'startup' — сразу в фоне,
+# 'security' — при выборе роли службы безопасности
+YOLO_PRELOAD = os.environ.get('FR_YOLO_PRELOAD', 'startup')
+# Профили распознавания (см. pipeline.PROFILES): киоск, служба
+# безопасности и кодирование эталонных фото сотрудников
+KIOSK_RECOGNITION = get_profile(os.environ.get('FR_KIOSK_PROFILE', KIOSK_PROFILE))
+SECURITY_RECOGNITION = get_profile(os.environ.get('FR_SECURITY_PROFILE', SECURITY_PROFILE))
+ENROLLMENT_RECOGNITION = get_profile(os.environ.get('FR_ENROLLMENT_PROFILE', ENROLLMENT_PROFILE))
+DETECTOR_STATUS = {
+    'idle': 'Детектор людей не загружен',
+    'loading': 'Детектор людей загружается, люди считаются по лицам',
+    'ready': 'Детектор людей готов',
+    'failed': 'Детектор людей недоступен, люди считаются по лицам',
+}
+
+# HTTP-сессии для API: держат соединения открытыми и просят у сервера
+# компактный MessagePack (если модуль установлен). gzip/br/zstd requests
+# запрашивает и распаковывает сам.
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+
+class ThreadSessions(threading.local):
+    """Своя ``requests.Session`` в каждом потоке.
+
+    Сессия не потокобезопасна, а к API обращаются поток Tk, фоновые
+    загрузки (стартовая, миниатюры, синхронизация) и обработчик логов,
+    который вызывается из любого потока. Атрибуты (``get``, ``post`` и
+    т.д.) берутся у сессии текущего потока.
+    """
+
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers['Accept'] = (f'{MSGPACK_MIMETYPE}, application/json;q=0.9'
+                                          if msgpack is not None else 'application/json')
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+api = ThreadSessions()
+
+
+def api_json(resp):
+    """Decode an API response in whichever format the server chose."""
+    if msgpack is not None and resp.headers.get('Content-Type', '').startswith(MSGPACK_MIMETYPE):
+        return msgpack.unpackb(resp.content, raw=False)
+    return resp.json()
 
 # --- Настройка логирования ---
 logging.basicConfig(
@@ -32,13 +106,16 @@ class ServerLogHandler(logging.Handler):
     """Отправляет сообщения лога на сервер."""
 
     def emit(self, record):
-        entry = {
+        # поля события журнала передаются через logging.log(..., extra={'event': ...})
+        entry = dict(getattr(record, 'event', None) or {})
+        entry.update({
             'timestamp': datetime.datetime.utcnow().isoformat(),
             'level': record.levelname,
-            'message': self.format(record)
-        }
+            'message': self.format(record),
+            'station': STATION_NAME,
+        })
         try:
-            requests.post(f"{API_URL}/logs", json=entry, timeout=2)
+            api.post(f"{API_URL}/logs", json=entry, timeout=2)
         except Exception as e:
             # если сервер недоступен, просто выводим сообщение в консоль
             print("Не удалось отправить лог:", e)
@@ -52,22 +129,69 @@ DEPARTMENTS_FILE = 'server/data/departments.txt'
 ENVIRONMENT_FILE = 'environment.txt'
 ASSIGNMENTS_FILE = 'assignments.json'
 ZONES_DIR = 'zones'
-PROCESSED_WARNINGS_FILE = 'server/data/processed_warnings.json'
+# Имя рабочего места в журнале обработки нарушений на сервере
+STATION_NAME = os.environ.get('FR_STATION_NAME') or socket.gethostname()
+# Локальный кэш фото и изображений с сервера (имена файлов неизменяемые)
+MEDIA_CACHE_DIR = 'server/data/media_cache'
+MEDIA_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# Поток изменений сервера (SSE): пауза перед переподключением, таймаут
+# чтения (больше интервала keep-alive сервера) и период разбора очереди в Tk
+FEED_RETRY_DELAY = 3
+FEED_READ_TIMEOUT = 40
+FEED_DRAIN_MS = 200
+# Сколько стартовая загрузка ждёт подключения к потоку изменений (секунды)
+FEED_CONNECT_WAIT = 5
+# Метрики конвейеров в формате Prometheus: файл для textfile collector
+# и, если задан FR_METRICS_PORT, HTTP-адрес /metrics
+METRICS_FILE = 'server/data/metrics/workstation.prom'
+METRICS_PORT = int(os.environ.get('FR_METRICS_PORT', '0'))
+METRICS_EXPORT_INTERVAL = 10
+# Результаты диагностики: Ctrl+Shift+P — cProfile потока Tk, Ctrl+Shift+S —
+# стеки всех потоков, Ctrl+Shift+M — прирост памяти с прошлого снимка
+# (то же по SIGUSR1 / SIGUSR2 без доступа к клавиатуре)
+DIAGNOSTICS_DIR = 'server/data/diagnostics'
 os.makedirs(KNOWN_FACES_DIR, exist_ok=True)
 os.makedirs(ZONES_DIR, exist_ok=True)
-os.makedirs(os.path.dirname(PROCESSED_WARNINGS_FILE), exist_ok=True)
+os.makedirs(os.path.dirname(DEPARTMENTS_FILE), exist_ok=True)
 if not os.path.exists(ASSIGNMENTS_FILE):
     with open(ASSIGNMENTS_FILE, 'w', encoding='utf-8') as f:
         f.write('[]')
 
-# Размер изображений помещений, используемый в интерфейсе руководителя
-# Увеличен для более удобной работы с зонами
-ENV_IMAGE_SIZE = (800, 600)
+# Размер изображений помещений в интерфейсе руководителя (ENV_IMAGE_SIZE)
+# задан в pipeline.py: в нём же хранятся координаты зон
+# Размер миниатюр в каталогах сотрудников и помещений
+CATALOG_THUMB_SIZE = 64
+# Сколько миниатюр каталога скачивается параллельно
+CATALOG_FETCH_WORKERS = 8
+
+# Загрузка при старте идёт в фоне; роль открывается, когда готовы её данные.
+# admin работает с сервером напрямую и ничего не ждёт
+ROLE_REQUIREMENTS = {
+    'employee': ('environments', 'assignments', 'faces', 'models'),
+    'admin': (),
+    'manager': ('environments', 'assignments', 'faces'),
+    'security': ('environments', 'assignments', 'faces', 'zones', 'models'),
+}
+BOOTSTRAP_LABELS = {
+    'faces': 'сотрудники',
+    'environments': 'помещения',
+    'assignments': 'допуски',
+    'zones': 'зоны',
+    'models': 'модели распознавания',
+}
+BOOTSTRAP_WORKERS = 5
+BOOTSTRAP_POLL_MS = 100
 
 # Высоты окон в интерфейсе службы безопасности
 SEC_PANE_MIN_HEIGHT = 300
 SEC_PANE_MAX_HEIGHT = 600
 SEC_LOGS_HEIGHT = 150
+# Общий журнал: сколько строк держит виджет и сколько подгружается за раз
+# (с конца журнала при открытии и по кнопке «Ранние записи»)
+LOG_VIEW_MAX_LINES = 2000
+LOG_PAGE_LINES = 500
+# Высота строки в списке нарушений; виджеты есть только у видимых строк
+WARNING_ROW_HEIGHT = 100
 # Цвет и ширина разделителей между областями
 SEC_SASH_COLOR = 'white'
 SEC_SASH_WIDTH = 3
@@ -96,22 +220,172 @@ DEPARTMENT_OPTIONS = {
 def load_known_faces():
     known_encodings, known_names = [], []
     mapping = {}
-    resp = requests.get(f"{API_URL}/employees")
-    for emp in resp.json():
-        # тянем фото по URL
-        photo_url = API_HOST + emp['photo_url']
-        r = requests.get(photo_url, timeout=5)
-        r.raise_for_status()
-        img_pil = Image.open(io.BytesIO(r.content)).convert('RGB')
-        img = np.array(img_pil)
-        encs = face_recognition.face_encodings(img)
-        if encs:
-            known_encodings.append(encs[0])
+    resp = api.get(f"{API_URL}/employees")
+    for emp in api_json(resp):
+        enc = encode_employee(emp)
+        if enc is not None:
+            known_encodings.append(enc)
             known_names.append(emp['name'])
             mapping[emp['name']] = emp['dept']
     save_department_mapping(mapping)
     return known_encodings, known_names, mapping
 
+
+def encode_employee(emp):
+    """Return the face encoding of an employee photo or ``None``."""
+    # фото по URL не меняется, поэтому его кодировка хранится в кэше медиа
+    # рядом с фото (пустая запись — на фото нет лица) и кодируется один раз
+    p = ENROLLMENT_RECOGNITION
+    key = f"{emp['photo_url']}#encoding:{p.detector},{p.upsample},{p.landmarks},{p.jitters}"
+    data = media_cache.get(key)
+    if data is not None:
+        if not data:
+            return None
+        try:
+            return np.load(io.BytesIO(data))
+        except ValueError:
+            pass
+    # тянем фото по URL (или из локального кэша)
+    img_pil = fetch_image(emp['photo_url']).convert('RGB')
+    enc = encode_photo(np.array(img_pil), p)
+    buf = io.BytesIO()
+    if enc is not None:
+        np.save(buf, enc)
+    media_cache.put(key, buf.getvalue())
+    return enc
+
+
+class MediaCache:
+    """Ограниченный по размеру LRU-кэш медиафайлов сервера на диске.
+
+    Файлы на сервере называются случайным uuid и никогда не меняются,
+    поэтому запись в кэше не требует перепроверки и живёт, пока её не
+    вытеснят более свежие.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.tmp'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            found.append((st.st_mtime, name, st.st_size))
+        # порядок по времени последнего использования, старые в начале
+        self.entries = OrderedDict((name, size) for _, name, size in sorted(found))
+        self.total = sum(self.entries.values())
+
+    @staticmethod
+    def _key(url):
+        return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+    def get(self, url):
+        """Return cached bytes for ``url`` or ``None``."""
+        key = self._key(url)
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+        path = os.path.join(self.directory, key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime хранит порядок LRU между перезапусками
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.total -= self.entries.pop(key, 0)
+            return None
+        return data
+
+    def put(self, url, data):
+        """Store ``data`` for ``url`` and evict least recently used files."""
+        if len(data) > self.max_bytes:
+            return
+        key = self._key(url)
+        path = os.path.join(self.directory, key)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self.lock:
+            self.total -= self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+            self.total += len(data)
+            while self.total > self.max_bytes and self.entries:
+                old, size = self.entries.popitem(last=False)
+                self.total -= size
+                try:
+                    os.remove(os.path.join(self.directory, old))
+                except OSError:
+                    pass
+
+
+media_cache = MediaCache(MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_BYTES)
+
+
+def fetch_media(url, params=None):
+    """Return bytes of an immutable server media file, using the disk cache."""
+    if params:
+        url = requests.Request('GET', url, params=params).prepare().url
+    data = media_cache.get(url)
+    if data is None:
+        r = api.get(url, timeout=5)
+        r.raise_for_status()
+        data = r.content
+        media_cache.put(url, data)
+    return data
+
+
+def fetch_image(path, size=None):
+    """Return a PIL image from a server URL or a local path.
+
+    For server URLs ``size`` (an int or a ``(w, h)`` tuple) asks the server
+    for a downscaled variant instead of the original file.
+    """
+    if path.startswith('/'):
+        path = API_HOST + path
+    if not path.startswith('http'):
+        img = Image.open(path)
+        img.load()
+        return img
+    params = None
+    if size:
+        w, h = (size, size) if isinstance(size, int) else size
+        params = {'size': f"{w}x{h}"}
+    return Image.open(io.BytesIO(fetch_media(path, params)))
+
+
+def fetch_thumbnails(paths, size=CATALOG_THUMB_SIZE):
+    """Download thumbnails concurrently; failed entries are ``None``."""
+    def load(path):
+        try:
+            img = fetch_image(path, size)
+            img.thumbnail((size, size))
+            return img
+        except Exception:
+            return None
+
+    if not paths:
+        return []
+    with ThreadPoolExecutor(max_workers=CATALOG_FETCH_WORKERS) as pool:
+        return list(pool.map(load, paths))
+
+
 def load_department_mapping():
     mapping = {}
     if os.path.exists(DEPARTMENTS_FILE):
@@ -129,19 +403,22 @@ def save_department_mapping(mapping):
             f.write(f"{name};{dept}\n")
 
 
+def normalize_environment(env):
+    """Store the absolute image path of a server environment record."""
+    img = env.get("image_url") or env.get("image", "")
+    if img.startswith("/"):
+        img = API_HOST + img
+    env["image"] = img
+    return env
+
+
 def load_environments():
     """Load environments from the API or local file."""
     envs = []
     try:
-        resp = requests.get(f"{API_URL}/environments", timeout=5)
+        resp = api.get(f"{API_URL}/environments", timeout=5)
         resp.raise_for_status()
-        envs = resp.json()
-        # normalize and store absolute image paths
-        for env in envs:
-            img = env.get("image_url") or env.get("image", "")
-            if img.startswith("/"):
-                img = API_HOST + img
-            env["image"] = img
+        envs = [normalize_environment(env) for env in api_json(resp)]
         save_environments(envs)
         return envs
     except Exception:
@@ -170,9 +447,9 @@ def save_environments(envs):
 def load_assignments():
     """Load assignment records from server or local file."""
     try:
-        resp = requests.get(f"{API_URL}/assignments", timeout=5)
+        resp = api.get(f"{API_URL}/assignments", timeout=5)
         resp.raise_for_status()
-        data = resp.json()
+        data = api_json(resp)
         save_assignments(data)
         return data
     except Exception:
@@ -191,46 +468,421 @@ def save_assignments(data):
         json.dump(data, f, ensure_ascii=False, indent=2)
 
 
-def load_processed_warnings():
-    """Load processed warning log lines from file."""
-    if os.path.exists(PROCESSED_WARNINGS_FILE):
-        try:
-            with open(PROCESSED_WARNINGS_FILE, 'r', encoding='utf-8') as f:
-                return set(json.load(f))
-        except Exception:
-            return set()
-    return set()
+def load_zones(env_ids=None):
+    """Return ``{env_id: zones}`` for several environments in one request."""
+    params = {'ids': ','.join(env_ids)} if env_ids else None
+    try:
+        resp = api.get(f"{API_URL}/zones", params=params, timeout=5)
+        resp.raise_for_status()
+        return {eid: item.get('zones', []) for eid, item in api_json(resp).items()}
+    except Exception:
+        return {}
+
+
+def fetch_log_page(**params):
+    """Return a page of the server log (see ``GET /api/logs`` with a cursor)."""
+    resp = api.get(f"{API_URL}/logs", params=params, timeout=5)
+    resp.raise_for_status()
+    return api_json(resp)
+
 
+def load_open_warnings():
+    """Return warnings not yet acknowledged on the server, newest first."""
+    resp = api.get(f"{API_URL}/warnings", timeout=5)
+    resp.raise_for_status()
+    return api_json(resp)
 
-def save_processed_warnings(data):
-    """Save processed warning log lines to file."""
-    with open(PROCESSED_WARNINGS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(sorted(list(data)), f, ensure_ascii=False, indent=2)
+
+def ack_warning(wid):
+    """Acknowledge a warning on the server for every station."""
+    resp = api.post(f"{API_URL}/warnings/{wid}/ack", json={'by': STATION_NAME}, timeout=5)
+    resp.raise_for_status()
+
+
+def load_face_models():
+    """Import face_recognition, loading dlib and its model files; return the module."""
+    import face_recognition
+    return face_recognition
 
 
 def get_employees_version():
     """Return modification timestamp of employee metadata on the server."""
     try:
-        resp = requests.get(f"{API_URL}/employees/version", timeout=5)
+        resp = api.get(f"{API_URL}/employees/version", timeout=5)
         resp.raise_for_status()
-        return float(resp.json().get('version', 0))
+        return float(api_json(resp).get('version', 0))
     except Exception:
         return 0.0
 
 
+class ChangeFeed:
+    """Читает поток изменений ``/api/events`` в фоновом потоке.
+
+    События складываются в ``queue`` парами ``(тип, данные)`` и применяются
+    в потоке Tk. После каждого (пере)подключения в очередь кладётся
+    ``('connected', None)``, чтобы приложение сверило состояние с сервером.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.queue = queue.Queue()
+        self.connected = False
+        self._ready = threading.Event()
+        self.last_id = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def wait_connected(self, timeout):
+        """Wait for the first connection; return whether it was established."""
+        return self._ready.wait(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            headers = {'Accept': 'text/event-stream'}
+            if self.last_id:
+                headers['Last-Event-ID'] = self.last_id
+            try:
+                with requests.get(self.url, headers=headers, stream=True,
+                                  timeout=(5, FEED_READ_TIMEOUT)) as resp:
+                    resp.raise_for_status()
+                    self.connected = True
+                    self.queue.put(('connected', None))
+                    self._ready.set()
+                    self._read(resp)
+            except Exception:
+                pass
+            self.connected = False
+            self._stop.wait(FEED_RETRY_DELAY)
+
+    def _read(self, resp):
+        kind, data = 'message', []
+        for line in resp.iter_lines(decode_unicode=True):
+            if self._stop.is_set():
+                return
+            if line is None or line.startswith(':'):
+                continue
+            if not line:
+                if data:
+                    self.queue.put((kind, json.loads('\n'.join(data))))
+                kind, data = 'message', []
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'event':
+                kind = value
+            elif field == 'data':
+                data.append(value)
+            elif field == 'id':
+                self.last_id = value
+
+
+class Bootstrap:
+    """Загрузка стартовых данных в фоне.
+
+    Задачи ``{имя: функция}`` выполняются параллельно; поток Tk забирает
+    готовые результаты через ``poll`` и применяет их сам, поэтому
+    состояние интерфейса меняется только в его потоке.
+    """
+
+    def __init__(self, tasks, workers=BOOTSTRAP_WORKERS):
+        self.pending = set(tasks)
+        self.done = set()
+        self.failed = set()
+        self.results = queue.Queue()
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bootstrap')
+        for name, fn in tasks.items():
+            pool.submit(self._run, name, fn)
+        pool.shutdown(wait=False)
+
+    def _run(self, name, fn):
+        try:
+            self.results.put((name, fn(), None))
+        except Exception as e:
+            self.results.put((name, None, e))
+
+    def poll(self):
+        """Return ``(name, result, error)`` of tasks finished since the last call."""
+        finished = []
+        while True:
+            try:
+                name, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return finished
+            self.pending.discard(name)
+            (self.failed if error is not None else self.done).add(name)
+            finished.append((name, result, error))
+
+    def ready(self, *names):
+        """True when none of ``names`` is still loading (failed ones count as ready)."""
+        return not self.pending.intersection(names)
+
+
+def widget_inner_size(widget):
+    """Return the size of a widget without its border, or ``None`` before it is drawn."""
+    border = 2 * (int(widget.cget('bd')) + int(widget.cget('highlightthickness')))
+    w, h = widget.winfo_width() - border, widget.winfo_height() - border
+    if w < 10 or h < 10:
+        return None
+    return w, h
+
+
+class TkFrameRenderer:
+    """Вывод кадров BGR в ``tk.Label`` с повторным использованием буферов.
+
+    Кадр сначала уменьшается до размера виджета (но не увеличивается) в
+    заранее выделенный буфер, затем переводится в RGBA во второй буфер, на
+    который смотрит ``Image`` (``frombuffer``). Один ``PhotoImage``
+    создаётся на размер и обновляется через ``paste``. Буферы
+    пересоздаются, только когда меняется размер виджета или кадра.
+
+    Копии на каждый кадр остаются: ``frombuffer`` не даёт «блочного»
+    изображения, поэтому ``paste`` выделяет временный блок и копирует в него
+    кадр, а Tk затем копирует блок в память фото.
+    """
+
+    def __init__(self, label):
+        self.label = label
+        self.size = None
+        self.scaled = None
+        self.rgba = None
+        self.image = None
+        self.photo = None
+
+    def _target_size(self, frame):
+        fh, fw = frame.shape[:2]
+        inner = widget_inner_size(self.label)
+        if inner is None:
+            return fw, fh
+        scale = min(1.0, inner[0] / fw, inner[1] / fh)
+        return max(1, int(fw * scale)), max(1, int(fh * scale))
+
+    def _allocate(self, size):
+        w, h = size
+        self.size = size
+        self.scaled = np.empty((h, w, 3), dtype=np.uint8)
+        self.rgba = np.empty((h, w, 4), dtype=np.uint8)
+        # Image делит память с self.rgba: новый кадр виден в нём без
+        # пересоздания (копию в блок для Tk всё равно делает paste)
+        self.image = Image.frombuffer('RGBA', size, self.rgba, 'raw', 'RGBA', 0, 1)
+        self.photo = ImageTk.PhotoImage('RGBA', size)
+        self.label.imgtk = self.photo
+        self.label.config(image=self.photo)
+
+    def show(self, frame, overlay=None):
+        """Display a BGR frame; ``overlay`` are metric lines drawn on the scaled copy."""
+        size = self._target_size(frame)
+        if size != self.size:
+            self._allocate(size)
+        src = frame
+        if size != (frame.shape[1], frame.shape[0]):
+            cv2.resize(frame, size, dst=self.scaled, interpolation=cv2.INTER_AREA)
+            src = self.scaled
+        if overlay:
+            # исходный кадр ещё нужен распознаванию, рисуем на своей копии
+            if src is frame:
+                np.copyto(self.scaled, frame)
+                src = self.scaled
+            draw_metrics_overlay(src, overlay)
+        cv2.cvtColor(src, cv2.COLOR_BGR2RGBA, dst=self.rgba)
+        self.photo.paste(self.image)
+
+
+class TkVideoSink(ResultSink):
+    """Показывает кадры конвейера в виджете Tk и передаёт тревоги в журнал."""
+
+    stage = 'render'
+
+    def __init__(self, label, send_log, overlay=None):
+        self.renderer = TkFrameRenderer(label)
+        self.send_log = send_log
+        # функция, возвращающая строки метрик для наложения, или None
+        self.overlay = overlay
+
+    def frame(self, result):
+        self.renderer.show(result.frame, self.overlay() if self.overlay else None)
+
+    def alert(self, level, message, event=None):
+        self.send_log(level, message, event)
+
+
+class _WarningRow:
+    __slots__ = ('frame', 'level', 'message', 'window', 'item')
+
+
+class WarningList:
+    """Виртуальный список открытых нарушений на ``tk.Canvas``.
+
+    Строки одинаковой высоты; виджеты создаются только для видимых, и при
+    прокрутке или изменении списка этот небольшой пул лишь получает другой
+    текст. Список меняется по разнице (``add``, ``remove``, ``replace``),
+    а строка, нарушение которой не изменилось, не перенастраивается, так
+    что обновление стоит пропорционально изменениям, а не числу нарушений.
+    """
+
+    def __init__(self, parent, on_process, row_height=WARNING_ROW_HEIGHT):
+        self.on_process = on_process
+        self.row_height = row_height
+        self.items = []  # нарушения, новые сверху
+        self.ids = set()
+        self.rows = []
+        self.width = None
+        self.status = tk.Label(parent, bg='#2c3e50', fg='#e74c3c', anchor='w', justify='left')
+        self.canvas = tk.Canvas(parent, bg='#2c3e50', highlightthickness=0,
+                                yscrollincrement=row_height // 4)
+        self.scroll = ttk.Scrollbar(parent, orient='vertical', command=self._yview)
+        self.canvas.configure(yscrollcommand=self.scroll.set)
+        self.canvas.pack(side='left', fill='both', expand=True)
+        self.scroll.pack(side='right', fill='y')
+        self.canvas.bind('<Configure>', lambda e: self._render())
+        self._bind_wheel(self.canvas)
+
+    def _bind_wheel(self, widget):
+        # Windows и macOS присылают MouseWheel, X11 — кнопки 4 и 5
+        widget.bind('<MouseWheel>', lambda e: self._yview('scroll', -1 if e.delta > 0 else 1, 'units'))
+        widget.bind('<Button-4>', lambda e: self._yview('scroll', -1, 'units'))
+        widget.bind('<Button-5>', lambda e: self._yview('scroll', 1, 'units'))
+
+    def _yview(self, *args):
+        self.canvas.yview(*args)
+        self._render()
+
+    def show_message(self, text):
+        """Show ``text`` above the list, or hide the message if it is empty."""
+        if text:
+            self.status.config(text=text)
+            self.status.pack(side='top', fill='x', before=self.canvas)
+        else:
+            self.status.pack_forget()
+
+    def replace(self, warnings):
+        """Show exactly ``warnings`` (newest first); no-op if nothing changed."""
+        if [w['id'] for w in warnings] == [w['id'] for w in self.items]:
+            return
+        self.items = list(warnings)
+        self.ids = {w['id'] for w in warnings}
+        self._refresh()
+
+    def add(self, warning):
+        if warning['id'] in self.ids:
+            return
+        # при прокрутке вниз видимые строки остаются на месте
+        top = self.canvas.canvasy(0)
+        self.items.insert(0, warning)
+        self.ids.add(warning['id'])
+        self._refresh()
+        if top > 0:
+            self.canvas.yview_moveto((top + self.row_height) / (len(self.items) * self.row_height))
+            self._render()
+
+    def remove(self, wid):
+        if wid not in self.ids:
+            return
+        self.ids.discard(wid)
+        self.items = [w for w in self.items if w['id'] != wid]
+        self._refresh()
+
+    def _refresh(self):
+        total = len(self.items) * self.row_height
+        self.canvas.configure(scrollregion=(0, 0, 1, total))
+        # список стал короче прокрутки — показываем его конец
+        bottom = total - self.canvas.winfo_height()
+        if self.canvas.canvasy(0) > max(0, bottom):
+            self.canvas.yview_moveto(max(0, bottom) / total if total else 0)
+        self._render()
+
+    def _new_row(self):
+        row = _WarningRow()
+        row.item = None
+        row.frame = ttk.Frame(self.canvas, relief='groove', padding=5)
+        row.frame.columnconfigure(0, weight=1)
+        row.level = ttk.Label(row.frame)
+        row.level.grid(row=0, column=0, sticky='w')
+        row.message = ttk.Label(row.frame, justify='left')
+        row.message.grid(row=1, column=0, sticky='nw')
+        ttk.Button(row.frame, text='Обработать', command=lambda: self._process(row)).grid(
+            row=0, column=1, rowspan=2, sticky='e', padx=(5, 0))
+        for widget in (row.frame, row.level, row.message):
+            self._bind_wheel(widget)
+        row.window = self.canvas.create_window(0, -2 * self.row_height, window=row.frame,
+                                               anchor='nw', height=self.row_height - 10)
+        self.rows.append(row)
+        return row
+
+    def _process(self, row):
+        if row.item is not None:
+            self.on_process(row.item['id'])
+
+    def _render(self):
+        """Bind the row pool to the warnings in view."""
+        width = self.canvas.winfo_width()
+        rh = self.row_height
+        first = max(0, int(self.canvas.canvasy(0)) // rh)
+        count = max(0, min(len(self.items) - first, self.canvas.winfo_height() // rh + 2))
+        while len(self.rows) < count:
+            self._new_row()
+        if width != self.width:
+            self.width = width
+            for row in self.rows:
+                self.canvas.itemconfigure(row.window, width=max(1, width - 10))
+                row.message.config(wraplength=max(100, width - 150))
+        for i, row in enumerate(self.rows):
+            if i >= count:
+                if row.item is not None:
+                    row.item = None
+                    self.canvas.coords(row.window, 5, -2 * rh)
+                continue
+            item = self.items[first + i]
+            if row.item is not item:
+                row.item = item
+                row.level.config(text=f"Тип: {item['level']}   {item.get('timestamp', '')[:19]}")
+                row.message.config(text=item['message'])
+            self.canvas.coords(row.window, 5, (first + i) * rh + 5)
 
 
 class FaceRecognitionApp:
     def __init__(self):
-        self.known_face_encodings, self.known_face_names, self.employee_depts = load_known_faces()
-        self.emp_version = get_employees_version()
+        # модели грузятся и прогреваются в фоне, экземпляры общие; состояние
+        # и ошибки загрузки — в ModelManager. face_recognition (dlib и файлы
+        # его моделей) грузится сразу: без него не работают киоск и охрана
+        self.models = ModelManager()
+        self.models.register('face_recognition', load_face_models)
+        self.models.load('face_recognition')
+        self.models.register('yolo', lambda: load_detector(
+            YOLO_WEIGHTS, DETECTOR_BACKEND, DETECTOR_INPUT_SIZE, DETECTOR_THREADS))
+        if YOLO_PRELOAD == 'startup':
+            self.models.load('yolo')
+        # изменения на сервере приходят потоком вместо периодического опроса.
+        # Он подключается первым, а данные читаются уже после подключения:
+        # всё, что изменится позже, придёт событиями, и сверять состояние при
+        # первом подключении не нужно (если дождаться его не удалось — нужно)
+        self.feed = ChangeFeed(f"{API_URL}/events")
+        self.feed.start()
+        self.bootstrap_after_feed = True
+        after_feed = self._after_feed
+        # данные сервера приходят из фоновой загрузки (_poll_bootstrap)
+        self.bootstrap = Bootstrap({
+            # версия до списка: изменение между запросами подхватит синхронизация
+            'faces': after_feed(lambda: (get_employees_version(), load_known_faces())),
+            'environments': after_feed(load_environments),
+            'assignments': after_feed(load_assignments),
+            'zones': after_feed(load_zones),
+            'models': lambda: self._wait_model('face_recognition'),
+        })
+        self.pending_role = None
+        self.known_face_encodings, self.known_face_names, self.employee_depts = [], [], {}
+        self.emp_version = None
         self.last_emp_check = time.time()
-        self.environments = load_environments()
-        self.assignments = load_assignments()
+        self.environments = []
+        self.assignments = []
         self.env_selected_image = ''
         self.process_frame = True
         self.cap = None
-        self.yolo = None
         self.start_time = None
         self.fail_count = 0
         self.total_failed_identifications = 0
@@ -238,16 +890,34 @@ class FaceRecognitionApp:
         # Зоны и параметры для интерфейса службы безопасности
         self.security_zones = []
         self.security_env_id = None
-        self.last_zone_warning = 0
-        self.last_fire_warning = 0
-        self.last_overcrowd_log = 0
-        # Accumulators for security events
-        self.face_mismatch_times = []  # timestamps of mismatched faces
-        self.unauth_access_times = {}  # name -> list of timestamps
-        self.last_face_mismatch_log = 0
-        self.last_unauth_log = {}
-        # already handled warnings so they are not shown again
-        self.processed_warnings = load_processed_warnings()
+        # зоны всех помещений; актуальны, пока подключён поток изменений
+        self.zones_by_env = {}
+        # задержки стадий и FPS камер; наложение на видео переключается F3
+        self.security_metrics = PipelineMetrics('security')
+        self.kiosk_metrics = PipelineMetrics('kiosk')
+        # лицо на киоске отслеживается между кадрами, имя выбирается голосованием
+        self.kiosk = KioskRecognizer(self.kiosk_metrics, KIOSK_RECOGNITION)
+        self.show_metrics = False
+        self.metrics_exporter = MetricsExporter(
+            [self.security_metrics, self.kiosk_metrics], METRICS_FILE,
+            METRICS_PORT or None, METRICS_EXPORT_INTERVAL).start()
+        # обработка кадров и тревоги службы безопасности
+        # стадии идут со своей частотой и урезаются, чтобы держать FPS
+        self.security = SecurityPipeline(self._send_log, timer=self.security_metrics,
+                                         scheduler=FrameScheduler(SECURITY_FPS),
+                                         profile=SECURITY_RECOGNITION)
+        self.security_runner = None
+        # общий журнал: курсоры первой и следующей за последней строкой в
+        # виджете и смещения показанных строк (по ним сдвигается начало)
+        self.log_start = self.log_end = None
+        self.log_offsets = deque()
+        self.log_has_older = False
+        self.log_limit = LOG_VIEW_MAX_LINES
+        # перезагрузки с сервера и кодирование лиц по событиям идут по очереди
+        # в отдельном потоке, результаты применяются в потоке Tk (_drain_feed)
+        self.sync_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sync')
+        self.sync_results = queue.Queue()
+        self.log_loading = self.log_reload = False
 
         self.root = tk.Tk()
         self.root.title("Система распознавания лиц")
@@ -281,14 +951,242 @@ class FaceRecognitionApp:
 
         self._show_frame(self.frame_role)
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.root.bind('<F3>', self._toggle_metrics_overlay)
+        self.diagnostics = Diagnostics(DIAGNOSTICS_DIR,
+                                       lambda s, fn: self.root.after(int(s * 1000), fn))
+        self.root.bind('<Control-Shift-P>', lambda e: self.diagnostics.toggle_profile())
+        self.root.bind('<Control-Shift-S>', lambda e: self.diagnostics.sample())
+        self.root.bind('<Control-Shift-M>', lambda e: self.diagnostics.memory_snapshot())
+        self.diagnostics.install_signals(lambda fn: self.root.after(0, fn))
+        self._poll_bootstrap()
         self.root.mainloop()
 
+    def _after_feed(self, load):
+        """Wrap a startup load so it reads the server once the feed is connected."""
+        def run():
+            if not self.feed.wait_connected(FEED_CONNECT_WAIT):
+                self.bootstrap_after_feed = False
+            return load()
+        return run
+
+    def _wait_model(self, name):
+        """Wait until ``self.models`` has loaded ``name``; raise if loading failed."""
+        if self.models.wait(name) is None:
+            raise RuntimeError(self.models.errors.get(name))
+
+    def _poll_bootstrap(self):
+        """Apply finished startup loads; apply queued feed events once all are done."""
+        for name, result, error in self.bootstrap.poll():
+            if error is not None and name != 'models':
+                # ошибку загрузки моделей уже записал ModelManager
+                logging.error(f'Не удалось загрузить {BOOTSTRAP_LABELS[name]}: {error}')
+                # сверка при подключении загрузит данные заново
+                self.bootstrap_after_feed = False
+            elif name == 'faces':
+                self.emp_version, (self.known_face_encodings, self.known_face_names,
+                                   self.employee_depts) = result
+            elif name == 'environments':
+                self.environments = result
+            elif name == 'assignments':
+                self.assignments = result
+            elif name == 'zones':
+                self.zones_by_env = result
+        if self.pending_role and self.bootstrap.ready(*ROLE_REQUIREMENTS[self.pending_role[0]]):
+            self._enter_role(*self.pending_role)
+        self._update_bootstrap_status()
+        if self.bootstrap.pending:
+            self.root.after(BOOTSTRAP_POLL_MS, self._poll_bootstrap)
+        else:
+            # события, пришедшие за время загрузки, ждали в очереди
+            self._drain_feed()
+
+    def _update_bootstrap_status(self):
+        b = self.bootstrap
+        text = ''
+        if b.pending:
+            loading = ', '.join(BOOTSTRAP_LABELS[n] for n in BOOTSTRAP_LABELS if n in b.pending)
+            text = f'Загрузка: {loading}…'
+            if self.pending_role:
+                text = f'Роль откроется после загрузки. {text}'
+        elif b.failed:
+            failed = ', '.join(BOOTSTRAP_LABELS[n] for n in BOOTSTRAP_LABELS if n in b.failed)
+            text = f'Не удалось загрузить: {failed}'
+        self.role_canvas.itemconfigure(self.role_status, text=text)
+
+    def _enter_role(self, role, frame):
+        """Open a role screen, or remember it until its data is loaded."""
+        if role == 'security':
+            self.models.load('yolo')
+        if self.bootstrap.ready(*ROLE_REQUIREMENTS[role]):
+            self.pending_role = None
+            self._show_frame(frame)
+        else:
+            self.pending_role = (role, frame)
+            self._update_bootstrap_status()
+
+    def _in_background(self, work, apply, failed=None):
+        """Run ``work()`` on the sync thread, then ``apply(result)`` on the Tk thread.
+
+        ``failed(error)`` is called instead when ``work`` raises.
+        """
+        def run():
+            try:
+                self.sync_results.put((apply, work(), None, failed))
+            except Exception as e:
+                self.sync_results.put((apply, None, e, failed))
+        self.sync_pool.submit(run)
+
     def _sync_employees(self):
-        """Reload employee data if it changed on the server."""
-        ver = get_employees_version()
-        if ver and ver != self.emp_version:
-            self.emp_version = ver
-            self.known_face_encodings, self.known_face_names, self.employee_depts = load_known_faces()
+        """Reload employee data in the background if it changed on the server."""
+        def work():
+            ver = get_employees_version()
+            if not ver or ver == self.emp_version:
+                return None
+            return ver, load_known_faces()
+        self._in_background(work, self._apply_employees)
+
+    def _reload_faces(self):
+        """Reload the face gallery in the background unconditionally."""
+        self._in_background(lambda: (get_employees_version(), load_known_faces()),
+                            self._apply_employees)
+
+    def _apply_employees(self, result):
+        if result is not None:
+            self.emp_version, (self.known_face_encodings, self.known_face_names,
+                               self.employee_depts) = result
+
+    def _drain_feed(self):
+        """Применяет изменения, пришедшие из потока сервера, и результаты фоновых загрузок."""
+        while True:
+            try:
+                apply, result, error, failed = self.sync_results.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                if error is None:
+                    apply(result)
+                elif failed is not None:
+                    failed(error)
+                else:
+                    print("Не удалось загрузить данные с сервера:", error)
+            except Exception as e:
+                print("Не удалось применить данные с сервера:", e)
+        while True:
+            try:
+                kind, data = self.feed.queue.get_nowait()
+            except queue.Empty:
+                break
+            handler = getattr(self, f'_on_feed_{kind}', None)
+            if handler is None:
+                continue
+            try:
+                handler(data)
+            except Exception as e:
+                # не через logging: сообщение снова пришло бы из потока
+                print("Не удалось применить изменение:", kind, e)
+        self.feed_task = self.root.after(FEED_DRAIN_MS, self._drain_feed)
+
+    def _on_feed_connected(self, _):
+        """Сверка состояния после (пере)подключения к потоку (в фоне)."""
+        if self.bootstrap_after_feed:
+            # первое подключение: стартовая загрузка прочитала данные после него
+            self.bootstrap_after_feed = False
+            return
+        self._sync_employees()
+        self._in_background(lambda: (load_environments(), load_assignments(), load_zones()),
+                            self._apply_reconnect)
+        if hasattr(self, 'log_refresh_task'):
+            self._load_warning_logs()
+            self._load_all_logs()
+
+    def _apply_reconnect(self, result):
+        self.environments, self.assignments, self.zones_by_env = result
+        if self.frame_manager.winfo_ismapped():
+            self._render_assignments()
+        if self.security_env_id:
+            self.security_zones = list(self.zones_by_env.get(self.security_env_id, []))
+
+    def _forget_employee(self, name):
+        while name in self.known_face_names:
+            idx = self.known_face_names.index(name)
+            del self.known_face_names[idx]
+            del self.known_face_encodings[idx]
+        self.employee_depts.pop(name, None)
+
+    def _on_feed_employees(self, data):
+        # фото скачивается и кодируется в фоне; изменения применяются по порядку
+        emp = data['employee'] if data.get('op') == 'add' else None
+        self._in_background(lambda: encode_employee(emp) if emp else None,
+                            lambda enc: self._apply_employee_change(data, enc))
+
+    def _apply_employee_change(self, data, enc):
+        if data.get('op') == 'add':
+            emp = data['employee']
+            self._forget_employee(emp['name'])
+            if enc is not None:
+                self.known_face_encodings.append(enc)
+                self.known_face_names.append(emp['name'])
+                self.employee_depts[emp['name']] = emp['dept']
+        elif data.get('op') == 'delete':
+            self._forget_employee(data['name'])
+        save_department_mapping(self.employee_depts)
+        self.emp_version = data.get('version', self.emp_version)
+
+    def _on_feed_environments(self, data):
+        if data.get('op') == 'add':
+            env = normalize_environment(data['environment'])
+            self.environments = [e for e in self.environments if e.get('id') != env['id']]
+            self.environments.append(env)
+        elif data.get('op') == 'delete':
+            self.environments = [e for e in self.environments if e.get('id') != data['id']]
+        save_environments(self.environments)
+
+    def _on_feed_assignments(self, data):
+        # count — длина списка на сервере после изменения; если локальная
+        # копия с ним не сходится (изменение уже учтено или что-то
+        # пропущено) или count нет, список перечитывается в фоне
+        count = data.get('count')
+        if count is None:
+            self._in_background(load_assignments, self._apply_assignments)
+            return
+        index = data.get('index')
+        if data.get('op') == 'add' and len(self.assignments) == count - 1:
+            self.assignments.append(data['record'])
+        elif (data.get('op') == 'delete' and len(self.assignments) == count + 1
+              and isinstance(index, int) and 0 <= index < len(self.assignments)):
+            self.assignments.pop(index)
+        elif len(self.assignments) != count:
+            self._in_background(load_assignments, self._apply_assignments)
+            return
+        self._apply_assignments(self.assignments)
+
+    def _apply_assignments(self, assignments):
+        self.assignments = assignments
+        save_assignments(assignments)
+        if self.frame_manager.winfo_ismapped():
+            self._render_assignments()
+
+    def _on_feed_zones(self, data):
+        self.zones_by_env[data.get('env_id')] = data.get('zones', [])
+        if data.get('env_id') == self.security_env_id:
+            self.security_zones = data.get('zones', [])
+
+    def _on_feed_log(self, data):
+        if not hasattr(self, 'log_refresh_task'):
+            return
+        start = data.get('start')
+        if start is not None and start == self.log_end:
+            self._append_log_lines([data['line']], [start], data['end'])
+        elif start is None or (self.log_end is not None and start > self.log_end):
+            # строки между курсором и событием пропущены — дочитываем
+            self._load_all_logs()
+        if data.get('warning'):
+            self.warnings.add(data['warning'])
+
+    def _on_feed_warnings(self, data):
+        # нарушение обработано на этом или другом рабочем месте
+        if data.get('op') == 'ack':
+            self.warnings.remove(data['id'])
 
     def _setup_style(self):
         s = self.style
@@ -428,6 +1326,10 @@ class FaceRecognitionApp:
         tf = tkfont.Font(family='Helvetica', size=36, weight='bold')
         canvas_bg.create_text(w / 2, h * 0.2, text='Выберите роль', font=tf, fill='white')
         bf = tkfont.Font(family='Helvetica', size=24)
+        # ход фоновой загрузки данных
+        self.role_canvas = canvas_bg
+        self.role_status = canvas_bg.create_text(w / 2, h * 0.8, text='', fill='white',
+                                                 font=tkfont.Font(family='Helvetica', size=16))
 
         def btn(text, cmd, y, c1, c2):
             c = tk.Canvas(f, width=300, height=60, highlightthickness=0)
@@ -441,11 +1343,12 @@ class FaceRecognitionApp:
             c.place(relx=0.5, rely=y, anchor='center')
 
         green1, green2 = (46, 204, 113), (39, 174, 96)
-        btn('Сотрудник', lambda: self._show_frame(self.frame_employee), 0.30, green1, green2)
-        btn('Администратор', lambda: self._show_frame(self.frame_admin_choice), 0.40, green1,
+        btn('Сотрудник', lambda: self._enter_role('employee', self.frame_employee), 0.30, green1, green2)
+        btn('Администратор', lambda: self._enter_role('admin', self.frame_admin_choice), 0.40, green1,
             green2)
-        btn('Руководитель', lambda: self._show_frame(self.frame_manager), 0.5, green1, green2)
-        btn('Служба безопасности', lambda: self._show_frame(self.frame_security), 0.6, (52, 152, 219), (41, 128, 185))
+        btn('Руководитель', lambda: self._enter_role('manager', self.frame_manager), 0.5, green1, green2)
+        btn('Служба безопасности', lambda: self._enter_role('security', self.frame_security), 0.6,
+            (52, 152, 219), (41, 128, 185))
         btn('Завершить', self.on_closing, 0.7, (231, 76, 60), (192, 57, 43))
 
     def _build_employee_frame(self):
@@ -482,6 +1385,7 @@ class FaceRecognitionApp:
         self.cam_box = ttk.LabelFrame(f, text="Камера", style='Cam.TLabelframe')
         self.video_label = tk.Label(self.cam_box, bg='#34495e', bd=2, relief='sunken')
         self.video_label.pack(expand=True, fill='both')
+        self.kiosk_renderer = TkFrameRenderer(self.video_label)
         self.status_label = ttk.Label(f, text="Камера не запущена", style='Status.TLabel')
 
     def _build_admin_choice_frame(self):
@@ -641,6 +1545,8 @@ class FaceRecognitionApp:
         left = tk.Frame(paned, bg='#2c3e50', height=SEC_PANE_MAX_HEIGHT)
         left.pack_propagate(False)
         ttk.Label(left, text='Камера', style='Title.TLabel').pack(pady=5)
+        self.detector_status = tk.Label(left, text='', bg='#2c3e50', fg='white')
+        self.detector_status.pack()
         self.security_video = tk.Label(left, bg='#34495e', bd=2, relief='sunken')
         self.security_video.pack(expand=True, fill='both', padx=10, pady=10)
         paned.add(left, minsize=200)
@@ -651,24 +1557,16 @@ class FaceRecognitionApp:
         ttk.Label(right, text='Нарушения', style='Title.TLabel').pack(pady=5)
         warn_container = tk.Frame(right, bg='#2c3e50')
         warn_container.pack(expand=True, fill='both', padx=10, pady=10)
-        self.warning_canvas = tk.Canvas(warn_container, bg='#2c3e50', highlightthickness=0)
-        self.warning_scroll = ttk.Scrollbar(warn_container, orient='vertical',
-                                            command=self.warning_canvas.yview)
-        self.warning_inner = ttk.Frame(self.warning_canvas)
-        self.warning_inner.bind(
-            '<Configure>',
-            lambda e: self.warning_canvas.configure(scrollregion=self.warning_canvas.bbox("all"))
-        )
-        self.warning_canvas.create_window((0, 0), window=self.warning_inner, anchor='nw')
-        self.warning_canvas.configure(yscrollcommand=self.warning_scroll.set)
-        self.warning_canvas.pack(side='left', fill='both', expand=True)
-        self.warning_scroll.pack(side='right', fill='y')
+        self.warnings = WarningList(warn_container, self._process_warning)
         paned.add(right, minsize=200)
         self.sec_right = right
 
         bottom = tk.Frame(outer, bg='#2c3e50', height=SEC_LOGS_HEIGHT)
         bottom.pack_propagate(False)
-        ttk.Label(bottom, text='Общие логи', style='Title.TLabel').pack(pady=5)
+        self.log_title = ttk.Label(bottom, text='Общие логи', style='Title.TLabel')
+        self.log_title.pack(pady=5)
+        self.log_older_btn = ttk.Button(bottom, text='Ранние записи', command=self._load_older_logs)
+        self.log_older_btn.place(relx=1.0, x=-10, y=5, anchor='ne')
         self.general_log_text = scrolledtext.ScrolledText(bottom, height=10, font=("Courier", 12))
         self.general_log_text.pack(expand=True, fill='both')
         self.sec_bottom = bottom
@@ -794,22 +1692,119 @@ class FaceRecognitionApp:
         tk.Button(btn_frame, text='Сохранить зоны', command=self._save_zones).pack(pady=5)
 
     def _load_all_logs(self):
-        try:
-            resp = requests.get(f"{API_URL}/logs", params={'order': 'desc'}, timeout=5)
-            resp.raise_for_status()
-            lines = resp.json()
-            data = "\n".join(lines)
-        except Exception as e:
-            data = f"Не удалось получить логи: {e}"
+        """Append log lines written since the last load; the first load shows the tail.
 
+        The page is fetched in the background; a request made while one is
+        loading is repeated after it.
+        """
+        if self.log_loading:
+            self.log_reload = True
+            return
+        self.log_loading = True
+        log_end = self.log_end
+
+        def work():
+            if log_end is not None:
+                page = fetch_log_page(after=log_end, limit=LOG_VIEW_MAX_LINES)
+                # пропущено больше, чем помещается в окне, — начинаем с конца
+                if not page['more']:
+                    return page, False
+            return fetch_log_page(limit=LOG_PAGE_LINES), True
+
+        def failed(e):
+            self._log_loaded()
+            self.log_title.config(text=f'Общие логи (не удалось получить: {e})')
+
+        self._in_background(work, self._show_log_page, failed)
+
+    def _show_log_page(self, result):
+        page, reset = result
+        self._log_loaded()
+        if not hasattr(self, 'log_refresh_task'):
+            return
+        if reset:
+            self._clear_log_view()
+            self.log_start, self.log_has_older = page['start'], page['more']
+        elif page['start'] != self.log_end:
+            # пока страница грузилась, журнал сменил экран или дополнился из ленты
+            self._load_all_logs()
+            return
+        self.log_title.config(text='Общие логи')
+        self._append_log_lines(page['lines'], page['offsets'], page['end'])
+        self._update_older_button()
+
+    def _log_loaded(self):
+        self.log_loading = False
+        if self.log_reload:
+            self.log_reload = False
+            self._load_all_logs()
+
+    def _clear_log_view(self):
         self.general_log_text.delete('1.0', tk.END)
-        self.general_log_text.insert('1.0', data)
+        self.log_offsets.clear()
+        self.log_limit = LOG_VIEW_MAX_LINES
 
-    def _schedule_log_refresh(self):
-        """Периодически обновляет логи на экране службы безопасности."""
-        self._load_warning_logs()
-        self._load_all_logs()
-        self.log_refresh_task = self.root.after(5000, self._schedule_log_refresh)
+    def _append_log_lines(self, lines, offsets, end):
+        """Add lines at the end, dropping the oldest ones above the limit.
+
+        ``offsets`` are the server cursors of the lines and ``end`` the one
+        after them.
+        """
+        self.log_end = end
+        if not lines:
+            return
+        t = self.general_log_text
+        # у нижнего края журнал следует за новыми строками, иначе вид не сдвигается
+        follow = t.yview()[1] >= 1.0
+        top = int(t.index('@0,0').split('.')[0])
+        t.insert(tk.END, ''.join(line + '\n' for line in lines))
+        self.log_offsets.extend(offsets)
+        excess = len(self.log_offsets) - self.log_limit
+        if excess > 0:
+            t.delete('1.0', f'{excess + 1}.0')
+            for _ in range(excess):
+                self.log_offsets.popleft()
+            self.log_start = self.log_offsets[0]
+            self.log_has_older = True
+            self._update_older_button()
+        if follow:
+            t.see(tk.END)
+        elif excess > 0:
+            t.yview(f'{max(1, top - excess)}.0')
+
+    def _load_older_logs(self):
+        """Page in earlier log lines above the ones shown."""
+        if self.log_start is None or not self.log_has_older:
+            return
+        try:
+            page = fetch_log_page(before=self.log_start, limit=LOG_PAGE_LINES)
+        except Exception as e:
+            self.log_title.config(text=f'Общие логи (не удалось получить: {e})')
+            return
+        lines = page['lines']
+        t = self.general_log_text
+        top = int(t.index('@0,0').split('.')[0])
+        t.insert('1.0', ''.join(line + '\n' for line in lines))
+        self.log_offsets.extendleft(reversed(page['offsets']))
+        self.log_start, self.log_has_older = page['start'], page['more']
+        # запрошенная история не вытесняется новыми строками до перезагрузки
+        self.log_limit = max(self.log_limit, len(self.log_offsets))
+        t.yview(f'{top + len(lines)}.0')
+        self._update_older_button()
+
+    def _update_older_button(self):
+        self.log_older_btn.state(['!disabled'] if self.log_has_older else ['disabled'])
+
+    def _schedule_log_refresh(self, force=True):
+        """Обновляет логи на экране службы безопасности.
+
+        Пока поток изменений подключён, новые записи приходят из него, а
+        опрос сервера раз в 5 секунд остаётся запасным вариантом.
+        """
+        if force or not self.feed.connected:
+            self._load_warning_logs()
+            self._load_all_logs()
+        self.log_refresh_task = self.root.after(5000, self._schedule_log_refresh, False)
 
     def _cancel_log_refresh(self):
         """Останавливает периодическое обновление логов."""
@@ -818,48 +1813,22 @@ class FaceRecognitionApp:
             del self.log_refresh_task
 
     def _load_warning_logs(self):
-        try:
-            resp = requests.get(f"{API_URL}/logs", params={'order': 'desc'}, timeout=5)
-            resp.raise_for_status()
-            lines = [l for l in resp.json() if 'WARNING' in l]
-        except Exception as e:
-            lines = [f"Не удалось получить логи: {e}"]
+        # список остаётся прежним, пока сервер недоступен
+        self._in_background(load_open_warnings, self._show_open_warnings,
+                            lambda e: self.warnings.show_message(f"Не удалось получить нарушения: {e}"))
 
-        for child in self.warning_inner.winfo_children():
-            child.destroy()
+    def _show_open_warnings(self, warnings):
+        self.warnings.show_message('')
+        self.warnings.replace(warnings)
 
-        for line in lines:
-            if line in self.processed_warnings:
-                continue
-            level, msg = self._parse_warning_line(line)
-            self._add_warning_block(line, level, msg)
-
-    def _parse_warning_line(self, line: str):
-        """Return log level and message for a warning log line."""
-        idx = line.find('WARNING:')
-        if idx != -1:
-            msg = line[idx + len('WARNING:'):].strip()
-            if 'WARNING:' in msg:
-                msg = msg.split('WARNING:', 1)[1].strip()
-            return 'WARNING', msg
-        parts = line.split(':', 1)
-        if len(parts) == 2:
-            return parts[0].strip().split()[-1], parts[1].strip()
-        return 'WARNING', line
-
-    def _add_warning_block(self, line: str, level: str, msg: str):
-        block = ttk.Frame(self.warning_inner, relief='groove', padding=5)
-        ttk.Label(block, text=f'Тип: {level}').pack(anchor='w')
-        ttk.Label(block, text=msg, wraplength=350, justify='left').pack(anchor='w')
-        ttk.Button(block, text='Обработать',
-                   command=lambda l=line, b=block: self._process_warning(l, b)).pack(anchor='e', pady=(5, 0))
-        block.pack(fill='x', padx=5, pady=5)
-
-    def _process_warning(self, line: str, block):
-        """Mark a warning as processed and remove its block from view."""
-        self.processed_warnings.add(line)
-        save_processed_warnings(self.processed_warnings)
-        block.destroy()
+    def _process_warning(self, wid):
+        """Acknowledge a warning on the server and remove it from the list."""
+        try:
+            ack_warning(wid)
+        except Exception as e:
+            messagebox.showerror("Ошибка сервера", f"Не удалось отметить нарушение: {e}")
+            return
+        self.warnings.remove(wid)
 
     def _show_frame(self, target):
         self._cancel_log_refresh()
@@ -929,7 +1898,7 @@ class FaceRecognitionApp:
         data = {'name': name, 'location': loc}
 
         # 2) POST на /api/environments
-        resp = requests.post(f"{API_URL}/environments", data=data, files=files)
+        resp = api.post(f"{API_URL}/environments", data=data, files=files)
         if resp.status_code == 201:
             # 3) Сервер вернул JSON с данными нового помещения
             self.env_status.config(text="Помещение добавлено на сервер")
@@ -956,18 +1925,17 @@ class FaceRecognitionApp:
             messagebox.showwarning("Ошибка", "Введите ФИО, подразделение и файл")
             return
 
-        # Готовим multipart/form-data запрос
-        files = {'photo': open(self.selected_file, 'rb')}
+        # Готовим multipart/form-data запрос (сервер сам уменьшит фото)
         data = {'name': name, 'dept': dept}
 
         # POST /api/employees
-        resp = requests.post(f"{API_URL}/employees", data=data, files=files)
+        with open(self.selected_file, 'rb') as photo:
+            resp = api.post(f"{API_URL}/employees", data=data, files={'photo': photo})
         if resp.status_code == 201:
             # Успешно добавили на сервер
             self.admin_status.config(text=f"Сотрудник {name} добавлен на сервер")
-            # Обновляем локальные списки лиц и отображение
-            self.known_face_encodings, self.known_face_names, self.employee_depts = load_known_faces()
-            self.emp_version = get_employees_version()
+            # Обновляем локальные списки лиц (в фоне) и отображение
+            self._reload_faces()
             self._refresh_catalog()
             # Сбрасываем поля формы
             self.name_entry.delete(0, 'end')
@@ -981,23 +1949,16 @@ class FaceRecognitionApp:
             w.destroy()
         # always try to get fresh data from the server
         self.environments = load_environments()
-        for env in self.environments:
+        thumbs = fetch_thumbnails([env.get('image', '') for env in self.environments])
+        for env, img in zip(self.environments, thumbs):
             rec = ttk.Frame(self.env_inner, padding=5)
             rec.pack(fill='x', pady=5)
-            try:
-                img_path = env.get('image', '')
-                if img_path.startswith('http'):
-                    r = requests.get(img_path, timeout=5)
-                    r.raise_for_status()
-                    img = Image.open(io.BytesIO(r.content))
-                else:
-                    img = Image.open(img_path)
-                img.thumbnail((64, 64))
+            if img is not None:
                 ph = ImageTk.PhotoImage(img)
                 lbl = tk.Label(rec, image=ph)
                 lbl.image = ph
                 lbl.pack(side='left', padx=5)
-            except Exception:
+            else:
                 ttk.Label(rec, text="[Нет изображения]").pack(side='left', padx=5)
             ttk.Label(rec, text=f"{env['name']} ({env['location']})", style='Status.TLabel').pack(side='left', padx=10)
             ttk.Button(rec, text="Удалить", command=lambda e=env: self._delete_environment(e)).pack(side='right', padx=5)
@@ -1006,7 +1967,7 @@ class FaceRecognitionApp:
         if env in self.environments:
             if env.get('id'):
                 try:
-                    requests.delete(f"{API_URL}/environments/{env['id']}")
+                    api.delete(f"{API_URL}/environments/{env['id']}")
                 except Exception as e:
                     logging.error("Не удалось удалить помещение на сервере: %s", e)
             self.environments.remove(env)
@@ -1019,32 +1980,29 @@ class FaceRecognitionApp:
         for w in self.inner.winfo_children():
             w.destroy()
         try:
-            resp = requests.get(f"{API_URL}/employees", timeout=5)
+            resp = api.get(f"{API_URL}/employees", timeout=5)
             resp.raise_for_status()
-            employees = resp.json()
+            employees = api_json(resp)
         except Exception as e:
             ttk.Label(self.inner, text=f"Ошибка загрузки данных: {e}").pack()
             return
-        for emp in employees:
+        thumbs = fetch_thumbnails([emp['photo_url'] for emp in employees])
+        for emp, img in zip(employees, thumbs):
             rec = ttk.Frame(self.inner, padding=5)
             rec.pack(fill='x', pady=5)
-            try:
-                img_resp = requests.get(API_HOST + emp['photo_url'], timeout=5)
-                img_resp.raise_for_status()
-                img = Image.open(io.BytesIO(img_resp.content))
-                img.thumbnail((64, 64))
+            if img is not None:
                 ph = ImageTk.PhotoImage(img)
                 lbl = tk.Label(rec, image=ph)
                 lbl.image = ph
                 lbl.pack(side='left', padx=5)
-            except Exception:
+            else:
                 ttk.Label(rec, text='[Нет изображения]').pack(side='left', padx=5)
             ttk.Label(rec, text=f"{emp['name']} ({emp['dept']})", style='Status.TLabel').pack(side='left', padx=10)
             ttk.Button(rec, text='Удалить', command=lambda n=emp['name']: self._delete_employee(n)).pack(side='right', padx=5)
 
     def _delete_employee(self, name):
         try:
-            requests.delete(f"{API_URL}/employees/{name}", timeout=5)
+            api.delete(f"{API_URL}/employees/{name}", timeout=5)
         except Exception as e:
             logging.error("Не удалось удалить сотрудника: %s", e)
             messagebox.showerror("Ошибка", f"Не удалось удалить: {e}")
@@ -1052,8 +2010,7 @@ class FaceRecognitionApp:
         if name in self.employee_depts:
             del self.employee_depts[name]
             save_department_mapping(self.employee_depts)
-        self.known_face_encodings, self.known_face_names, self.employee_depts = load_known_faces()
-        self.emp_version = get_employees_version()
+        self._reload_faces()
         self._refresh_catalog()
 
     # --- Руководитель ---
@@ -1089,12 +2046,7 @@ class FaceRecognitionApp:
             return
         img_path = env.get('image', '')
         try:
-            if img_path.startswith('http'):
-                r = requests.get(img_path, timeout=5)
-                r.raise_for_status()
-                img = Image.open(io.BytesIO(r.content))
-            else:
-                img = Image.open(img_path)
+            img = fetch_image(img_path, ENV_IMAGE_SIZE)
             img = img.convert('RGB')
             img = img.resize(ENV_IMAGE_SIZE, Image.LANCZOS)
             self.zone_image = ImageTk.PhotoImage(img)
@@ -1103,14 +2055,7 @@ class FaceRecognitionApp:
             self.zone_canvas.create_image(ENV_IMAGE_SIZE[0]//2, 0, anchor='n', image=self.zone_image)
             self.zone_canvas.create_rectangle(0, 0, ENV_IMAGE_SIZE[0], ENV_IMAGE_SIZE[1], outline='white', tags='image_border')
             # загрузить зоны
-            self.zones = []
-            if env.get('id'):
-                try:
-                    resp = requests.get(f"{API_URL}/environments/{env['id']}/zones", timeout=5)
-                    if resp.status_code == 200:
-                        self.zones = resp.json()
-                except Exception:
-                    pass
+            self.zones = self._fetch_zones(env['id']) if env.get('id') else []
             processed = []
             for z in self.zones:
                 if isinstance(z, dict):
@@ -1140,33 +2085,6 @@ class FaceRecognitionApp:
     def _create_handle(self, x, y):
         return self.zone_canvas.create_oval(x-4, y-4, x+4, y+4, fill='yellow', outline='black', tags='handle')
 
-    def _point_in_poly(self, x, y, pts):
-        inside = False
-        n = len(pts)
-        px, py = pts[0]
-        for i in range(1, n+1):
-            nx, ny = pts[i % n]
-            if ((py > y) != (ny > y)) and (x < (nx-px)*(y-py)/(ny-py+1e-9)+px):
-                inside = not inside
-            px, py = nx, ny
-        return inside
-
-    def _detect_fire(self, frame):
-        """Return list of bounding boxes where fire-like colors are detected."""
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-        lower = np.array([0, 150, 150])
-        upper = np.array([35, 255, 255])
-        mask = cv2.inRange(hsv, lower, upper)
-        mask = cv2.erode(mask, None, iterations=2)
-        mask = cv2.dilate(mask, None, iterations=2)
-        cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        boxes = []
-        for c in cnts:
-            if cv2.contourArea(c) > 1000:
-                x, y, w, h = cv2.boundingRect(c)
-                boxes.append((x, y, x + w, y + h))
-        return boxes
-
     def _find_near_handle(self, x, y, radius=15):
         """Return (zone, index) of handle close to (x,y) or None."""
         if self.creating_poly:
@@ -1198,7 +2116,7 @@ class FaceRecognitionApp:
             return
         if self.zone_tool == 'drag':
             for z in reversed(self.zones):
-                if self._point_in_poly(event.x, event.y, z['points']):
+                if point_in_poly(event.x, event.y, z['points']):
                     self.dragging_zone = (z, event.x, event.y)
                     return
             return
@@ -1287,7 +2205,7 @@ class FaceRecognitionApp:
                         self.creating_poly = None
                     return
         for z in list(self.zones):
-            if self._point_in_poly(x, y, z['points']):
+            if point_in_poly(x, y, z['points']):
                 for h in z['handles']:
                     self.zone_canvas.delete(h)
                 self.zone_canvas.delete(z['shape'])
@@ -1330,7 +2248,7 @@ class FaceRecognitionApp:
             return
         try:
             data = [{'type': z['type'], 'points': z['points']} for z in self.zones]
-            requests.post(f"{API_URL}/environments/{env['id']}/zones", json={'zones': data}, timeout=5)
+            api.post(f"{API_URL}/environments/{env['id']}/zones", json={'zones': data}, timeout=5)
             messagebox.showinfo('Сохранено', 'Зоны сохранены')
         except Exception as e:
             messagebox.showerror('Ошибка', str(e))
@@ -1348,7 +2266,7 @@ class FaceRecognitionApp:
             'exit_until': self.exit_entry.get()
         }
         try:
-            requests.post(f"{API_URL}/assignments", json=rec, timeout=5)
+            api.post(f"{API_URL}/assignments", json=rec, timeout=5)
         except Exception:
             pass
         self.assignments.append(rec)
@@ -1359,6 +2277,10 @@ class FaceRecognitionApp:
     def _refresh_assignments(self):
         """Reload assignments and populate the listbox."""
         self.assignments = load_assignments()
+        self._render_assignments()
+
+    def _render_assignments(self):
+        """Populate the listbox from ``self.assignments``."""
         if not hasattr(self, 'assign_list'):
             return
         self.assign_list.delete(0, 'end')
@@ -1378,7 +2300,7 @@ class FaceRecognitionApp:
             return
         real_idx = self.assign_map[sel[0]]
         try:
-            requests.delete(f"{API_URL}/assignments/{real_idx}", timeout=5)
+            api.delete(f"{API_URL}/assignments/{real_idx}", timeout=5)
         except Exception:
             pass
         if 0 <= real_idx < len(self.assignments):
@@ -1386,54 +2308,21 @@ class FaceRecognitionApp:
             save_assignments(self.assignments)
         self._refresh_assignments()
 
-    def _has_permission(self, name, env_name):
-        """Check if employee has valid permission for selected environment."""
+    def _env_id(self, env_name):
+        """Return the ID of the environment named ``env_name`` or ``None``."""
         env = next((e for e in self.environments if e['name'] == env_name), None)
-        if not env:
-            return False
-        now = datetime.datetime.now()
-        for rec in self.assignments:
-            if rec.get('employee') != name:
-                continue
-            if rec.get('environment_id') != env.get('id'):
-                continue
-            try:
-                start = datetime.datetime.fromisoformat(rec.get('enter_until')) if rec.get('enter_until') else None
-                end = datetime.datetime.fromisoformat(rec.get('exit_until')) if rec.get('exit_until') else None
-            except Exception:
-                start = end = None
-            if start and now < start:
-                continue
-            if end and now > end:
-                continue
-            return True
-        return False
+        return env.get('id') if env else None
 
-    def _has_permission_env_id(self, name, env_id):
-        """Check permission using environment ID."""
-        env = next((e for e in self.environments if e.get('id') == env_id), None)
-        if not env:
+    def _has_permission(self, name, env_name):
+        """Check if employee has valid permission for selected environment."""
+        env_id = self._env_id(env_name)
+        if not env_id:
             return False
-        return self._has_permission(name, env['name'])
+        return has_permission(self.assignments, name, env_id)
 
     def _count_valid_permissions_env_id(self, env_id):
         """Return number of employees with a valid assignment for env_id."""
-        now = datetime.datetime.now()
-        count = 0
-        for rec in self.assignments:
-            if rec.get('environment_id') != env_id:
-                continue
-            try:
-                start = datetime.datetime.fromisoformat(rec.get('enter_until')) if rec.get('enter_until') else None
-                end = datetime.datetime.fromisoformat(rec.get('exit_until')) if rec.get('exit_until') else None
-            except Exception:
-                start = end = None
-            if start and now < start:
-                continue
-            if end and now > end:
-                continue
-            count += 1
-        return count
+        return count_valid_permissions(self.assignments, env_id)
 
     def _start_employee_cam(self):
         if self.cap is None:
@@ -1443,12 +2332,16 @@ class FaceRecognitionApp:
             self.cap = cv2.VideoCapture(1)
             self.start_time = time.time()
             self.fail_count = 0
+            self.kiosk.reset()
             self.attempts_label.config(text="Неудачные попытки: 0")
             self.status_label.config(text="Камера запущена. Ожидание распознавания...")
             self._update_frame()
 
     def _stop_camera(self):
         if self.cap: self.cap.release(); self.cap = None
+        if self.security_runner:
+            self.security_runner.close()
+            self.security_runner = None
 
     def _show_access_granted(self):
         self._stop_camera();
@@ -1476,37 +2369,44 @@ class FaceRecognitionApp:
 
     def _update_frame(self):
         if self.cap is None: return
-        if time.time() - self.last_emp_check > 10:
+        if not self.feed.connected and time.time() - self.last_emp_check > 10:
             self.last_emp_check = time.time()
             self._sync_employees()
-        ret, frame = self.cap.read();
+        m = self.kiosk_metrics
+        with m.stage('capture'):
+            ret, frame = self.cap.read();
         if not ret: self.root.after(30, self._update_frame); return
-        img = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
-        self.video_label.imgtk = img;
-        self.video_label.config(image=img)
+        with m.stage('render'):
+            self.kiosk_renderer.show(frame, m.overlay_lines() if self.show_metrics else None)
+        m.tick()
         if time.time() - self.start_time < 1: self.root.after(30, self._update_frame); return
-        if self.process_frame:
-            small = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25);
-            rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
-            locs = face_recognition.face_locations(rgb);
-            encs = face_recognition.face_encodings(rgb, locs)
-            recognized = False
-            for enc in encs:
-                matches = face_recognition.compare_faces(self.known_face_encodings, enc)
-                dists = face_recognition.face_distance(self.known_face_encodings, enc)
-                if len(dists) > 0 and matches[np.argmin(dists)]: recognized = True; name = self.known_face_names[
-                    np.argmin(dists)]; break
-            if recognized:
+        # поиск по всему кадру — через кадр, отслеживание лица — на каждом
+        if self.process_frame or self.kiosk.tracking:
+            with m.stage('frame'):
+                name = self.kiosk.process(frame, self.known_face_encodings, self.known_face_names)
+            if name:
                 dept = self.employee_depts.get(name, 'Неизвестно')
-                if self._has_permission(name, self.current_env):
-                    self._send_log('INFO', f"Доступ разрешен для {name} ({dept}) в {self.current_env}")
+                with m.stage('permission'):
+                    allowed = self._has_permission(name, self.current_env)
+                with m.stage('log_ship'):
+                    event = make_event(ACCESS_GRANTED if allowed else ACCESS_DENIED,
+                                       env_id=self._env_id(self.current_env),
+                                       env_name=self.current_env, employee=name, dept=dept,
+                                       confidence=self.kiosk.confidence)
+                    if allowed:
+                        self._send_log('INFO', f"Доступ разрешен для {name} ({dept}) в {self.current_env}", event)
+                    else:
+                        self._send_log('WARNING', f"Доступ запрещен для {name} ({dept}) в {self.current_env}", event)
+                if allowed:
                     self._show_access_granted()
                 else:
-                    self._send_log('WARNING', f"Доступ запрещен для {name} ({dept}) в {self.current_env}")
                     self._show_access_denied()
                 return
             if time.time() - self.start_time >= self.auth_timeout:
-                self._send_log('WARNING', f"Неуспешная попытка аутентификации {self.fail_count + 1}")
+                with m.stage('log_ship'):
+                    self._send_log('WARNING', f"Неуспешная попытка аутентификации {self.fail_count + 1}",
+                                   make_event(AUTH_FAILED, env_id=self._env_id(self.current_env),
+                                              env_name=self.current_env, attempt=self.fail_count + 1))
                 self.fail_count += 1
                 self.total_failed_identifications += 1
                 self.attempts_label.config(text=f"Неудачные попытки: {self.fail_count}")
@@ -1520,27 +2420,34 @@ class FaceRecognitionApp:
         self.root.after(30, self._update_frame)
 
     def _start_security_cam(self):
-        if self.cap is None:
-            self.cap = cv2.VideoCapture(0)
-            if self.yolo is None:
-                try:
-                    self.yolo = YOLO(YOLO_WEIGHTS)
-                except Exception as e:
-                    logging.error(f'Не удалось загрузить модель YOLO: {e}')
+        if self.security_runner is None:
+            # пока YOLO грузится, конвейер считает людей по лицам
+            self.security.detector = self.models.get('yolo')
             # выбираем первое доступное помещение для мониторинга
             if self.environments:
                 env = self.environments[0]
                 self.security_env_id = env.get('id')
                 if self.security_env_id:
-                    try:
-                        resp = requests.get(f"{API_URL}/environments/{self.security_env_id}/zones", timeout=5)
-                        if resp.status_code == 200:
-                            self.security_zones = resp.json()
-                    except Exception:
-                        self.security_zones = []
-            self.last_fire_warning = 0
+                    self.security_zones = self._fetch_zones(self.security_env_id)
+            self.security.alerts.last_fire_warning = 0
+            self.security_runner = SecurityRunner(
+                self.security, VideoSource(0),
+                [TkVideoSink(self.security_video, self._send_log, self._security_overlay)],
+                size=self._security_view_size)
             self._update_security_frame()
 
+    def _fetch_zones(self, env_id):
+        """Return zones of an environment from the server or an empty list."""
+        if self.feed.connected and env_id in self.zones_by_env:
+            return list(self.zones_by_env[env_id])
+        try:
+            resp = api.get(f"{API_URL}/environments/{env_id}/zones", timeout=5)
+            if resp.status_code == 200:
+                return api_json(resp)
+        except Exception:
+            pass
+        return []
+
     def _limit_security_heights(self, event=None):
         if not hasattr(self, 'sec_outer'):
             return
@@ -1559,144 +2466,45 @@ class FaceRecognitionApp:
         self.root.minsize(cur_w, min_h)
         self.root.maxsize(cur_w, max_h)
 
+    def _toggle_metrics_overlay(self, event=None):
+        self.show_metrics = not self.show_metrics
+
+    def _security_overlay(self):
+        return self.security_metrics.overlay_lines() if self.show_metrics else None
+
+    def _security_view_size(self):
+        # кадр готовится сразу в размер изображения, без второго масштабирования
+        return widget_inner_size(self.security_video) or SECURITY_DEFAULT_SIZE
+
     def _update_security_frame(self):
-        if self.cap is None:
-            return
-        ret, frame = self.cap.read()
-        if not ret:
-            self.root.after(30, self._update_security_frame)
+        if self.security_runner is None:
             return
-        w = self.security_video.winfo_width()
-        h = self.security_video.winfo_height()
-        if w < 10 or h < 10:
-            w, h = 600, 500
-        frame = cv2.resize(frame, (w, h))
-        fire_boxes = self._detect_fire(frame)
-        people_count = 0
-        # Наложение зон из интерфейса руководителя и поиск людей
-        if self.security_zones:
-            scale_x = w / ENV_IMAGE_SIZE[0]
-            scale_y = h / ENV_IMAGE_SIZE[1]
-            scaled_zones = []
-            for z in self.security_zones:
-                pts = [(int(p[0] * scale_x), int(p[1] * scale_y)) for p in z.get('points', [])]
-                if pts:
-                    scaled_zones.append(pts)
-                    cv2.polylines(frame, [np.array(pts, dtype=np.int32)], True, (0, 0, 255), 2)
-
-            if self.yolo:
-                # disable verbose output from the YOLO model to avoid console
-                # spam like "0: 224x640 1 person" for each frame
-                results = self.yolo(frame, verbose=False)[0]
-                person_boxes = []
-                for box in results.boxes:
-                    cls = int(box.cls[0])
-                    if results.names[cls] != 'person':
-                        continue
-                    person_boxes.append(box)
-                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                    cx = (x1 + x2) // 2
-                    cy = (y1 + y2) // 2
-                    inside = False
-                    for pts in scaled_zones:
-                        if self._point_in_poly(cx, cy, pts):
-                            inside = True
-                            if time.time() - self.last_zone_warning > 15:
-                                self.last_zone_warning = time.time()
-                                self._send_log('WARNING', 'Обнаружен человек в запретной зоне')
-                            break
-                    color = (0, 0, 255) if inside else (0, 255, 0)
-                    cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-                people_count = len(person_boxes)
-            else:
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                locs = face_recognition.face_locations(rgb)
-                people_count = len(locs)
-                for top, right, bottom, left in locs:
-                    cx = (left + right) // 2
-                    cy = (top + bottom) // 2
-                    for pts in scaled_zones:
-                        if self._point_in_poly(cx, cy, pts):
-                            if time.time() - self.last_zone_warning > 5:
-                                self.last_zone_warning = time.time()
-                                self._send_log('WARNING', 'Обнаружен человек в запретной зоне')
-                            break
-        else:
-            if self.yolo:
-                results = self.yolo(frame, verbose=False)[0]
-                people_count = sum(1 for box in results.boxes if results.names[int(box.cls[0])] == 'person')
-            else:
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                locs = face_recognition.face_locations(rgb)
-                people_count = len(locs)
-        # Распознавание лиц и сверка с допусками
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        locs = face_recognition.face_locations(rgb)
-        encs = face_recognition.face_encodings(rgb, locs)
-        for (top, right, bottom, left), enc in zip(locs, encs):
-            matches = face_recognition.compare_faces(self.known_face_encodings, enc)
-            name = 'Неизвестный'
-            if len(matches) > 0:
-                dists = face_recognition.face_distance(self.known_face_encodings, enc)
-                best = np.argmin(dists)
-                if matches[best]:
-                    name = self.known_face_names[best]
-            authorized = False
-            if name != 'Неизвестный' and self.security_env_id:
-                authorized = self._has_permission_env_id(name, self.security_env_id)
-            color = (0, 255, 0) if authorized else (0, 0, 255)
-            cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
-            text_size, _ = cv2.getTextSize(name, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
-            tx, ty = left, max(0, top - text_size[1] - 6)
-            cv2.rectangle(frame, (tx - 1, ty - 1),
-                          (tx + text_size[0] + 2, ty + text_size[1] + 2),
-                          color, -1)
-            cv2.putText(frame, name, (tx, ty + text_size[1]),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
-            if name != 'Неизвестный' and not authorized:
-                now = time.time()
-                lst = self.unauth_access_times.setdefault(name, [])
-                lst.append(now)
-                self.unauth_access_times[name] = [t for t in lst if now - t <= 30]
-                if len(self.unauth_access_times[name]) >= 3 and now - self.last_unauth_log.get(name, 0) > 30:
-                    self.last_unauth_log[name] = now
-                    env = next((e for e in self.environments if e.get('id') == self.security_env_id), {})
-                    env_name = env.get('name', 'Неизвестное помещение')
-                    self._send_log('WARNING', f'Несанкционированный доступ в {env_name}: {name}')
-            elif name == 'Неизвестный' and not authorized:
-                now = time.time()
-                self.face_mismatch_times.append(now)
-                self.face_mismatch_times = [t for t in self.face_mismatch_times if now - t <= 30]
-                if len(self.face_mismatch_times) > 7 and now - self.last_face_mismatch_log > 30:
-                    self.last_face_mismatch_log = now
-                    env = next((e for e in self.environments if e.get('id') == self.security_env_id), {})
-                    env_name = env.get('name', 'Неизвестное помещение')
-                    self._send_log('WARNING', f'Несовпадение лица в {env_name}: {name} не имеет доступа')
-
-        if self.security_env_id:
-            allowed = self._count_valid_permissions_env_id(self.security_env_id)
-            if people_count > allowed and time.time() - self.last_overcrowd_log > 30:
-                self.last_overcrowd_log = time.time()
-                env = next((e for e in self.environments if e.get('id') == self.security_env_id), {})
-                env_name = env.get('name', 'Неизвестное помещение')
-                self._send_log('WARNING', f'Превышено количество людей в {env_name}: разрешено {allowed}, обнаружено {people_count}')
-        for x1, y1, x2, y2 in fire_boxes:
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 165, 255), 2)
-            cv2.putText(frame, 'FIRE', (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
-                        0.6, (0, 165, 255), 2)
-        if fire_boxes and time.time() - self.last_fire_warning > 5:
-            self.last_fire_warning = time.time()
-            self._send_log('WARNING', 'Обнаружено возгорание')
-        img = ImageTk.PhotoImage(image=Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
-        self.security_video.imgtk = img
-        self.security_video.config(image=img)
-        self.root.after(30, self._update_security_frame)
-    def _send_log(self, level: str, msg: str):
-        """Логирует событие и отправляет его на сервер."""
+        # актуальное состояние приложения для конвейера
+        p = self.security
+        if p.detector is None:
+            p.detector = self.models.get('yolo')
+        status = DETECTOR_STATUS[self.models.state('yolo')]
+        if self.detector_status.cget('text') != status:
+            self.detector_status.config(text=status)
+        p.known_encodings, p.known_names = self.known_face_encodings, self.known_face_names
+        p.assignments = self.assignments
+        p.zones = self.security_zones
+        p.env_id = self.security_env_id
+        env = next((e for e in self.environments if e.get('id') == self.security_env_id), {})
+        p.env_name = env.get('name', UNKNOWN_ENV_NAME)
+        result = self.security_runner.step()
+        delay = self.security_runner.delay() if result is not None else 0.03
+        self.root.after(max(1, int(delay * 1000)), self._update_security_frame)
+
+    def _send_log(self, level: str, msg: str, event=None):
+        """Логирует событие и отправляет его на сервер; ``event`` — поля события журнала."""
         lvl = logging.INFO if level.upper() == 'INFO' else logging.WARNING
-        logging.log(lvl, msg)
+        logging.log(lvl, msg, extra={'event': event})
 
     def on_closing(self):
+        self.feed.stop()
+        self.sync_pool.shutdown(wait=False, cancel_futures=True)
+        self.metrics_exporter.stop()
         self._cancel_log_refresh()
         self._stop_camera();
         self.root.destroy()
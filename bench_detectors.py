@@ -0,0 +1,130 @@
+"""Сравнение бэкендов детектора людей на одних и тех же кадрах.
+
+Кадры читаются один раз в память, затем каждая конфигурация (модель,
+бэкенд, размер входа, число потоков) прогревается и проходит по ним.
+Выводится время на кадр, FPS, среднее число найденных людей и
+согласие с первой конфигурацией (доля её рамок, найденных с IoU >= 0.5)::
+
+    python bench_detectors.py --source hall.mp4 --frames 200 \\
+        --model ultralytics:yolov8n.pt --model onnxruntime:yolov8n.onnx \\
+        --model opencv:yolov8n.onnx --input-size 640 416 --threads 4
+"""
+import argparse
+import json
+import time
+
+from detectors import BACKENDS, DEFAULT_INPUT_SIZE, load_detector
+from metrics import percentile
+from pipeline import open_source
+
+MATCH_IOU = 0.5
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0, x2 - x1) * max(0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def agreement(reference, boxes):
+    """Share of reference boxes matched by ``boxes`` with IoU >= MATCH_IOU."""
+    total = matched = 0
+    for ref, got in zip(reference, boxes):
+        free = list(got)
+        for r in ref:
+            total += 1
+            best = max(free, key=lambda b: iou(r, b), default=None)
+            if best is not None and iou(r, best) >= MATCH_IOU:
+                matched += 1
+                free.remove(best)
+    return matched / total if total else 1.0
+
+
+def parse_model(spec):
+    backend, sep, path = spec.partition(':')
+    if sep and backend in BACKENDS + ('auto',):
+        return backend, path
+    return 'auto', spec
+
+
+def read_frames(source, limit):
+    src = open_source(source)
+    frames = []
+    try:
+        while len(frames) < limit:
+            frame = src.read()
+            if frame is None:
+                if src.live:
+                    continue
+                break
+            frames.append(frame)
+    finally:
+        src.close()
+    return frames
+
+
+def run(detector, frames):
+    latencies, results = [], []
+    for frame in frames:
+        t0 = time.perf_counter()
+        results.append(detector.detect(frame))
+        latencies.append(time.perf_counter() - t0)
+    return latencies, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', required=True, help='video file, camera index or image directory')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--model', action='append', required=True,
+                        help='[backend:]path, backend one of ' + ', '.join(BACKENDS))
+    parser.add_argument('--input-size', type=int, nargs='+', default=[DEFAULT_INPUT_SIZE])
+    parser.add_argument('--threads', type=int, nargs='+', default=[0], help='0 means library default')
+    parser.add_argument('--save', help='write results as JSON')
+    args = parser.parse_args(argv)
+
+    frames = read_frames(args.source, args.frames)
+    if not frames:
+        parser.error('no frames read from --source')
+    print(f"frames: {len(frames)} of {frames[0].shape[1]}x{frames[0].shape[0]}")
+
+    header = f"{'detector':<46}{'mean ms':>9}{'p50 ms':>9}{'p95 ms':>9}{'FPS':>8}{'people':>8}{'agree':>7}"
+    print(header)
+    print('-' * len(header))
+    rows, reference = [], None
+    for spec in args.model:
+        backend, path = parse_model(spec)
+        for size in args.input_size:
+            for threads in args.threads:
+                try:
+                    detector = load_detector(path, backend, size, threads or None)
+                except Exception as e:
+                    print(f"{spec} @{size}: {e}")
+                    continue
+                latencies, results = run(detector, frames)
+                if reference is None:
+                    reference = results
+                lat = sorted(latencies)
+                row = {
+                    'detector': repr(detector),
+                    'mean_ms': sum(lat) / len(lat) * 1000,
+                    'p50_ms': percentile(lat, 50) * 1000,
+                    'p95_ms': percentile(lat, 95) * 1000,
+                    'fps': len(lat) / sum(lat) if sum(lat) else 0.0,
+                    'people': sum(len(r) for r in results) / len(results),
+                    'agreement': agreement(reference, results),
+                }
+                rows.append(row)
+                print(f"{row['detector']:<46}{row['mean_ms']:>9.1f}{row['p50_ms']:>9.1f}"
+                      f"{row['p95_ms']:>9.1f}{row['fps']:>8.1f}{row['people']:>8.2f}"
+                      f"{row['agreement'] * 100:>6.0f}%")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'frames': len(frames), 'results': rows},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""Офлайн бенчмарк конвейера распознавания и службы безопасности.
+
+Прогоняет видеофайл или каталог кадров через ту же обработку, что и
+интерфейс (``pipeline.py``): огонь, YOLO, поиск и кодирование лиц,
+сравнение с галереей, проверка допусков, тревоги и отрисовка. Галерея
+синтетическая заданного размера; с ``--gallery-dir`` к ней добавляются
+настоящие фото (имя сотрудника — имя файла).
+
+Выводит время каждой стадии, сквозной FPS и память::
+
+    python bench_pipeline.py --source hall.mp4 --gallery 1000 --yolo yolov5s.pt
+    python bench_pipeline.py --source frames/ --mode kiosk --frames 200
+
+С ``--labels`` (JSON ``{"номер кадра": ["имя", ...]}``, кадры нумеруются
+с нуля, неразмеченные не оцениваются) выводится и точность распознавания,
+так что профиль-кандидат, добавленный в ``PROFILES``, можно сравнить с
+текущим (``--profile``) по скорости и качеству::
+
+    for p in default candidate; do
+        python bench_pipeline.py --source hall.mp4 --gallery-dir staff/ \
+            --labels hall.json --profile $p --save $p.json
+    done
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+import cv2
+import numpy as np
+import face_recognition
+
+from detectors import BACKENDS, DEFAULT_INPUT_SIZE, load_detector
+from metrics import percentile
+from pipeline import (ENROLLMENT_PROFILE, IMAGE_EXTS, KIOSK_PROFILE, PROFILES,
+                      SECURITY_DEFAULT_SIZE, SECURITY_PROFILE, UNKNOWN_NAME,
+                      FrameScheduler, KioskRecognizer, SecurityPipeline, StageTimer,
+                      encode_photo, open_source)
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_ENV_ID = 'bench-env'
+# Зона по умолчанию (в координатах ENV_IMAGE_SIZE) — центр помещения
+DEFAULT_ZONES = [{'type': 'rect', 'points': [[250, 150], [550, 150], [550, 450], [250, 450]]}]
+
+
+def build_gallery(size, gallery_dir=None, seed=0, profile=PROFILES[ENROLLMENT_PROFILE]):
+    """Return ``(encodings, names)``: real photos first, then random encodings."""
+    encodings, names = [], []
+    if gallery_dir:
+        for name in sorted(os.listdir(gallery_dir)):
+            if not name.lower().endswith(IMAGE_EXTS):
+                continue
+            img = face_recognition.load_image_file(os.path.join(gallery_dir, name))
+            enc = encode_photo(img, profile)
+            if enc is not None:
+                encodings.append(enc)
+                names.append(os.path.splitext(name)[0])
+    rng = np.random.default_rng(seed)
+    # разброс компонент близок к настоящим 128-мерным дескрипторам dlib
+    for i in range(max(0, size - len(encodings))):
+        encodings.append(rng.normal(0.0, 0.09, 128))
+        names.append(f'Сотрудник {i}')
+    return encodings, names
+
+
+def build_assignments(names, share=0.5):
+    return [{'employee': n, 'environment_id': BENCH_ENV_ID,
+             'enter_until': '', 'exit_until': ''}
+            for n in names[:int(len(names) * share)]]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт килобайты, macOS — байты
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+class Accuracy:
+    """Сверка распознанных имён с разметкой ``--labels``.
+
+    В режиме службы безопасности каждый размеченный кадр сравнивается
+    с набором имён на нём. На киоске оцениваются решения: верное, если
+    имя есть в разметке кадра; полнота — доля размеченных людей, для
+    которых было верное решение.
+    """
+
+    def __init__(self, labels):
+        self.labels = {int(k): set(v) for k, v in labels.items()}
+        self.tp = self.fp = self.fn = 0
+        self.decided = set()
+
+    def frame(self, index, names):
+        truth = self.labels.get(index)
+        if truth is None:
+            return
+        names = set(names) - {UNKNOWN_NAME}
+        self.tp += len(names & truth)
+        self.fp += len(names - truth)
+        self.fn += len(truth - names)
+
+    def decision(self, index, name):
+        truth = self.labels.get(index)
+        if truth is None:
+            return
+        if name in truth:
+            self.tp += 1
+            self.decided.add(name)
+        else:
+            self.fp += 1
+
+    def result(self, mode):
+        if mode == 'kiosk':
+            people = set().union(*self.labels.values())
+            recall = len(self.decided) / len(people) if people else 0.0
+        else:
+            recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        return {'precision': precision, 'recall': recall, 'correct': self.tp, 'wrong': self.fp}
+
+
+def report(timer, frames, wall, alerts, mem):
+    total = sum(timer.samples['frame'])
+    print(f"frames: {frames}   processing FPS: {frames / total if total else 0:.2f}"
+          f"   wall FPS (with decode): {frames / wall if wall else 0:.2f}")
+    header = f"{'stage':<14}{'calls':>8}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'ms/frame':>10}{'share':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = {}
+    for name, samples in sorted(timer.samples.items(), key=lambda kv: -sum(kv[1])):
+        s = sorted(samples)
+        rows[name] = {
+            'calls': len(s),
+            'mean_ms': sum(s) / len(s) * 1000,
+            'p50_ms': percentile(s, 50) * 1000,
+            'p95_ms': percentile(s, 95) * 1000,
+            'ms_per_frame': sum(s) / frames * 1000 if frames else 0.0,
+        }
+        # доля от времени кадра; decode и сам frame в неё не входят
+        share = f"{sum(s) / total * 100:.0f}%" if total and name not in ('frame', 'decode') else '-'
+        r = rows[name]
+        print(f"{name:<14}{r['calls']:>8}{r['mean_ms']:>10.2f}{r['p50_ms']:>10.2f}"
+              f"{r['p95_ms']:>10.2f}{r['ms_per_frame']:>10.2f}{share:>8}")
+    for key, value in mem.items():
+        if value is not None:
+            print(f"{key}: {value:.1f} MB")
+    if alerts:
+        print('alerts:')
+        for msg, n in alerts.most_common():
+            print(f"  {n:>5}  {msg}")
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', required=True, help='video file, camera index or image directory')
+    parser.add_argument('--mode', choices=('security', 'kiosk'), default='security')
+    parser.add_argument('--frames', type=int, help='stop after this many frames')
+    parser.add_argument('--gallery', type=int, default=200, help='number of known faces')
+    parser.add_argument('--gallery-dir', help='directory with real employee photos')
+    parser.add_argument('--size', default='x'.join(map(str, SECURITY_DEFAULT_SIZE)),
+                        help='security view size, WxH')
+    parser.add_argument('--zones', help='zones JSON as stored by the server (default: one central zone)')
+    parser.add_argument('--yolo', help='person detector model (.pt or .onnx); without it people are counted by faces')
+    parser.add_argument('--detector-backend', default='auto', choices=('auto',) + BACKENDS)
+    parser.add_argument('--detector-size', type=int, default=DEFAULT_INPUT_SIZE)
+    parser.add_argument('--detector-threads', type=int)
+    parser.add_argument('--profile', choices=tuple(PROFILES),
+                        help=f'recognition profile for frames (default: {KIOSK_PROFILE} for kiosk, '
+                             f'{SECURITY_PROFILE} for security)')
+    parser.add_argument('--enroll-profile', default=ENROLLMENT_PROFILE, choices=tuple(PROFILES),
+                        help='recognition profile for --gallery-dir photos')
+    parser.add_argument('--labels', help='JSON {"frame index": [names]} to measure accuracy')
+    parser.add_argument('--target-fps', type=float,
+                        help='use the stage scheduler and face tracking with this target FPS')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report Python heap peak')
+    parser.add_argument('--save', help='write per-stage results as JSON')
+    args = parser.parse_args(argv)
+
+    encodings, names = build_gallery(args.gallery, args.gallery_dir,
+                                     profile=PROFILES[args.enroll_profile])
+    zones = DEFAULT_ZONES
+    if args.zones:
+        with open(args.zones, 'r', encoding='utf-8') as f:
+            zones = json.load(f)
+    # прогрев, чтобы загрузка ядер не попала в замеры первого кадра
+    detector = None
+    if args.yolo:
+        detector = load_detector(args.yolo, args.detector_backend, args.detector_size,
+                                 args.detector_threads)
+
+    alerts = Counter()
+    timer = StageTimer()
+    scheduler = FrameScheduler(args.target_fps) if args.target_fps else None
+    profile_name = args.profile or (KIOSK_PROFILE if args.mode == 'kiosk' else SECURITY_PROFILE)
+    profile = PROFILES[profile_name]
+    pipeline = SecurityPipeline(lambda level, msg, event: alerts.update([msg]), detector, timer, scheduler,
+                                profile)
+    pipeline.known_encodings, pipeline.known_names = encodings, names
+    pipeline.assignments = build_assignments(names)
+    pipeline.zones = zones
+    pipeline.env_id = BENCH_ENV_ID
+    pipeline.env_name = 'Бенчмарк'
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    kiosk = KioskRecognizer(timer, profile)
+    accuracy = None
+    if args.labels:
+        with open(args.labels, 'r', encoding='utf-8') as f:
+            accuracy = Accuracy(json.load(f))
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    frames = 0
+    t_wall = time.perf_counter()
+    source = open_source(args.source)
+    while not args.frames or frames < args.frames:
+        with timer.stage('decode'):
+            frame = source.read()
+        if frame is None:
+            if source.live:
+                continue
+            break
+        t0 = time.perf_counter()
+        with timer.stage('frame'):
+            if args.mode == 'security':
+                result = pipeline.process(frame, size)
+            else:
+                name = kiosk.process(frame, encodings, names)
+                if name:
+                    alerts.update([f'recognized {name}'])
+        if accuracy is not None:
+            if args.mode == 'security':
+                accuracy.frame(frames, [face[1] for face in result.faces])
+            elif name:
+                accuracy.decision(frames, name)
+        if scheduler is not None:
+            scheduler.end_frame(time.perf_counter() - t0)
+        frames += 1
+    wall = time.perf_counter() - t_wall
+    source.close()
+
+    mem = {'peak RSS': peak_rss_mb()}
+    if args.tracemalloc:
+        mem['Python heap peak'] = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    rows = report(timer, frames, wall, alerts, mem)
+    print(f"profile: {profile_name} {tuple(PROFILES[profile_name])}")
+    scores = None
+    if accuracy is not None:
+        scores = accuracy.result(args.mode)
+        print(f"accuracy: precision {scores['precision'] * 100:.1f}%   recall {scores['recall'] * 100:.1f}%"
+              f"   correct {scores['correct']}   wrong {scores['wrong']}")
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'frames': frames, 'wall_s': wall,
+                       'stages': rows, 'memory_mb': mem, 'accuracy': scores},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+"""Нагрузочный тест REST API ``server.py``.
+
+Генерирует синтетические данные (сотрудники с фото, помещения, допуски,
+зоны, большой журнал и открытые нарушения) во временном каталоге и гоняет каждый маршрут с
+заданной параллельностью. По умолчанию запросы идут через тестовый клиент
+Flask в этом же процессе; с ``--url`` — к уже запущенному серверу (тогда
+он должен работать на данных, созданных ``--data-dir``).
+
+Для каждого маршрута выводятся пропускная способность, p50/p95/p99
+задержки и средний размер ответа. Результат можно сохранить в JSON
+(``--save``) и сравнить с ним следующий прогон (``--baseline``)::
+
+    python bench_server.py --log-lines 50000 --concurrency 8 --save base.json
+    python bench_server.py --log-lines 50000 --concurrency 8 --baseline base.json
+"""
+import argparse
+import datetime
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from metrics import percentile
+
+# (тип события, уровень, текст) для синтетического журнала
+EVENTS = (
+    ('access_granted', 'INFO', 'Доступ разрешен для {name} в {env}'),
+    ('access_denied', 'WARNING', 'Доступ запрещен для {name} в {env}'),
+    ('zone_intrusion', 'WARNING', 'Обнаружен человек в запретной зоне'),
+    ('unauthorized_access', 'WARNING', 'Несанкционированный доступ в {env}: {name}'),
+    ('overcrowding', 'WARNING', 'Превышено количество людей в {env}: разрешено 2, обнаружено 5'),
+    ('fire', 'WARNING', 'Обнаружено возгорание'),
+)
+
+
+def _jpeg(size, color):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='JPEG', quality=90)
+    return buf.getvalue()
+
+
+def generate_data(data_dir, n_employees, n_envs, n_assignments, n_log_lines,
+                  photo_size, n_open_warnings=0, seed=0):
+    """Write a synthetic server data directory and return its ids."""
+    rnd = random.Random(seed)
+    emp_dir = os.path.join(data_dir, 'employees')
+    env_dir = os.path.join(data_dir, 'environments')
+    zone_dir = os.path.join(data_dir, 'zones')
+    for d in (emp_dir, env_dir, zone_dir):
+        os.makedirs(d, exist_ok=True)
+
+    employees, photos = [], []
+    for i in range(n_employees):
+        fn = f"{uuid.uuid4().hex}.jpg"
+        with open(os.path.join(emp_dir, fn), 'wb') as f:
+            f.write(_jpeg(photo_size, (rnd.randrange(256), 80, 120)))
+        employees.append({'name': f'Сотрудник {i}', 'dept': 'Отдел внедрения НСИ',
+                          'photo_url': f'/api/employees/photo/{fn}'})
+        photos.append(fn)
+
+    envs, images = [], []
+    for i in range(n_envs):
+        eid = uuid.uuid4().hex
+        fn = f"{eid}.jpg"
+        with open(os.path.join(env_dir, fn), 'wb') as f:
+            f.write(_jpeg((800, 600), (60, rnd.randrange(256), 90)))
+        envs.append({'id': eid, 'name': f'Помещение {i}', 'location': f'Корпус {i % 5}',
+                     'image_url': f'/api/environments/image/{fn}'})
+        images.append(fn)
+        zones = [{'type': 'rect', 'points': [[x, 50], [x + 100, 50], [x + 100, 200], [x, 200]]}
+                 for x in range(0, 600, 150)]
+        with open(os.path.join(zone_dir, f'{eid}.json'), 'w', encoding='utf-8') as f:
+            json.dump(zones, f, ensure_ascii=False)
+
+    assignments = []
+    for _ in range(n_assignments):
+        assignments.append({
+            'employee': rnd.choice(employees)['name'] if employees else '',
+            'environment_id': rnd.choice(envs)['id'] if envs else '',
+            'enter_until': '2026-01-01T08:00',
+            'exit_until': '2026-12-31T20:00',
+        })
+
+    for name, data in (('employees.json', employees), ('environments.json', envs),
+                       ('assignments.json', assignments)):
+        with open(os.path.join(data_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    # журнал заканчивается сейчас, чтобы события попали в сводки /api/stats
+    start = datetime.datetime.utcnow().replace(microsecond=0) - datetime.timedelta(seconds=n_log_lines * 7)
+    warnings = []
+    with open(os.path.join(data_dir, 'events.jsonl'), 'w', encoding='utf-8') as f:
+        for i in range(n_log_lines):
+            event_type, level, template = rnd.choice(EVENTS)
+            name = rnd.choice(employees)['name'] if employees else '?'
+            env = rnd.choice(envs) if envs else {'id': '', 'name': '?'}
+            event = {'timestamp': (start + datetime.timedelta(seconds=i * 7)).isoformat(),
+                     'level': level, 'type': event_type,
+                     'message': template.format(name=name, env=env['name']),
+                     'env_id': env['id'], 'env_name': env['name']}
+            if '{name}' in template:
+                event['employee'] = name
+            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+            if level == 'WARNING':
+                warnings.append(dict(event, id=len(warnings) + 1))
+    # открыты последние нарушения, остальные считаются обработанными
+    with open(os.path.join(data_dir, 'warnings.jsonl'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'op': 'seq', 'last_id': len(warnings)}) + '\n')
+        for warning in warnings[-n_open_warnings:] if n_open_warnings else []:
+            f.write(json.dumps({'op': 'open', 'warning': warning}, ensure_ascii=False) + '\n')
+
+    return {'photos': photos, 'images': images, 'env_ids': [e['id'] for e in envs]}
+
+
+def build_endpoints(ids):
+    """Return ``(name, method, path, kwargs)`` for every benchmarked route."""
+    photo = ids['photos'][0] if ids['photos'] else 'missing.jpg'
+    image = ids['images'][0] if ids['images'] else 'missing.jpg'
+    env_id = ids['env_ids'][0] if ids['env_ids'] else 'missing'
+    week_ago = (datetime.datetime.utcnow() - datetime.timedelta(days=7)).replace(microsecond=0).isoformat()
+    log_entry = {'timestamp': '2026-06-01T12:00:00', 'level': 'WARNING', 'type': 'zone_intrusion',
+                 'message': 'Обнаружен человек в запретной зоне', 'env_id': env_id}
+    return [
+        ('GET employees', 'GET', '/api/employees', {}),
+        ('GET employees/version', 'GET', '/api/employees/version', {}),
+        ('GET environments', 'GET', '/api/environments', {}),
+        ('GET assignments', 'GET', '/api/assignments', {}),
+        ('GET logs', 'GET', '/api/logs?order=desc', {}),
+        ('GET logs (tail page)', 'GET', '/api/logs?limit=500', {}),
+        ('GET logs (filtered page)', 'GET', f'/api/logs?limit=500&type=zone_intrusion&env_id={env_id}', {}),
+        ('GET warnings', 'GET', '/api/warnings', {}),
+        ('GET stats (hours, week)', 'GET', f'/api/stats?resolution=hour&since={week_ago}', {}),
+        ('GET stats (minutes, env)', 'GET', f'/api/stats?resolution=minute&env_id={env_id}', {}),
+        ('GET zones (one)', 'GET', f'/api/environments/{env_id}/zones', {}),
+        ('GET zones (batch)', 'GET', '/api/zones', {}),
+        ('GET photo', 'GET', f'/api/employees/photo/{photo}', {}),
+        ('GET photo ?size=64', 'GET', f'/api/employees/photo/{photo}?size=64', {}),
+        ('GET env image', 'GET', f'/api/environments/image/{image}', {}),
+        ('POST logs', 'POST', '/api/logs', {'json': log_entry}),
+    ]
+
+
+class TestClientTransport:
+    """Send requests through Flask's test client, one client per thread."""
+
+    def __init__(self, app, headers):
+        self.app = app
+        self.headers = headers
+        self.local = threading.local()
+
+    def request(self, method, path, kwargs):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        resp = client.open(path, method=method, headers=self.headers, **kwargs)
+        return resp.status_code, len(resp.get_data())
+
+
+class HttpTransport:
+    """Send requests to a running server, one session per thread."""
+
+    def __init__(self, base_url, headers):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip('/')
+        self.headers = headers
+        self.local = threading.local()
+
+    def request(self, method, path, kwargs):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = self.requests.Session()
+            session.headers.update(self.headers)
+        resp = session.request(method, self.base_url + path, stream=True, **kwargs)
+        # размер на проводе, до распаковки gzip/br/zstd
+        size = len(resp.raw.read(decode_content=False))
+        resp.close()
+        return resp.status_code, size
+
+
+def run_endpoint(transport, method, path, kwargs, n_requests, concurrency):
+    """Issue ``n_requests`` calls with ``concurrency`` threads and summarize them."""
+    latencies, sizes, errors = [], [], 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            status, size = transport.request(method, path, kwargs)
+        except Exception:
+            status, size = 0, 0
+        dt = time.perf_counter() - t0
+        with lock:
+            latencies.append(dt)
+            sizes.append(size)
+            if status >= 400 or status == 0:
+                errors += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        'requests': n_requests,
+        'errors': errors,
+        'rps': n_requests / wall if wall else 0.0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'avg_bytes': sum(sizes) / len(sizes) if sizes else 0,
+    }
+
+
+def print_report(results, baseline=None):
+    header = f"{'endpoint':<24}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'bytes':>12}{'err':>6}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:<24}{r['rps']:>10.1f}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+              f"{r['p99_ms']:>10.2f}{r['avg_bytes']:>12.0f}{r['errors']:>6}")
+        base = (baseline or {}).get(name)
+        if base:
+            def delta(key):
+                return (r[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            print(f"{'  vs baseline':<24}{delta('rps'):>+9.0f}%{delta('p50_ms'):>+9.0f}%"
+                  f"{delta('p95_ms'):>+9.0f}%{delta('p99_ms'):>+9.0f}%{delta('avg_bytes'):>+11.0f}%")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--employees', type=int, default=200)
+    parser.add_argument('--environments', type=int, default=20)
+    parser.add_argument('--assignments', type=int, default=2000)
+    parser.add_argument('--log-lines', type=int, default=20000)
+    parser.add_argument('--open-warnings', type=int, default=200,
+                        help='warnings left unacknowledged in the generated data')
+    parser.add_argument('--photo-size', default='1280x960',
+                        help='size of generated employee photos, WxH')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--only', action='append', default=[],
+                        help='benchmark only endpoints whose name contains this text')
+    parser.add_argument('--accept', default='application/json', help='Accept header')
+    parser.add_argument('--accept-encoding', default='identity', help='Accept-Encoding header')
+    parser.add_argument('--data-dir', help='keep generated data here instead of a temp dir')
+    parser.add_argument('--url', help='benchmark a running server, e.g. http://127.0.0.1:5002')
+    parser.add_argument('--save', help='write results as JSON')
+    parser.add_argument('--baseline', help='compare with results saved by --save')
+    args = parser.parse_args(argv)
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix='fr-bench-')
+    photo_size = tuple(int(v) for v in args.photo_size.lower().split('x'))
+    t0 = time.perf_counter()
+    ids = generate_data(data_dir, args.employees, args.environments, args.assignments,
+                        args.log_lines, photo_size, args.open_warnings)
+    print(f"data: {data_dir} (generated in {time.perf_counter() - t0:.1f}s)", file=sys.stderr)
+
+    headers = {'Accept': args.accept, 'Accept-Encoding': args.accept_encoding}
+    if args.url:
+        transport = HttpTransport(args.url, headers)
+    else:
+        os.environ['FR_DATA_DIR'] = data_dir
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import server
+        transport = TestClientTransport(server.app, headers)
+
+    endpoints = build_endpoints(ids)
+    if args.only:
+        endpoints = [e for e in endpoints if any(o in e[0] for o in args.only)]
+    results = {}
+    for name, method, path, kwargs in endpoints:
+        # прогрев: кэши вариантов, зон и соединения
+        run_endpoint(transport, method, path, kwargs, min(5, args.requests), 1)
+        results[name] = run_endpoint(transport, method, path, kwargs,
+                                     args.requests, args.concurrency)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+    print_report(results, baseline)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump({'args': vars(args), 'results': results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
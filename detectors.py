@@ -0,0 +1,262 @@
+"""Детекторы людей и их загрузка в фоне.
+
+У всех детекторов один метод ``detect(frame) -> [(x1, y1, x2, y2), ...]``
+и только класс «человек». Бэкенды:
+
+* ``ultralytics`` — веса ``.pt`` через ``ultralytics`` (torch);
+* ``onnxruntime`` — модель YOLO, экспортированная в ONNX
+  (``yolo export model=yolov8n.pt format=onnx imgsz=640``), на CPU;
+* ``opencv`` — та же ONNX-модель через ``cv2.dnn``, без лишних пакетов.
+
+Размер входа и число потоков настраиваются; ``load_detector`` выбирает
+бэкенд по расширению файла. Сравнить бэкенды на одних и тех же кадрах
+можно с помощью ``bench_detectors.py``.
+
+Первое создание модели грузит библиотеки и веса, а первый вывод ещё и
+инициализирует ядра — вместе это секунды. ``ModelManager`` делает и то и
+другое в отдельном потоке, хранит один экземпляр модели на всё время
+работы и сообщает её состояние, так что интерфейс никогда не ждёт.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Кадр для прогрева (высота, ширина) и число прогонов
+WARMUP_SIZE = (480, 640)
+WARMUP_RUNS = 2
+# Индекс класса «человек» в COCO и в моделях, обученных только на людях
+PERSON_CLASS = 0
+DEFAULT_INPUT_SIZE = 640
+DEFAULT_CONF = 0.25
+DEFAULT_IOU = 0.45
+BACKENDS = ('ultralytics', 'onnxruntime', 'opencv')
+
+IDLE, LOADING, READY, FAILED = 'idle', 'loading', 'ready', 'failed'
+
+
+class PersonDetector:
+    """Общие параметры детекторов; ``detect`` реализуют бэкенды."""
+
+    backend = None
+
+    def __init__(self, model_path, input_size=DEFAULT_INPUT_SIZE, conf=DEFAULT_CONF,
+                 iou=DEFAULT_IOU, threads=None):
+        self.model_path = model_path
+        self.input_size = input_size
+        self.conf = conf
+        self.iou = iou
+        self.threads = threads
+
+    def detect(self, frame):
+        raise NotImplementedError
+
+    def __repr__(self):
+        return (f"{self.backend}({os.path.basename(self.model_path)}, "
+                f"input={self.input_size}, threads={self.threads or 'auto'})")
+
+
+class UltralyticsDetector(PersonDetector):
+    """Веса ``.pt`` через ``ultralytics``; классы отсекаются в самом предсказании."""
+
+    backend = 'ultralytics'
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        from ultralytics import YOLO
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        self.model = YOLO(model_path)
+
+    def detect(self, frame):
+        result = self.model.predict(frame, imgsz=self.input_size, conf=self.conf, iou=self.iou,
+                                    classes=[PERSON_CLASS], verbose=False)[0]
+        return [tuple(map(int, box)) for box in result.boxes.xyxy.tolist()]
+
+
+class _OnnxYoloDetector(PersonDetector):
+    """Подготовка кадра и разбор выхода ONNX-моделей YOLOv5/YOLOv8."""
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        size = self.input_size
+        # буфер с полями letterbox переиспользуется между кадрами
+        self.canvas = np.empty((size, size, 3), dtype=np.uint8)
+
+    def _blob(self, frame):
+        """Letterbox ``frame`` into the square input; return blob, scale and offsets."""
+        h, w = frame.shape[:2]
+        size = self.input_size
+        scale = min(size / w, size / h)
+        nw, nh = int(round(w * scale)), int(round(h * scale))
+        left, top = (size - nw) // 2, (size - nh) // 2
+        self.canvas.fill(114)
+        self.canvas[top:top + nh, left:left + nw] = cv2.resize(
+            frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+        blob = cv2.dnn.blobFromImage(self.canvas, 1 / 255.0, swapRB=True)
+        return blob, scale, left, top
+
+    def _decode(self, out, scale, left, top, shape):
+        """Turn raw YOLO output into person boxes in frame coordinates."""
+        out = np.squeeze(out, 0)
+        if out.shape[0] < out.shape[1]:
+            # YOLOv8: (4 + классы, N), без objectness
+            out = out.T
+            scores = out[:, 4 + PERSON_CLASS]
+        else:
+            # YOLOv5: (N, 5 + классы), objectness в пятом столбце
+            scores = out[:, 4] * out[:, 5 + PERSON_CLASS]
+        keep = scores > self.conf
+        if not keep.any():
+            return []
+        cx, cy, bw, bh = out[keep, :4].T
+        scores = scores[keep]
+        rects = np.stack([(cx - bw / 2 - left) / scale, (cy - bh / 2 - top) / scale,
+                          bw / scale, bh / scale], axis=1)
+        idx = cv2.dnn.NMSBoxes(rects.tolist(), scores.tolist(), self.conf, self.iou)
+        h, w = shape[:2]
+        boxes = []
+        for i in np.array(idx).flatten():
+            x, y, bw_, bh_ = rects[i]
+            boxes.append((max(0, int(x)), max(0, int(y)),
+                          min(w - 1, int(x + bw_)), min(h - 1, int(y + bh_))))
+        return boxes
+
+
+class OnnxRuntimeDetector(_OnnxYoloDetector):
+    backend = 'onnxruntime'
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(model_path, options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def detect(self, frame):
+        blob, scale, left, top = self._blob(frame)
+        out = self.session.run(None, {self.input_name: blob})[0]
+        return self._decode(out, scale, left, top, frame.shape)
+
+
+class OpenCVDnnDetector(_OnnxYoloDetector):
+    backend = 'opencv'
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        if self.threads:
+            cv2.setNumThreads(self.threads)
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+
+    def detect(self, frame):
+        blob, scale, left, top = self._blob(frame)
+        self.net.setInput(blob)
+        out = self.net.forward()
+        return self._decode(out, scale, left, top, frame.shape)
+
+
+_BACKEND_CLASSES = {
+    'ultralytics': UltralyticsDetector,
+    'onnxruntime': OnnxRuntimeDetector,
+    'opencv': OpenCVDnnDetector,
+}
+
+
+def _auto_backend(model_path):
+    if not model_path.lower().endswith('.onnx'):
+        return 'ultralytics'
+    return 'onnxruntime' if importlib.util.find_spec('onnxruntime') else 'opencv'
+
+
+def warm_up(detector, runs=WARMUP_RUNS, size=WARMUP_SIZE):
+    """Run a detector on a blank frame so the first real frame is not slow."""
+    frame = np.zeros((size[0], size[1], 3), dtype=np.uint8)
+    for _ in range(runs):
+        detector.detect(frame)
+
+
+def load_detector(model_path, backend='auto', input_size=DEFAULT_INPUT_SIZE, threads=None,
+                  conf=DEFAULT_CONF, warmup=True):
+    """Create a person detector; ``backend='auto'`` picks one by file extension."""
+    if backend == 'auto':
+        backend = _auto_backend(model_path)
+    if backend not in _BACKEND_CLASSES:
+        raise ValueError(f"unknown detector backend {backend!r}, expected one of {BACKENDS}")
+    detector = _BACKEND_CLASSES[backend](model_path, input_size=input_size, conf=conf,
+                                         threads=threads)
+    if warmup:
+        warm_up(detector)
+    return detector
+
+
+class ModelManager:
+    """Общие экземпляры моделей, загружаемые по требованию в фоне.
+
+    Состояние модели: ``idle`` → ``loading`` → ``ready`` или ``failed``;
+    после ошибки ``load`` пробует снова. ``get`` не блокирует и до
+    готовности возвращает ``None``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaders = {}
+        self.models = {}
+        self.states = {}
+        self.errors = {}
+        self.events = {}
+
+    def register(self, name, loader):
+        with self.lock:
+            self.loaders[name] = loader
+            self.states.setdefault(name, IDLE)
+            self.events.setdefault(name, threading.Event())
+
+    def load(self, name):
+        """Start loading ``name`` in the background unless it is loading or loaded."""
+        with self.lock:
+            state = self.states[name]
+            if state in (LOADING, READY):
+                return state
+            self.states[name] = LOADING
+            self.events[name].clear()
+        threading.Thread(target=self._load, args=(name,), daemon=True,
+                         name=f'model-{name}').start()
+        return LOADING
+
+    def _load(self, name):
+        t0 = time.perf_counter()
+        try:
+            model = self.loaders[name]()
+        except Exception as e:
+            logging.error(f'Не удалось загрузить модель {name}: {e}')
+            with self.lock:
+                self.states[name] = FAILED
+                self.errors[name] = e
+        else:
+            with self.lock:
+                self.models[name] = model
+                self.states[name] = READY
+            logging.info(f'Модель {name} загружена и прогрета за {time.perf_counter() - t0:.1f} с')
+        self.events[name].set()
+
+    def get(self, name):
+        return self.models.get(name)
+
+    def state(self, name):
+        return self.states.get(name, IDLE)
+
+    def wait(self, name, timeout=None):
+        """Block until ``name`` is loaded or failed; return the model or ``None``."""
+        self.events[name].wait(timeout)
+        return self.get(name)
@@ -0,0 +1,179 @@
+"""Диагностика работающего клиента без перезапуска.
+
+``Diagnostics`` по команде:
+
+* запускает cProfile на N секунд (профилирует поток, из которого вызван,
+  — в интерфейсе это поток Tk, где обрабатываются кадры);
+* собирает стеки всех потоков с заданным шагом N секунд (сэмплирующий
+  профиль в формате collapsed stacks для flamegraph.pl / speedscope);
+* снимает снимок ``tracemalloc`` и сравнивает его с предыдущим, добавляя
+  прирост числа объектов по типам — так видны утечки вроде
+  накапливающихся ``PhotoImage``.
+
+Результаты пишутся в файлы каталога ``out_dir``; путь к файлу сообщается
+через ``logging``. Команды подаются скрытыми клавишами интерфейса или
+сигналами SIGUSR1 (профиль) и SIGUSR2 (снимок памяти).
+"""
+import cProfile
+import gc
+import io
+import logging
+import os
+import pstats
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+PROFILE_SECONDS = 30
+SAMPLE_INTERVAL = 0.005
+TRACEMALLOC_FRAMES = 25
+TOP_STATS = 50
+
+
+def _timer_later(seconds, fn):
+    timer = threading.Timer(seconds, fn)
+    timer.daemon = True
+    timer.start()
+
+
+class Diagnostics:
+    """Профилирование и снимки памяти по требованию.
+
+    ``call_later(seconds, fn)`` откладывает остановку cProfile: она должна
+    выполниться в том же потоке, где профиль запущен (в Tk — ``root.after``).
+    """
+
+    def __init__(self, out_dir, call_later=None):
+        self.out_dir = out_dir
+        self.call_later = call_later or _timer_later
+        self.profiler = None
+        self.sampling = False
+        self.last_snapshot = None
+        self.last_types = None
+        self.lock = threading.Lock()
+
+    def _path(self, kind, ext):
+        os.makedirs(self.out_dir, exist_ok=True)
+        now = time.time()
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+        return os.path.join(self.out_dir, f"{kind}-{stamp}-{os.getpid()}.{ext}")
+
+    # --- cProfile ---
+
+    def toggle_profile(self, seconds=PROFILE_SECONDS):
+        """Start a cProfile session for ``seconds`` or stop the running one."""
+        if self.profiler is not None:
+            return self.stop_profile()
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        profiler = self.profiler
+        logging.info("Диагностика: cProfile запущен на %s с", seconds)
+        self.call_later(seconds, lambda: self.profiler is profiler and self.stop_profile())
+        return None
+
+    def stop_profile(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return None
+        profiler.disable()
+        path = self._path('profile', 'prof')
+        profiler.dump_stats(path)
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(TOP_STATS)
+        with open(path[:-len('prof')] + 'txt', 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        logging.info("Диагностика: профиль сохранён в %s", path)
+        return path
+
+    # --- Сэмплирующий профиль всех потоков ---
+
+    def sample(self, seconds=PROFILE_SECONDS, interval=SAMPLE_INTERVAL):
+        """Sample stacks of all threads in the background for ``seconds``."""
+        with self.lock:
+            if self.sampling:
+                return False
+            self.sampling = True
+        threading.Thread(target=self._sample, args=(seconds, interval), daemon=True,
+                         name='diagnostics-sampler').start()
+        logging.info("Диагностика: сэмплирование стеков на %s с", seconds)
+        return True
+
+    def _sample(self, seconds, interval):
+        stacks = Counter()
+        me = threading.get_ident()
+        names = {}
+        deadline = time.monotonic() + seconds
+        try:
+            while time.monotonic() < deadline:
+                for t in threading.enumerate():
+                    names[t.ident] = t.name
+                for ident, frame in sys._current_frames().items():
+                    if ident == me:
+                        continue
+                    parts = []
+                    while frame is not None:
+                        code = frame.f_code
+                        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    parts.append(names.get(ident, str(ident)))
+                    stacks[';'.join(reversed(parts))] += 1
+                time.sleep(interval)
+            path = self._path('samples', 'folded')
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, n in stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+            logging.info("Диагностика: стеки сохранены в %s", path)
+        finally:
+            self.sampling = False
+
+    # --- Память ---
+
+    def memory_snapshot(self):
+        """Write the growth since the previous snapshot; the first call starts tracing."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        gc.collect()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        types = Counter(type(o).__qualname__ for o in gc.get_objects())
+        path = self._path('memory', 'txt')
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"traced: {current / 2**20:.1f} MB, peak {peak / 2**20:.1f} MB\n")
+            if self.last_snapshot is None:
+                f.write("first snapshot: baseline taken; the next one will show growth\n\n")
+                stats = snapshot.statistics('lineno')
+            else:
+                stats = snapshot.compare_to(self.last_snapshot, 'lineno')
+            f.write(f"\ntop {TOP_STATS} allocations by line:\n")
+            for stat in stats[:TOP_STATS]:
+                f.write(f"{stat}\n")
+            if self.last_types is not None:
+                growth = Counter(types)
+                growth.subtract(self.last_types)
+                f.write("\nobject count growth by type:\n")
+                for name, n in growth.most_common(TOP_STATS):
+                    if n <= 0:
+                        break
+                    f.write(f"{n:>+10}  {name} (now {types[name]})\n")
+        self.last_snapshot = snapshot
+        self.last_types = types
+        logging.info("Диагностика: снимок памяти сохранён в %s", path)
+        return path
+
+    def install_signals(self, schedule=None):
+        """Profile on SIGUSR1 and snapshot memory on SIGUSR2 (POSIX only).
+
+        ``schedule(fn)`` moves the work out of the signal handler, e.g. into
+        the Tk loop; by default it runs in place.
+        """
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        schedule = schedule or (lambda fn: fn())
+        signal.signal(signal.SIGUSR1, lambda *_: schedule(self.sample))
+        signal.signal(signal.SIGUSR2, lambda *_: schedule(self.memory_snapshot))
@@ -0,0 +1,102 @@
+"""Схема событий журнала.
+
+Журнал сервера (``events.jsonl``) хранит по объекту JSON в строке:
+
+* ``timestamp`` — время события в ISO 8601 (UTC), ``level`` — ``INFO``,
+  ``WARNING`` или ``ERROR`` (остальные уровни logging сводятся к ним);
+* ``type`` — вид события из ``EVENT_TYPES``, по умолчанию ``MESSAGE`` (обычная
+  строка лога без отдельных полей);
+* ``message`` — текст для человека;
+* необязательные поля ``FIELDS``: помещение, сотрудник, число людей,
+  уверенность распознавания (0–1) и рабочее место, приславшее событие.
+
+Фильтры и подсчёты работают по полям; строка ``"ts level: message"``
+собирается из записи только для показа. Модуль использует только
+стандартную библиотеку: его импортируют и сервер, и клиент.
+"""
+import datetime
+
+MESSAGE = 'message'
+ACCESS_GRANTED = 'access_granted'
+ACCESS_DENIED = 'access_denied'
+AUTH_FAILED = 'auth_failed'
+ZONE_INTRUSION = 'zone_intrusion'
+UNAUTHORIZED_ACCESS = 'unauthorized_access'
+FACE_MISMATCH = 'face_mismatch'
+OVERCROWDING = 'overcrowding'
+FIRE = 'fire'
+EVENT_TYPES = (MESSAGE, ACCESS_GRANTED, ACCESS_DENIED, AUTH_FAILED, ZONE_INTRUSION,
+               UNAUTHORIZED_ACCESS, FACE_MISMATCH, OVERCROWDING, FIRE)
+LEVELS = ('INFO', 'WARNING', 'ERROR')
+# Прочие уровни logging и их синонимы; неизвестные считаются INFO
+LEVEL_ALIASES = {'CRITICAL': 'ERROR', 'FATAL': 'ERROR', 'WARN': 'WARNING',
+                 'DEBUG': 'INFO', 'NOTSET': 'INFO'}
+
+# Необязательные поля события и их типы
+FIELDS = {
+    'env_id': str,
+    'env_name': str,
+    'employee': str,
+    'dept': str,
+    # сколько людей обнаружено и сколько допущено в помещение
+    'people_count': int,
+    'capacity': int,
+    # номер неудачной попытки входа
+    'attempt': int,
+    'confidence': float,
+    'station': str,
+}
+
+
+def now_iso():
+    return datetime.datetime.utcnow().isoformat()
+
+
+def make_event(event_type, **fields):
+    """Return the typed part of an event; fields set to ``None`` are left out."""
+    event = {'type': event_type}
+    event.update((k, v) for k, v in fields.items() if v is not None)
+    return event
+
+
+def confidence(distance):
+    """Turn a face distance (0 — same face) into a 0–1 confidence."""
+    return round(min(1.0, max(0.0, 1.0 - float(distance))), 3)
+
+
+def normalize_event(entry):
+    """Validate a posted log entry and return the event to store.
+
+    Entries without ``type`` (older clients, plain log records) become
+    ``message`` events and other logging levels map onto ``LEVELS``.
+    Raises ``ValueError`` for malformed entries.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError('event must be a JSON object')
+    message = entry.get('message')
+    if not isinstance(message, str):
+        raise ValueError('message is required')
+    level = str(entry.get('level') or 'INFO').upper()
+    if level not in LEVELS:
+        level = LEVEL_ALIASES.get(level, 'INFO')
+    event_type = entry.get('type') or MESSAGE
+    if event_type not in EVENT_TYPES:
+        raise ValueError(f'unknown event type {event_type!r}')
+    event = {'timestamp': str(entry.get('timestamp') or now_iso()), 'level': level,
+             'type': event_type, 'message': message}
+    for field, kind in FIELDS.items():
+        value = entry.get(field)
+        if value is None or value == '':
+            continue
+        try:
+            event[field] = kind(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'{field} must be {kind.__name__}') from None
+    if 'confidence' in event:
+        event['confidence'] = round(min(1.0, max(0.0, event['confidence'])), 3)
+    return event
+
+
+def format_line(event):
+    """Return the human-readable log line of an event."""
+    return f"{event['timestamp']} {event['level']}: {event['message']}"
@@ -0,0 +1,219 @@
+"""Метрики конвейера камер: задержки стадий, FPS и экспорт для Prometheus.
+
+``PipelineMetrics`` подключается вместо ``StageTimer`` (тот же метод
+``stage``) и хранит по каждой стадии накопительную гистограмму и окно
+последних измерений для p50/p95. ``MetricsExporter`` периодически пишет
+текстовый формат Prometheus в файл (для textfile collector node_exporter)
+и/или отдаёт его по HTTP на ``/metrics``.
+
+Модуль использует только стандартную библиотеку.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм задержек, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Сколько последних измерений стадии учитывается в p50/p95
+WINDOW_SIZE = 300
+# За сколько последних секунд считается FPS
+FPS_WINDOW = 5.0
+METRICS_PREFIX = 'fr_pipeline'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def percentile(sorted_values, pct):
+    """Return the ``pct``-th percentile (nearest rank) of ascending ``sorted_values``."""
+    if not sorted_values:
+        return 0.0
+    idx = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+
+class _Histogram:
+    __slots__ = ('counts', 'total', 'count', 'window')
+
+    def __init__(self, n_buckets, window):
+        self.counts = [0] * n_buckets
+        self.total = 0.0
+        self.count = 0
+        self.window = deque(maxlen=window)
+
+
+class PipelineMetrics:
+    """Задержки стадий и частота кадров одного потока (``stream``).
+
+    ``stream`` — метка потока в экспорте: ``security``, ``kiosk`` и т.п.
+    """
+
+    def __init__(self, stream, buckets=LATENCY_BUCKETS, window=WINDOW_SIZE):
+        self.stream = stream
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.frames = 0
+        self.frame_times = deque()
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def observe(self, name, seconds):
+        with self.lock:
+            h = self.stages.get(name)
+            if h is None:
+                h = self.stages[name] = _Histogram(len(self.buckets), self.window)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    h.counts[i] += 1
+                    break
+            h.total += seconds
+            h.count += 1
+            h.window.append(seconds)
+
+    def tick(self):
+        """Count one finished frame."""
+        now = time.monotonic()
+        with self.lock:
+            self.frames += 1
+            self.frame_times.append(now)
+            while self.frame_times and now - self.frame_times[0] > FPS_WINDOW:
+                self.frame_times.popleft()
+
+    def fps(self):
+        with self.lock:
+            return self._fps()
+
+    def _fps(self):
+        times = self.frame_times
+        if len(times) < 2 or time.monotonic() - times[-1] > FPS_WINDOW:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def snapshot(self):
+        """Return ``{'fps', 'frames', 'stages': {name: {count, mean_ms, p50_ms, p95_ms}}}``."""
+        with self.lock:
+            stages = {}
+            for name, h in self.stages.items():
+                recent = sorted(h.window)
+                stages[name] = {
+                    'count': h.count,
+                    'mean_ms': h.total / h.count * 1000 if h.count else 0.0,
+                    'p50_ms': percentile(recent, 50) * 1000,
+                    'p95_ms': percentile(recent, 95) * 1000,
+                }
+            return {'fps': self._fps(), 'frames': self.frames, 'stages': stages}
+
+    def overlay_lines(self):
+        """Short text lines for an on-screen overlay, slowest stages first."""
+        snap = self.snapshot()
+        lines = [f"{self.stream}: {snap['fps']:.1f} FPS"]
+        for name, s in sorted(snap['stages'].items(), key=lambda kv: -kv[1]['p50_ms']):
+            lines.append(f"{name:<11}{s['p50_ms']:7.1f} /{s['p95_ms']:7.1f} ms")
+        return lines
+
+
+def render_prometheus(metrics, prefix=METRICS_PREFIX):
+    """Render several ``PipelineMetrics`` in the Prometheus text format."""
+    stage_lines, frame_lines, fps_lines = [], [], []
+    for m in metrics:
+        with m.lock:
+            stream = m.stream
+            for name, h in sorted(m.stages.items()):
+                labels = f'stream="{stream}",stage="{name}"'
+                cumulative = 0
+                for bound, n in zip(m.buckets, h.counts):
+                    cumulative += n
+                    stage_lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                stage_lines.append(f'{prefix}_stage_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                stage_lines.append(f'{prefix}_stage_seconds_sum{{{labels}}} {h.total:.6f}')
+                stage_lines.append(f'{prefix}_stage_seconds_count{{{labels}}} {h.count}')
+            frame_lines.append(f'{prefix}_frames_total{{stream="{stream}"}} {m.frames}')
+            fps_lines.append(f'{prefix}_fps{{stream="{stream}"}} {m._fps():.2f}')
+    out = [f'# HELP {prefix}_stage_seconds Duration of pipeline stages.',
+           f'# TYPE {prefix}_stage_seconds histogram', *stage_lines,
+           f'# HELP {prefix}_frames_total Frames processed.',
+           f'# TYPE {prefix}_frames_total counter', *frame_lines,
+           f'# HELP {prefix}_fps Frames per second over the last {FPS_WINDOW:g} s.',
+           f'# TYPE {prefix}_fps gauge', *fps_lines]
+    return '\n'.join(out) + '\n'
+
+
+class MetricsExporter:
+    """Экспортирует метрики в файл каждые ``interval`` секунд и/или по HTTP.
+
+    Файл перезаписывается атомарно (через временный файл), поэтому
+    сборщик никогда не увидит его наполовину записанным.
+    """
+
+    def __init__(self, metrics, path=None, port=None, interval=10.0):
+        self.metrics = list(metrics)
+        self.path = path
+        self.port = port
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.server = None
+
+    def text(self):
+        return render_prometheus(self.metrics)
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(self.text())
+        os.replace(tmp, self.path)
+
+    def start(self):
+        if self.path:
+            threading.Thread(target=self._write_loop, daemon=True).start()
+        if self.port:
+            exporter = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self):
+                    if self.path.split('?')[0] != '/metrics':
+                        self.send_error(404)
+                        return
+                    body = exporter.text().encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', PROMETHEUS_CONTENT_TYPE)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args):
+                    pass
+
+            self.server = ThreadingHTTPServer(('0.0.0.0', self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def _write_loop(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logging.error("Не удалось записать метрики: %s", e)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server = None
+        if self.path:
+            try:
+                self.write()
+            except OSError:
+                pass
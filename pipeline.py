@@ -0,0 +1,1031 @@
+"""Обработка кадров камер: огонь, люди, зоны, лица, допуски и тревоги.
+
+Модуль не зависит от Tk: его использует интерфейс ``12.py``, офлайн
+бенчмарк ``bench_pipeline.py`` и безголовый узел камеры (``python
+pipeline.py --source 0 --api http://server:5002 --env-id ...``), поэтому
+логика во всех случаях одна.
+
+Кадры берутся из источника (``FrameSource``), обрабатываются
+``SecurityPipeline``, а кадры с разметкой и тревоги передаются
+приёмникам (``ResultSink``).
+
+``face_recognition`` (dlib и его модели) и ``ultralytics`` импортируются
+при первом использовании: загрузка занимает секунды и нужна не всем.
+"""
+import argparse
+import datetime
+import io
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from detectors import BACKENDS, DEFAULT_INPUT_SIZE, load_detector
+from diagnostics import Diagnostics
+from events import (FACE_MISMATCH, FIRE, OVERCROWDING, UNAUTHORIZED_ACCESS, ZONE_INTRUSION,
+                    confidence, make_event)
+from metrics import MetricsExporter, PipelineMetrics
+
+# Размер изображений помещений в интерфейсе руководителя; координаты зон
+# хранятся в этой системе координат
+ENV_IMAGE_SIZE = (800, 600)
+# Размер кадра службы безопасности, если окно ещё не отрисовано
+SECURITY_DEFAULT_SIZE = (600, 500)
+UNKNOWN_NAME = 'Неизвестный'
+UNKNOWN_ENV_NAME = 'Неизвестное помещение'
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Параметры вызовов face_recognition: детектор лиц ('hog' или 'cnn'),
+# сколько раз увеличивать кадр при поиске (находит мелкие лица, но каждое
+# увеличение в ~4 раза дороже), модель ориентиров для кодирования
+# ('small' — 5 точек, 'large' — 68), число «дрожаний» при кодировании
+# (усреднение по случайным сдвигам, во столько же раз дольше) и порог
+# расстояния, ниже которого лицо считается совпавшим.
+# Кодировки сравнимы, только если эталон и кадр кодируются одной моделью
+# ориентиров, поэтому она во всех профилях одна. Киоск и служба
+# безопасности работают на умолчаниях библиотеки; отдельный профиль для
+# них добавляется вместе с замерами bench_pipeline.py --labels, которые
+# показывают его выигрыш в скорости или точности.
+RecognitionProfile = namedtuple('RecognitionProfile', 'detector upsample landmarks jitters tolerance')
+PROFILES = {
+    # умолчания библиотеки
+    'default': RecognitionProfile('hog', 1, 'small', 1, 0.6),
+    # эталонные фото кодируются один раз (кодировки кэшируются), поэтому
+    # можно усреднять по сдвигам
+    'accurate-enrollment': RecognitionProfile('hog', 1, 'small', 10, 0.6),
+}
+KIOSK_PROFILE = 'default'
+SECURITY_PROFILE = 'default'
+ENROLLMENT_PROFILE = 'accurate-enrollment'
+
+# Результат обработки кадра службы безопасности. faces — список
+# ((top, right, bottom, left), имя, есть_допуск)
+FrameResult = namedtuple('FrameResult', 'frame people_count person_boxes fire_boxes faces')
+
+
+def point_in_poly(x, y, pts):
+    inside = False
+    n = len(pts)
+    px, py = pts[0]
+    for i in range(1, n+1):
+        nx, ny = pts[i % n]
+        if ((py > y) != (ny > y)) and (x < (nx-px)*(y-py)/(ny-py+1e-9)+px):
+            inside = not inside
+        px, py = nx, ny
+    return inside
+
+
+def detect_fire(frame):
+    """Return list of bounding boxes where fire-like colors are detected."""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    lower = np.array([0, 150, 150])
+    upper = np.array([35, 255, 255])
+    mask = cv2.inRange(hsv, lower, upper)
+    mask = cv2.erode(mask, None, iterations=2)
+    mask = cv2.dilate(mask, None, iterations=2)
+    cnts, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    boxes = []
+    for c in cnts:
+        if cv2.contourArea(c) > 1000:
+            x, y, w, h = cv2.boundingRect(c)
+            boxes.append((x, y, x + w, y + h))
+    return boxes
+
+
+def scale_zones(zones, w, h):
+    """Scale zone polygons from ENV_IMAGE_SIZE to a ``w`` x ``h`` frame."""
+    scale_x = w / ENV_IMAGE_SIZE[0]
+    scale_y = h / ENV_IMAGE_SIZE[1]
+    scaled = []
+    for z in zones:
+        pts = [(int(p[0] * scale_x), int(p[1] * scale_y)) for p in z.get('points', [])]
+        if pts:
+            scaled.append(pts)
+    return scaled
+
+
+def detect_people(detector, frame):
+    """Return ``(x1, y1, x2, y2)`` boxes of people (see ``detectors.PersonDetector``)."""
+    return detector.detect(frame)
+
+
+def get_profile(name):
+    """Return the recognition profile called ``name``."""
+    try:
+        return PROFILES[name]
+    except KeyError:
+        raise ValueError(f"unknown recognition profile {name!r}, expected one of {', '.join(PROFILES)}")
+
+
+def find_faces(rgb, profile):
+    """Return ``(top, right, bottom, left)`` face boxes in an RGB image."""
+    import face_recognition
+    return face_recognition.face_locations(rgb, profile.upsample, profile.detector)
+
+
+def encode_faces(rgb, locs, profile):
+    """Return one encoding per face box in ``locs``."""
+    import face_recognition
+    return face_recognition.face_encodings(rgb, locs, profile.jitters, profile.landmarks)
+
+
+def encode_photo(rgb, profile):
+    """Return the encoding of the largest face in an enrollment photo or ``None``."""
+    locs = find_faces(rgb, profile)
+    if not locs:
+        return None
+    loc = max(locs, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+    return encode_faces(rgb, [loc], profile)[0]
+
+
+def closest_face(known_encodings, known_names, enc, tolerance=PROFILES['default'].tolerance):
+    """Return ``(name, distance)`` of the closest known face; name is ``None`` beyond ``tolerance``."""
+    if len(known_encodings) == 0:
+        return None, None
+    import face_recognition
+    dists = face_recognition.face_distance(known_encodings, enc)
+    best = np.argmin(dists)
+    dist = float(dists[best])
+    return (known_names[best] if dist <= tolerance else None), dist
+
+
+def match_face(known_encodings, known_names, enc, tolerance=PROFILES['default'].tolerance):
+    """Return the name of the closest matching known face or ``None``."""
+    return closest_face(known_encodings, known_names, enc, tolerance)[0]
+
+
+def assignment_active(rec, now):
+    """Return True if an assignment record is valid at ``now``."""
+    try:
+        start = datetime.datetime.fromisoformat(rec.get('enter_until')) if rec.get('enter_until') else None
+        end = datetime.datetime.fromisoformat(rec.get('exit_until')) if rec.get('exit_until') else None
+    except Exception:
+        start = end = None
+    if start and now < start:
+        return False
+    if end and now > end:
+        return False
+    return True
+
+
+def has_permission(assignments, name, env_id, now=None):
+    """Check if employee has a valid assignment for an environment ID."""
+    now = now or datetime.datetime.now()
+    return any(rec.get('employee') == name and rec.get('environment_id') == env_id
+               and assignment_active(rec, now) for rec in assignments)
+
+
+def count_valid_permissions(assignments, env_id, now=None):
+    """Return number of valid assignments for ``env_id``."""
+    now = now or datetime.datetime.now()
+    return sum(1 for rec in assignments
+               if rec.get('environment_id') == env_id and assignment_active(rec, now))
+
+
+class StageTimer:
+    """Накапливает длительности стадий обработки кадра.
+
+    Для долгой работы с гистограммами и FPS используйте
+    ``metrics.PipelineMetrics`` — у него тот же интерфейс.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.frames = 0
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter() - t0)
+
+    def tick(self):
+        self.frames += 1
+
+
+class _NullTimer:
+    @contextmanager
+    def stage(self, name):
+        yield
+
+    def tick(self):
+        pass
+
+
+class SecurityAlerts:
+    """Правила тревог службы безопасности с подавлением повторов.
+
+    ``send(level, message, event)`` вызывается только для тех событий,
+    которые прошли по порогам и интервалам; ``event`` — поля события
+    журнала (``events.make_event``).
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.last_zone_warning = 0
+        self.last_fire_warning = 0
+        self.last_overcrowd_log = 0
+        self.face_mismatch_times = []  # timestamps of mismatched faces
+        self.unauth_access_times = {}  # name -> list of timestamps
+        self.last_face_mismatch_log = 0
+        self.last_unauth_log = {}
+        self.last_prune = 0
+
+    def _prune(self, now):
+        """Forget names not seen for a while so the dicts do not grow for days."""
+        if now - self.last_prune < 60:
+            return
+        self.last_prune = now
+        self.unauth_access_times = {n: ts for n, ts in self.unauth_access_times.items()
+                                    if ts and now - ts[-1] <= 30}
+        self.last_unauth_log = {n: t for n, t in self.last_unauth_log.items() if now - t <= 30}
+
+    def zone_intrusion(self, interval, env_id=None, env_name=None):
+        if time.time() - self.last_zone_warning > interval:
+            self.last_zone_warning = time.time()
+            self.send('WARNING', 'Обнаружен человек в запретной зоне',
+                      make_event(ZONE_INTRUSION, env_id=env_id, env_name=env_name))
+
+    def unauthorized(self, name, env_id, env_name, confidence=None):
+        now = time.time()
+        lst = self.unauth_access_times.setdefault(name, [])
+        lst.append(now)
+        self.unauth_access_times[name] = [t for t in lst if now - t <= 30]
+        self._prune(now)
+        if len(self.unauth_access_times[name]) >= 3 and now - self.last_unauth_log.get(name, 0) > 30:
+            self.last_unauth_log[name] = now
+            self.send('WARNING', f'Несанкционированный доступ в {env_name}: {name}',
+                      make_event(UNAUTHORIZED_ACCESS, env_id=env_id, env_name=env_name,
+                                 employee=name, confidence=confidence))
+
+    def face_mismatch(self, env_id, env_name):
+        now = time.time()
+        self.face_mismatch_times.append(now)
+        self.face_mismatch_times = [t for t in self.face_mismatch_times if now - t <= 30]
+        if len(self.face_mismatch_times) > 7 and now - self.last_face_mismatch_log > 30:
+            self.last_face_mismatch_log = now
+            self.send('WARNING', f'Несовпадение лица в {env_name}: {UNKNOWN_NAME} не имеет доступа',
+                      make_event(FACE_MISMATCH, env_id=env_id, env_name=env_name))
+
+    def overcrowded(self, people_count, allowed, env_id, env_name):
+        if people_count > allowed and time.time() - self.last_overcrowd_log > 30:
+            self.last_overcrowd_log = time.time()
+            self.send('WARNING', f'Превышено количество людей в {env_name}: разрешено {allowed}, обнаружено {people_count}',
+                      make_event(OVERCROWDING, env_id=env_id, env_name=env_name,
+                                 people_count=people_count, capacity=allowed))
+
+    def fire(self, env_id=None, env_name=None):
+        if time.time() - self.last_fire_warning > 5:
+            self.last_fire_warning = time.time()
+            self.send('WARNING', 'Обнаружено возгорание',
+                      make_event(FIRE, env_id=env_id, env_name=env_name))
+
+
+# Частота стадий по умолчанию, раз в секунду; None — на каждом кадре,
+# пока хватает бюджета кадра
+DEFAULT_STAGE_RATES = {'fire': 2.0, 'yolo': None, 'face_detect': 5.0}
+# Целевая частота кадров интерфейса службы безопасности
+SECURITY_TARGET_FPS = 15.0
+# Повторное распознавание уже известного трека, секунды
+REIDENTIFY_INTERVAL = 5.0
+
+
+class FrameScheduler:
+    """Решает, какие стадии выполнять на кадре, чтобы держать целевой FPS.
+
+    Каждая стадия выполняется не чаще своей частоты (``rates``). Если
+    кадр (вместе с захватом и отрисовкой, см. ``end_frame``) не укладывается
+    в бюджет ``1 / target_fps``, интервалы дорогих стадий растягиваются в
+    ``stretch`` раз; когда запас появляется, растяжение снимается. Дешёвые
+    стадии (меньше 10% бюджета по измеренной стоимости) не растягиваются.
+    """
+
+    def __init__(self, target_fps=SECURITY_TARGET_FPS, rates=None, max_stretch=8.0):
+        self.target_fps = target_fps
+        self.rates = dict(DEFAULT_STAGE_RATES, **(rates or {}))
+        self.max_stretch = max_stretch
+        self.stretch = 1.0
+        self.cost = {}
+        self.last_run = {}
+        self.frame_cost = None
+        self.last_frame = 0.0
+
+    @property
+    def budget(self):
+        return 1.0 / self.target_fps
+
+    def due(self, stage, now):
+        """True if ``stage`` should run on the frame taken at ``now``."""
+        rate = self.rates.get(stage)
+        interval = 1.0 / rate if rate else 0.0
+        if self.stretch > 1.0 and self.cost.get(stage, self.budget) >= 0.1 * self.budget:
+            interval = max(interval * self.stretch, self.budget * (self.stretch - 1.0))
+        return now - self.last_run.get(stage, float('-inf')) >= interval
+
+    def record(self, stage, seconds, now):
+        prev = self.cost.get(stage)
+        self.cost[stage] = seconds if prev is None else 0.8 * prev + 0.2 * seconds
+        self.last_run[stage] = now
+
+    def end_frame(self, seconds):
+        """Account the whole frame and adapt the stretch to the budget."""
+        self.last_frame = seconds
+        prev = self.frame_cost
+        self.frame_cost = seconds if prev is None else 0.8 * prev + 0.2 * seconds
+        if self.frame_cost > self.budget * 1.05:
+            self.stretch = min(self.max_stretch, self.stretch * 1.25)
+        elif self.frame_cost < self.budget * 0.7:
+            self.stretch = max(1.0, self.stretch / 1.1)
+
+    def delay(self):
+        """Seconds to wait before the next frame to hold the target FPS."""
+        return max(0.0, self.budget - self.last_frame)
+
+
+class _Track:
+    __slots__ = ('loc', 'name', 'confidence', 'authorized', 'identified_at', 'seen_at')
+
+    def __init__(self, loc, now):
+        self.loc = loc
+        self.name = None
+        self.confidence = None
+        self.authorized = False
+        self.identified_at = None
+        self.seen_at = now
+
+
+def _loc_iou(a, b):
+    """IoU of two ``(top, right, bottom, left)`` face boxes."""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    union = (a[2] - a[0]) * (a[1] - a[3]) + (b[2] - b[0]) * (b[1] - b[3]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    """Связывает лица соседних проходов по пересечению рамок (IoU).
+
+    Распознавать нужно только новые треки и изредка — уже известные
+    (``needs_identity``); остальные сохраняют имя между кадрами.
+    """
+
+    def __init__(self, min_iou=0.3, max_age=1.0, reidentify=REIDENTIFY_INTERVAL):
+        self.min_iou = min_iou
+        self.max_age = max_age
+        self.reidentify = reidentify
+        self.tracks = []
+
+    def update(self, locs, now):
+        """Match face boxes to tracks; return the track of each box in order."""
+        pairs = sorted(((_loc_iou(loc, tr.loc), i, j) for i, loc in enumerate(locs)
+                        for j, tr in enumerate(self.tracks)), reverse=True)
+        matched, used = [None] * len(locs), set()
+        for score, i, j in pairs:
+            if score < self.min_iou:
+                break
+            if matched[i] is None and j not in used:
+                matched[i] = self.tracks[j]
+                used.add(j)
+        for i, loc in enumerate(locs):
+            tr = matched[i]
+            if tr is None:
+                tr = matched[i] = _Track(loc, now)
+            tr.loc = loc
+            tr.seen_at = now
+        self.tracks = [tr for tr in self.tracks if now - tr.seen_at <= self.max_age]
+        self.tracks += [tr for tr in matched if tr not in self.tracks]
+        return matched
+
+    def needs_identity(self, track, now):
+        return track.identified_at is None or now - track.identified_at >= self.reidentify
+
+    def clear(self):
+        self.tracks = []
+
+
+class SecurityPipeline:
+    """Обработка кадра камеры службы безопасности.
+
+    Состояние (галерея лиц, допуски, зоны, помещение) задаётся атрибутами
+    и может меняться между кадрами. ``process`` рисует разметку на кадре
+    и возвращает ``FrameResult``.
+
+    Без ``scheduler`` все стадии выполняются на каждом кадре и каждое лицо
+    распознаётся заново. С ``FrameScheduler`` стадии идут со своей
+    частотой, пропущенные отдают прошлый результат, а лица распознаются
+    только на новых треках ``FaceTracker``.
+
+    ``profile`` — ``RecognitionProfile`` поиска и сверки лиц, по
+    умолчанию ``PROFILES[SECURITY_PROFILE]``.
+    """
+
+    def __init__(self, send_log, detector=None, timer=None, scheduler=None, profile=None):
+        self.detector = detector
+        self.profile = profile or PROFILES[SECURITY_PROFILE]
+        self.timer = timer or _NullTimer()
+        self.scheduler = scheduler
+        self.alerts = SecurityAlerts(send_log)
+        self.tracker = FaceTracker()
+        self.known_encodings = []
+        self.known_names = []
+        self.assignments = []
+        self.zones = []
+        self.env_id = None
+        self.env_name = UNKNOWN_ENV_NAME
+        self._reset(None)
+
+    def _reset(self, size):
+        # результаты последнего выполнения каждой стадии в координатах size
+        self.size = size
+        self.fire_boxes = []
+        self.person_boxes = []
+        self.face_locs = []
+        self.faces = []
+        self.tracker.clear()
+        if self.scheduler is not None:
+            self.scheduler.last_run.clear()
+
+    def _due(self, stage, now):
+        return self.scheduler is None or self.scheduler.due(stage, now)
+
+    @contextmanager
+    def _stage(self, name, now):
+        t0 = time.perf_counter()
+        with self.timer.stage(name):
+            yield
+        if self.scheduler is not None:
+            self.scheduler.record(name, time.perf_counter() - t0, now)
+
+    def process(self, frame, size=SECURITY_DEFAULT_SIZE):
+        t = self.timer
+        now = time.monotonic()
+        w, h = size
+        if size != self.size:
+            self._reset(size)
+        with t.stage('resize'):
+            frame = cv2.resize(frame, (w, h))
+        if self._due('fire', now):
+            with self._stage('fire', now):
+                self.fire_boxes = detect_fire(frame)
+        fire_boxes = self.fire_boxes
+        scaled_zones = scale_zones(self.zones, w, h)
+
+        rgb = None
+        faces_fresh = self._due('face_detect', now)
+        if faces_fresh:
+            with self._stage('face_detect', now):
+                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                self.face_locs = find_faces(rgb, self.profile)
+        face_locs = self.face_locs
+
+        # Поиск людей и проверка запретных зон
+        if self.detector:
+            if self._due('yolo', now):
+                with self._stage('yolo', now):
+                    self.person_boxes = detect_people(self.detector, frame)
+            person_boxes = self.person_boxes
+            people = person_boxes
+            zone_interval = 15
+        else:
+            person_boxes = []
+            people = [(left, top, right, bottom) for top, right, bottom, left in face_locs]
+            zone_interval = 5
+        people_count = len(people)
+        in_zone = []
+        for x1, y1, x2, y2 in people:
+            cx = (x1 + x2) // 2
+            cy = (y1 + y2) // 2
+            inside = any(point_in_poly(cx, cy, pts) for pts in scaled_zones)
+            if inside:
+                self.alerts.zone_intrusion(zone_interval, self.env_id, self.env_name)
+            in_zone.append(inside)
+
+        # Распознавание лиц и сверка с допусками — на свежих рамках
+        if faces_fresh:
+            tracks = self.tracker.update(face_locs, now)
+            pending = [tr for tr in tracks
+                       if self.scheduler is None or self.tracker.needs_identity(tr, now)]
+            if pending:
+                with t.stage('encode'):
+                    encs = encode_faces(rgb, [tr.loc for tr in pending], self.profile)
+                for tr, enc in zip(pending, encs):
+                    with t.stage('match'):
+                        name, dist = closest_face(self.known_encodings, self.known_names, enc,
+                                                  self.profile.tolerance)
+                    tr.name = name or UNKNOWN_NAME
+                    tr.confidence = confidence(dist) if name else None
+                    tr.identified_at = now
+            for tr in tracks:
+                with t.stage('permission'):
+                    name = tr.name or UNKNOWN_NAME
+                    authorized = False
+                    if name != UNKNOWN_NAME and self.env_id:
+                        authorized = has_permission(self.assignments, name, self.env_id)
+                    if name != UNKNOWN_NAME and not authorized:
+                        self.alerts.unauthorized(name, self.env_id, self.env_name, tr.confidence)
+                    elif name == UNKNOWN_NAME:
+                        self.alerts.face_mismatch(self.env_id, self.env_name)
+                    tr.authorized = authorized
+            self.faces = [(tr.loc, tr.name or UNKNOWN_NAME, tr.authorized) for tr in tracks]
+        faces = self.faces
+
+        with t.stage('permission'):
+            if self.env_id:
+                allowed = count_valid_permissions(self.assignments, self.env_id)
+                self.alerts.overcrowded(people_count, allowed, self.env_id, self.env_name)
+        if fire_boxes:
+            self.alerts.fire(self.env_id, self.env_name)
+
+        with t.stage('draw'):
+            for pts in scaled_zones:
+                cv2.polylines(frame, [np.array(pts, dtype=np.int32)], True, (0, 0, 255), 2)
+            for (x1, y1, x2, y2), inside in zip(person_boxes, in_zone):
+                color = (0, 0, 255) if inside else (0, 255, 0)
+                cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+            for loc, name, authorized in faces:
+                draw_face_label(frame, loc, name, authorized)
+            for x1, y1, x2, y2 in fire_boxes:
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 165, 255), 2)
+                cv2.putText(frame, 'FIRE', (x1, y1 - 5), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.6, (0, 165, 255), 2)
+        return FrameResult(frame, people_count, person_boxes, fire_boxes, faces)
+
+
+def draw_face_label(frame, loc, name, authorized):
+    top, right, bottom, left = loc
+    color = (0, 255, 0) if authorized else (0, 0, 255)
+    cv2.rectangle(frame, (left, top), (right, bottom), color, 2)
+    text_size, _ = cv2.getTextSize(name, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+    tx, ty = left, max(0, top - text_size[1] - 6)
+    cv2.rectangle(frame, (tx - 1, ty - 1),
+                  (tx + text_size[0] + 2, ty + text_size[1] + 2),
+                  color, -1)
+    cv2.putText(frame, name, (tx, ty + text_size[1]),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
+
+
+def draw_metrics_overlay(frame, lines, origin=(8, 18)):
+    """Draw metric text lines (``PipelineMetrics.overlay_lines``) over a frame."""
+    x, y = origin
+    width = max((cv2.getTextSize(line, cv2.FONT_HERSHEY_PLAIN, 1.0, 1)[0][0] for line in lines),
+                default=0)
+    cv2.rectangle(frame, (x - 4, y - 14), (x + width + 4, y + 16 * (len(lines) - 1) + 6),
+                  (0, 0, 0), -1)
+    for i, line in enumerate(lines):
+        cv2.putText(frame, line, (x, y + 16 * i), cv2.FONT_HERSHEY_PLAIN, 1.0,
+                    (255, 255, 255), 1, cv2.LINE_AA)
+
+
+def identify_kiosk_frame(frame, known_encodings, known_names, timer=None, profile=None):
+    """Return the name of a known face in a kiosk frame or ``None``."""
+    t = timer or _NullTimer()
+    profile = profile or PROFILES[KIOSK_PROFILE]
+    with t.stage('resize'):
+        small = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    with t.stage('face_detect'):
+        locs = find_faces(rgb, profile)
+    with t.stage('encode'):
+        encs = encode_faces(rgb, locs, profile)
+    with t.stage('match'):
+        for enc in encs:
+            name = match_face(known_encodings, known_names, enc, profile.tolerance)
+            if name:
+                return name
+    return None
+
+
+# Киоск: ширина лица (px), до которой уменьшается область поиска; поле
+# вокруг прошлого лица в долях его размера; сколько кадров без лица
+# допускается до возврата к поиску по всему кадру; голосование
+KIOSK_ROI_FACE_PX = 120
+KIOSK_ROI_PAD = 0.6
+KIOSK_ROI_MAX_MISSES = 2
+KIOSK_VOTE_WINDOW = 5
+KIOSK_VOTES_NEEDED = 3
+
+
+class KioskRecognizer:
+    """Распознавание на входном киоске с отслеживанием лица.
+
+    Пока лицо не найдено, поиск идёт по всему кадру в масштабе 1/4. После
+    находки следующий кадр ищет только в области вокруг прошлого лица, в
+    разрешении, где лицо около ``KIOSK_ROI_FACE_PX`` пикселей: это и
+    быстрее, и точнее. Если лица нет ``KIOSK_ROI_MAX_MISSES`` кадров
+    подряд, поиск снова идёт по всему кадру. Решение принимается, когда
+    одно имя набирает ``KIOSK_VOTES_NEEDED`` голосов из последних
+    ``KIOSK_VOTE_WINDOW`` кадров с лицом. Уверенность решения (по средней
+    дистанции отданных за имя голосов) остаётся в ``confidence``.
+    """
+
+    def __init__(self, timer=None, profile=None):
+        self.timer = timer or _NullTimer()
+        self.profile = profile or PROFILES[KIOSK_PROFILE]
+        self.confidence = None
+        self.reset()
+
+    def reset(self):
+        self.roi = None  # (top, right, bottom, left) лица в полном кадре
+        self.misses = 0
+        # голоса — пары (имя или None, дистанция)
+        self.votes = deque(maxlen=KIOSK_VOTE_WINDOW)
+
+    @property
+    def tracking(self):
+        return self.roi is not None
+
+    def _detect_roi(self, frame):
+        """Search around the last face; return ``(rgb, loc in rgb, loc in frame)`` or None."""
+        top, right, bottom, left = self.roi
+        fh, fw = bottom - top, right - left
+        pad_y, pad_x = int(fh * KIOSK_ROI_PAD), int(fw * KIOSK_ROI_PAD)
+        h, w = frame.shape[:2]
+        y0, y1 = max(0, top - pad_y), min(h, bottom + pad_y)
+        x0, x1 = max(0, left - pad_x), min(w, right + pad_x)
+        if y1 <= y0 or x1 <= x0:
+            return None
+        scale = min(1.0, KIOSK_ROI_FACE_PX / max(fw, 1))
+        crop = frame[y0:y1, x0:x1]
+        if scale < 1.0:
+            crop = cv2.resize(crop, (0, 0), fx=scale, fy=scale)
+        rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+        locs = find_faces(rgb, self.profile)
+        if not locs:
+            return None
+        loc = max(locs, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+        t, r, b, l = loc
+        full = (y0 + int(t / scale), min(w, x0 + int(r / scale)),
+                min(h, y0 + int(b / scale)), x0 + int(l / scale))
+        return rgb, loc, full
+
+    def _detect_full(self, frame):
+        small = cv2.resize(frame, (0, 0), fx=0.25, fy=0.25)
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        locs = find_faces(rgb, self.profile)
+        if not locs:
+            return None
+        loc = max(locs, key=lambda l: (l[2] - l[0]) * (l[1] - l[3]))
+        return rgb, loc, tuple(v * 4 for v in loc)
+
+    def process(self, frame, known_encodings, known_names):
+        """Feed one frame; return a name once the vote is decided, else ``None``."""
+        t = self.timer
+        found = None
+        if self.roi is not None:
+            with t.stage('roi_detect'):
+                found = self._detect_roi(frame)
+            if found is None:
+                self.misses += 1
+                if self.misses > KIOSK_ROI_MAX_MISSES:
+                    self.reset()
+        if found is None and self.roi is None:
+            with t.stage('face_detect'):
+                found = self._detect_full(frame)
+        if found is None:
+            return None
+        rgb, loc, self.roi = found
+        self.misses = 0
+        with t.stage('encode'):
+            encs = encode_faces(rgb, [loc], self.profile)
+        with t.stage('match'):
+            name, dist = (closest_face(known_encodings, known_names, encs[0], self.profile.tolerance)
+                          if encs else (None, None))
+        self.votes.append((name, dist))
+        if name is None:
+            return None
+        dists = [d for n, d in self.votes if n == name]
+        if len(dists) >= KIOSK_VOTES_NEEDED:
+            self.confidence = confidence(sum(dists) / len(dists))
+            self.reset()
+            return name
+        return None
+
+
+# --- Источники кадров ---
+
+class FrameSource:
+    """Источник кадров. ``read`` возвращает BGR-кадр или ``None``.
+
+    Для живого источника (``live``) ``None`` означает, что кадра пока нет,
+    для файла или каталога — что кадры закончились.
+    """
+
+    live = False
+
+    def read(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class VideoSource(FrameSource):
+    """Камера по индексу или видеофайл через ``cv2.VideoCapture``."""
+
+    def __init__(self, source):
+        self.live = isinstance(source, int)
+        self.cap = cv2.VideoCapture(source)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        return frame if ret else None
+
+    def close(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    """Изображения каталога в порядке имён."""
+
+    def __init__(self, directory):
+        self.paths = [os.path.join(directory, n) for n in sorted(os.listdir(directory))
+                      if n.lower().endswith(IMAGE_EXTS)]
+        self.pos = 0
+
+    def read(self):
+        while self.pos < len(self.paths):
+            frame = cv2.imread(self.paths[self.pos])
+            self.pos += 1
+            if frame is not None:
+                return frame
+        return None
+
+
+def open_source(spec):
+    """Open a camera index (``"0"`` or 0), an image directory or a video file."""
+    if isinstance(spec, int) or str(spec).isdigit():
+        return VideoSource(int(spec))
+    if os.path.isdir(spec):
+        return ImageDirSource(spec)
+    return VideoSource(spec)
+
+
+# --- Приёмники результатов ---
+
+class ResultSink:
+    """Получатель кадров с разметкой и тревог конвейера.
+
+    ``stage`` — имя стадии, под которым в метриках учитывается ``frame``.
+    """
+
+    stage = 'output'
+
+    def frame(self, result):
+        pass
+
+    def alert(self, level, message, event=None):
+        pass
+
+    def close(self):
+        pass
+
+
+class LoggingSink(ResultSink):
+    """Пишет тревоги в модуль ``logging``."""
+
+    def alert(self, level, message, event=None):
+        logging.log(logging.INFO if level.upper() == 'INFO' else logging.WARNING, message)
+
+
+class ServerLogSink(ResultSink):
+    """Отправляет тревоги в журнал сервера (``POST /api/logs``)."""
+
+    def __init__(self, api_url, session=None, station=None):
+        import requests
+        self.api_url = api_url
+        self.session = session or requests.Session()
+        self.station = station
+
+    def alert(self, level, message, event=None):
+        entry = dict(event or {}, timestamp=datetime.datetime.utcnow().isoformat(),
+                     level=level, message=message)
+        if self.station:
+            entry['station'] = self.station
+        try:
+            self.session.post(f"{self.api_url}/logs", json=entry, timeout=2)
+        except Exception as e:
+            logging.error("Не удалось отправить тревогу: %s", e)
+
+
+class VideoWriterSink(ResultSink):
+    """Записывает кадры с разметкой в видеофайл."""
+
+    stage = 'record'
+
+    def __init__(self, path, fps=15):
+        self.path = path
+        self.fps = fps
+        self.writer = None
+
+    def frame(self, result):
+        if self.writer is None:
+            h, w = result.frame.shape[:2]
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*'mp4v'),
+                                          self.fps, (w, h))
+        self.writer.write(result.frame)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+# --- Запуск конвейера ---
+
+class SecurityRunner:
+    """Связывает источник кадров, ``SecurityPipeline`` и приёмники.
+
+    ``size`` — размер обрабатываемого кадра: кортеж или функция без
+    аргументов (так интерфейс подставляет текущий размер окна).
+    """
+
+    def __init__(self, pipeline, source, sinks=(), size=SECURITY_DEFAULT_SIZE):
+        self.pipeline = pipeline
+        self.source = source
+        self.sinks = list(sinks)
+        self.size = size
+        self.exhausted = False
+        pipeline.alerts.send = self._alert
+
+    def _alert(self, level, message, event=None):
+        with self.pipeline.timer.stage('log_ship'):
+            for sink in self.sinks:
+                sink.alert(level, message, event)
+
+    def step(self):
+        """Process one frame; return its ``FrameResult`` or ``None``."""
+        t = self.pipeline.timer
+        t0 = time.perf_counter()
+        with t.stage('capture'):
+            frame = self.source.read()
+        if frame is None:
+            self.exhausted = not self.source.live
+            return None
+        size = self.size() if callable(self.size) else self.size
+        with t.stage('frame'):
+            result = self.pipeline.process(frame, size)
+        for sink in self.sinks:
+            with t.stage(sink.stage):
+                sink.frame(result)
+        t.tick()
+        if self.pipeline.scheduler is not None:
+            self.pipeline.scheduler.end_frame(time.perf_counter() - t0)
+        return result
+
+    def delay(self):
+        """Seconds to wait before the next ``step`` of a live source."""
+        scheduler = self.pipeline.scheduler
+        return scheduler.delay() if scheduler is not None else 0.03
+
+    def run(self, stop=None, interval=0.0):
+        """Process frames until the source ends or ``stop`` (an Event) is set.
+
+        Live sources are paced by the pipeline's scheduler (or ``interval``);
+        files are processed as fast as possible.
+        """
+        stop = stop or threading.Event()
+        while not stop.is_set() and not self.exhausted:
+            result = self.step()
+            if interval:
+                stop.wait(interval)
+            elif self.source.live:
+                stop.wait(self.delay() if result is not None else 0.03)
+
+    def close(self):
+        self.source.close()
+        for sink in self.sinks:
+            sink.close()
+
+
+# --- Безголовый узел камеры ---
+
+class ServerState:
+    """Галерея лиц, допуски и зоны помещения, загружаемые с сервера."""
+
+    def __init__(self, api_host, env_id, session=None, profile=None):
+        import requests
+        self.api_host = api_host.rstrip('/')
+        self.api_url = self.api_host + '/api'
+        self.env_id = env_id
+        self.session = session or requests.Session()
+        self.emp_version = None
+        # эталонные фото кодируются этим профилем; фото по URL не меняется,
+        # поэтому кодировки запоминаются по URL
+        self.profile = profile or PROFILES[ENROLLMENT_PROFILE]
+        self.encodings = {}
+
+    def _get(self, path, **kwargs):
+        resp = self.session.get(self.api_url + path, timeout=10, **kwargs)
+        resp.raise_for_status()
+        return resp
+
+    def apply(self, pipeline):
+        """Refresh ``pipeline`` state; only photos not seen before are encoded."""
+        from PIL import Image
+        version = self._get('/employees/version').json().get('version')
+        if version != self.emp_version:
+            encodings, names, known = [], [], {}
+            for emp in self._get('/employees').json():
+                url = emp['photo_url']
+                if url in self.encodings:
+                    enc = self.encodings[url]
+                else:
+                    r = self.session.get(self.api_host + url, timeout=10)
+                    r.raise_for_status()
+                    img = np.array(Image.open(io.BytesIO(r.content)).convert('RGB'))
+                    enc = encode_photo(img, self.profile)
+                known[url] = enc
+                if enc is not None:
+                    encodings.append(enc)
+                    names.append(emp['name'])
+            pipeline.known_encodings, pipeline.known_names = encodings, names
+            self.encodings = known
+            self.emp_version = version
+        pipeline.assignments = self._get('/assignments').json()
+        pipeline.zones = self._get(f'/environments/{self.env_id}/zones').json()
+        envs = self._get('/environments').json()
+        env = next((e for e in envs if e.get('id') == self.env_id), {})
+        pipeline.env_id = self.env_id
+        pipeline.env_name = env.get('name', UNKNOWN_ENV_NAME)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Безголовый узел камеры службы безопасности')
+    parser.add_argument('--source', default='0', help='camera index, video file or image directory')
+    parser.add_argument('--api', required=True, help='server address, e.g. http://192.168.109.200:5001')
+    parser.add_argument('--env-id', required=True, help='ID of the monitored environment')
+    parser.add_argument('--yolo', help='person detector model (.pt or exported .onnx)')
+    parser.add_argument('--detector-backend', default='auto', choices=('auto',) + BACKENDS)
+    parser.add_argument('--detector-size', type=int, default=DEFAULT_INPUT_SIZE,
+                        help='detector input size in pixels')
+    parser.add_argument('--detector-threads', type=int, help='CPU threads for the detector')
+    parser.add_argument('--size', default='x'.join(map(str, SECURITY_DEFAULT_SIZE)),
+                        help='processing frame size, WxH')
+    parser.add_argument('--profile', default=SECURITY_PROFILE, choices=tuple(PROFILES),
+                        help='face detection and matching settings for camera frames')
+    parser.add_argument('--enroll-profile', default=ENROLLMENT_PROFILE, choices=tuple(PROFILES),
+                        help='face detection and encoding settings for employee photos')
+    parser.add_argument('--refresh', type=float, default=30,
+                        help='seconds between reloads of gallery, assignments and zones')
+    parser.add_argument('--record', help='write annotated video to this file')
+    parser.add_argument('--target-fps', type=float, default=SECURITY_TARGET_FPS,
+                        help='run stages at their own rates to hold this FPS; 0 runs all on every frame')
+    parser.add_argument('--metrics-file', help='write Prometheus metrics to this file')
+    parser.add_argument('--metrics-port', type=int, help='serve Prometheus metrics on this port')
+    parser.add_argument('--station', default=socket.gethostname(),
+                        help='name of this node in the server event log')
+    parser.add_argument('--diagnostics-dir', default='diagnostics',
+                        help='where SIGUSR1 (stack sampling) and SIGUSR2 (memory diff) write results')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s: %(message)s')
+    Diagnostics(args.diagnostics_dir).install_signals()
+    detector = None
+    if args.yolo:
+        detector = load_detector(args.yolo, args.detector_backend, args.detector_size,
+                                 args.detector_threads)
+    metrics = PipelineMetrics('security')
+    exporter = None
+    if args.metrics_file or args.metrics_port:
+        exporter = MetricsExporter([metrics], args.metrics_file, args.metrics_port).start()
+    scheduler = FrameScheduler(args.target_fps) if args.target_fps > 0 else None
+    pipeline = SecurityPipeline(None, detector, metrics, scheduler, PROFILES[args.profile])
+    state = ServerState(args.api, args.env_id, profile=PROFILES[args.enroll_profile])
+    state.apply(pipeline)
+    sinks = [LoggingSink(), ServerLogSink(state.api_url, station=args.station)]
+    if args.record:
+        sinks.append(VideoWriterSink(args.record))
+    size = tuple(int(v) for v in args.size.lower().split('x'))
+    runner = SecurityRunner(pipeline, open_source(args.source), sinks, size)
+
+    stop = threading.Event()
+
+    def refresh():
+        while not stop.wait(args.refresh):
+            try:
+                state.apply(pipeline)
+            except Exception as e:
+                logging.error("Не удалось обновить данные с сервера: %s", e)
+
+    threading.Thread(target=refresh, daemon=True).start()
+    try:
+        runner.run(stop)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        runner.close()
+        if exporter is not None:
+            exporter.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,33 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import (Flask, Response, request, jsonify, send_from_directory, abort,
+                   stream_with_context, has_request_context)
 from flask_cors import CORS
-import os, uuid, datetime, json
+from PIL import Image, ImageOps
+from werkzeug.utils import safe_join
+from contextlib import contextmanager
+from collections import defaultdict
+import os, uuid, datetime, json, glob, threading, time, copy
+
+from events import MESSAGE, format_line, normalize_event
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессная блокировка недоступна
+    fcntl = None
+
+# Необязательные форматы и алгоритмы сжатия ответов
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import gzip
 
 # Инициализация приложения
 app = Flask(__name__)
@@ -8,176 +35,1312 @@ CORS(app)
 
 # Абсолютные пути
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
+# FR_DATA_DIR позволяет запустить сервер на другом каталоге данных (бенчмарки)
+DATA_DIR = os.environ.get('FR_DATA_DIR') or os.path.join(BASE_DIR, 'data')
 EMP_DIR = os.path.join(DATA_DIR, 'employees')
 ENV_DIR = os.path.join(DATA_DIR, 'environments')
-LOG_FILE = os.path.join(DATA_DIR, 'access.log')
+# Журнал событий: по объекту JSON в строке (схема — в events.py). Старый
+# текстовый журнал при первом запуске переносится в него
+LOG_FILE = os.path.join(DATA_DIR, 'events.jsonl')
+LEGACY_LOG_FILE = os.path.join(DATA_DIR, 'access.log')
+# Журнал отдаётся страницами; курсор — смещение строки в LOG_FILE в байтах
+LOG_PAGE_DEFAULT = 500
+LOG_PAGE_MAX = 5000
+LOG_READ_CHUNK = 64 * 1024
+# Сводки событий: длина префикса времени, задающего корзину, шаг корзины
+# и сколько корзин хранить; снимок сводок и как часто его сохранять (с)
+ROLLUP_KEY_LEN = {'minute': 16, 'hour': 13}
+ROLLUP_STEP = {'minute': datetime.timedelta(minutes=1), 'hour': datetime.timedelta(hours=1)}
+ROLLUP_KEEP = {'minute': 2 * 24 * 60, 'hour': 90 * 24}
+# Период /api/stats без since: последний час по минутам, сутки по часам
+ROLLUP_DEFAULT_SPAN = {'minute': 60, 'hour': 24}
+ROLLUP_FILE = os.path.join(DATA_DIR, 'rollups.json')
+ROLLUP_SAVE_INTERVAL = 60
+ROLLUP_READ_LINES = 10000
 EMP_META = os.path.join(DATA_DIR, 'employees.json')
 ENV_META = os.path.join(DATA_DIR, 'environments.json')
 ASSIGN_FILE = os.path.join(DATA_DIR, 'assignments.json')
 ZONE_DIR = os.path.join(DATA_DIR, 'zones')
+# Журнал нарушений (открытие и обработка, строками JSON), журнал обработки
+# для разбора и сколько строк журнала нарушений допускается до его сжатия
+WARN_FILE = os.path.join(DATA_DIR, 'warnings.jsonl')
+WARN_ACK_LOG = os.path.join(DATA_DIR, 'warning_acks.jsonl')
+WARN_COMPACT_LINES = 10000
+# Файл блокировки, общий для всех процессов-воркеров
+LOCK_FILE = os.path.join(DATA_DIR, '.lock')
+# Лента изменений для /api/events и счётчик её идентификаторов
+FEED_FILE = os.path.join(DATA_DIR, 'feed.jsonl')
+FEED_SEQ_FILE = os.path.join(DATA_DIR, 'feed.seq')
+# При превышении размера из ленты удаляется старшая половина событий
+FEED_MAX_BYTES = 4 * 1024 * 1024
+# Как часто поток проверяет ленту и шлёт keep-alive (секунды)
+FEED_POLL_INTERVAL = 0.25
+FEED_HEARTBEAT = 15
+# Уменьшенные копии фото и изображений помещений (генерируются по запросу)
+CACHE_DIR = os.path.join(DATA_DIR, 'cache')
+# Максимальная сторона варианта, который можно запросить через ?size=
+MAX_VARIANT_SIDE = 2048
+# Загруженные фото и изображения помещений уменьшаются до этой стороны
+# и пересохраняются в JPEG (оригиналы с камер весят 10–20 МБ)
+PHOTO_MAX_SIDE = 1024
+ENV_IMAGE_MAX_SIDE = 1600
+INGEST_JPEG_QUALITY = 90
+# Имена медиафайлов случайные и не меняются, поэтому кэшируем их на год
+MEDIA_MAX_AGE = 365 * 24 * 3600
+# Ответы API меньше этого размера не сжимаются
+COMPRESS_MIN_BYTES = 1024
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+# Метрики запросов: счётчики каждого воркера периодически сбрасываются в
+# METRICS_DIR, /api/metrics суммирует файлы работающих воркеров (файлы
+# завершившихся удаляются). Запросы дольше порога (мс)
+# пишутся в журнал приложения с разбивкой времени по операциям
+METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+METRICS_FLUSH_INTERVAL = 5
+SLOW_REQUEST_MS = float(os.environ.get('FR_SLOW_REQUEST_MS', '500'))
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
 
 # Создаём каталоги и файлы
 os.makedirs(EMP_DIR, exist_ok=True)
 os.makedirs(ENV_DIR, exist_ok=True)
 os.makedirs(ZONE_DIR, exist_ok=True)
-for path in (EMP_META, ENV_META, LOG_FILE, ASSIGN_FILE):
+os.makedirs(CACHE_DIR, exist_ok=True)
+os.makedirs(METRICS_DIR, exist_ok=True)
+for path in (EMP_META, ENV_META, LOG_FILE, ASSIGN_FILE, FEED_FILE, FEED_SEQ_FILE, WARN_FILE):
     if not os.path.exists(path):
         # пустой JSON для метаданных, пустой файл для логов
         with open(path, 'w', encoding='utf-8') as f:
             f.write('[]' if path.endswith('.json') else '')
 
+# --- Общее состояние воркеров ---
+# Под gunicorn каждый процесс держит свою копию метаданных. Файлы на диске
+# остаются источником истины: перед запросом процесс сверяет их подпись
+# (mtime, размер, inode) и перечитывает изменённые, а изменения выполняются
+# под межпроцессной блокировкой и записываются атомарно.
+
+employees = {}
+environments = {}
+assignments = []
+# открытые нарушения по номеру и последний выданный номер
+open_warnings = {}
+warning_seq = 0
+_loaded = {}
+_thread_lock = threading.Lock()
+
+# Метрики этого воркера. Время операций с файлами (ожидание блокировки,
+# чтение и запись метаданных, лента, журнал, изображения) копится и в
+# общих счётчиках, и в разбивке текущего запроса.
+_metrics = {'routes': {}, 'io': {}}
+_metrics_lock = threading.Lock()
+_metrics_flushed = 0.0
+
+
+def _record_io(part, seconds):
+    if has_request_context():
+        timings = request.environ.get('fr.timings')
+        if timings is not None:
+            timings[part] += seconds
+    with _metrics_lock:
+        io = _metrics['io'].setdefault(part, {'count': 0, 'seconds': 0.0})
+        io['count'] += 1
+        io['seconds'] += seconds
+
+
+@contextmanager
+def _timed(part):
+    """Account the duration of the block to ``part``."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_io(part, time.perf_counter() - t0)
+
+
+def _signature(path):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+def _set_employees(data):
+    global employees
+    employees = {item['name']: item for item in data}
+
+
+def _set_environments(data):
+    global environments
+    environments = {item['id']: item for item in data}
+
+
+def _set_assignments(data):
+    global assignments
+    assignments = data
+
+
+_STATE_FILES = (
+    (EMP_META, _set_employees),
+    (ENV_META, _set_environments),
+    (ASSIGN_FILE, _set_assignments),
+)
+
+
+def _refresh_state():
+    """Reload metadata files changed on disk by another worker."""
+    for path, apply in _STATE_FILES:
+        try:
+            sig = _signature(path)
+        except OSError:
+            continue
+        if _loaded.get(path) == sig:
+            continue
+        with _timed('load'), open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        apply(data)
+        _loaded[path] = sig
+    _sync_warnings()
+
+
+@contextmanager
+def _state_lock():
+    """Serialize read-modify-write of metadata across threads and processes."""
+    t0 = time.perf_counter()
+    with _thread_lock, open(LOCK_FILE, 'a') as lock:
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        _record_io('lock_wait', time.perf_counter() - t0)
+        try:
+            _refresh_state()
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _write_json(path, data, part='persist'):
+    """Atomically replace ``path`` so readers never see a partial file.
+
+    The write is timed as ``part``: ``persist`` is kept for shared state, so
+    bookkeeping files (metrics, rollup snapshots) pass their own label.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _timed(part):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp, path)
+    if path in _loaded:
+        _loaded[path] = _signature(path)
+
+
+# --- Журнал нарушений ---
+# Нарушения не переписываются целым файлом: открытие и обработка
+# дописываются строками в WARN_FILE, а каждый воркер дочитывает его с
+# последнего смещения. Когда обработанных записей становится много, журнал
+# сжимается до открытых нарушений (новый файл — воркеры читают его заново).
+
+_warn_lock = threading.Lock()
+_warn_pos = 0
+_warn_inode = None
+_warn_lines = 0
+
+
+def _apply_warning_op(op):
+    global warning_seq
+    if op['op'] == 'open':
+        warning = op['warning']
+        open_warnings[warning['id']] = warning
+        warning_seq = max(warning_seq, warning['id'])
+    elif op['op'] == 'ack':
+        open_warnings.pop(op['id'], None)
+    elif op['op'] == 'seq':
+        warning_seq = max(warning_seq, op['last_id'])
+
+
+def _sync_warnings():
+    """Apply warning journal lines appended since the last call."""
+    global _warn_pos, _warn_inode, _warn_lines, warning_seq
+    with _warn_lock:
+        try:
+            st = os.stat(WARN_FILE)
+        except OSError:
+            return
+        if st.st_ino != _warn_inode or st.st_size < _warn_pos:
+            open_warnings.clear()
+            warning_seq = 0
+            _warn_pos = _warn_lines = 0
+            _warn_inode = st.st_ino
+        if st.st_size == _warn_pos:
+            return
+        with _timed('load'), open(WARN_FILE, 'rb') as f:
+            f.seek(_warn_pos)
+            for raw in f:
+                # строка ещё дописывается другим процессом
+                if not raw.endswith(b'\n'):
+                    break
+                _apply_warning_op(json.loads(raw))
+                _warn_pos += len(raw)
+                _warn_lines += 1
+
+
+def _append_warning_op(op):
+    """Append an operation to the warning journal; call under ``_state_lock``."""
+    with _timed('persist'), open(WARN_FILE, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(op, ensure_ascii=False, separators=(',', ':')) + '\n')
+    _sync_warnings()
+
+
+def _compact_warnings():
+    """Rewrite the journal with only the open warnings; call under ``_state_lock``."""
+    tmp = f"{WARN_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with _timed('persist'):
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'seq', 'last_id': warning_seq}) + '\n')
+            for warning in list(open_warnings.values()):
+                f.write(json.dumps({'op': 'open', 'warning': warning}, ensure_ascii=False,
+                                   separators=(',', ':')) + '\n')
+        os.replace(tmp, WARN_FILE)
+    _sync_warnings()
+
+
+def _migrate_legacy_log():
+    """Convert the old ``"ts level: message"`` log into events once."""
+    if not os.path.exists(LEGACY_LOG_FILE):
+        return
+    with _state_lock():
+        if not os.path.exists(LEGACY_LOG_FILE) or os.path.getsize(LOG_FILE):
+            return
+        tmp = f"{LOG_FILE}.{os.getpid()}.tmp"
+        with open(LEGACY_LOG_FILE, 'r', encoding='utf-8', errors='replace') as src, \
+                open(tmp, 'w', encoding='utf-8') as dst:
+            for line in src:
+                line = line.rstrip('\n')
+                if not line:
+                    continue
+                timestamp, _, rest = line.partition(' ')
+                level, sep, message = rest.partition(': ')
+                if not sep:
+                    level, message = 'INFO', rest
+                event = {'timestamp': timestamp, 'level': level, 'type': MESSAGE,
+                         'message': message}
+                dst.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+        os.replace(tmp, LOG_FILE)
+        os.replace(LEGACY_LOG_FILE, LEGACY_LOG_FILE + '.migrated')
+
+
 # Загружаем метаданные
-with open(EMP_META, 'r', encoding='utf-8') as f:
-    employees = {item['name']: item for item in json.load(f)}
-with open(ENV_META, 'r', encoding='utf-8') as f:
-    env_list = json.load(f)
-    environments = {item['id']: item for item in env_list}
-with open(ASSIGN_FILE, 'r', encoding='utf-8') as f:
-    assignments = json.load(f)
+_refresh_state()
+_migrate_legacy_log()
+
+# --- Лента изменений ---
+# Каждое изменение дописывается строкой JSON в FEED_FILE с возрастающим id.
+# Все воркеры пишут в один файл под блокировкой и читают его для SSE, так что
+# клиент получает события независимо от того, какой процесс их породил.
+
+_feed_thread_lock = threading.Lock()
+
+
+def _publish(kind, data):
+    """Append a change event to the feed shared by all workers."""
+    with _timed('feed'), _feed_thread_lock, open(FEED_SEQ_FILE, 'r+', encoding='utf-8') as seq:
+        if fcntl:
+            fcntl.flock(seq, fcntl.LOCK_EX)
+        try:
+            last = int(seq.read() or 0)
+            event = {'id': last + 1, 'type': kind, 'data': data}
+            with open(FEED_FILE, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(event, ensure_ascii=False, separators=(',', ':')) + '\n')
+                size = f.tell()
+            # счётчик фиксированной ширины перезаписывается на месте без truncate
+            seq.seek(0)
+            seq.write(f"{last + 1:020d}")
+            seq.flush()
+            if size > FEED_MAX_BYTES:
+                _trim_feed()
+        finally:
+            if fcntl:
+                fcntl.flock(seq, fcntl.LOCK_UN)
+
+
+def _trim_feed():
+    with open(FEED_FILE, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    tmp = f"{FEED_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.writelines(lines[len(lines) // 2:])
+    os.replace(tmp, FEED_FILE)
+
+
+def _feed_last_id():
+    try:
+        with open(FEED_SEQ_FILE, 'r', encoding='utf-8') as f:
+            return int(f.read() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _feed_stream(last_id):
+    """Yield SSE messages for feed events newer than ``last_id``."""
+    f = None
+    inode = None
+    idle = 0.0
+    # первый фрагмент сразу, иначе WSGI-сервер не отправит заголовки ответа
+    yield 'retry: 3000\n\n'
+    try:
+        while True:
+            try:
+                st = os.stat(FEED_FILE)
+            except OSError:
+                st = None
+            if st is not None and st.st_ino != inode:
+                # файл создан заново после обрезки — читаем с начала
+                if f:
+                    f.close()
+                f = open(FEED_FILE, 'r', encoding='utf-8')
+                inode = st.st_ino
+            line = f.readline() if f else ''
+            if line.endswith('\n'):
+                event = json.loads(line)
+                if event['id'] > last_id:
+                    last_id = event['id']
+                    payload = json.dumps(event['data'], ensure_ascii=False, separators=(',', ':'))
+                    yield f"id: {last_id}\nevent: {event['type']}\ndata: {payload}\n\n"
+                    idle = 0.0
+                continue
+            if line:
+                # строка ещё дописывается другим процессом
+                f.seek(f.tell() - len(line.encode('utf-8')))
+            time.sleep(FEED_POLL_INTERVAL)
+            idle += FEED_POLL_INTERVAL
+            if idle >= FEED_HEARTBEAT:
+                idle = 0.0
+                yield ': keep-alive\n\n'
+    finally:
+        if f:
+            f.close()
+
+
+@app.before_request
+def _sync_state():
+    rule = request.url_rule
+    request.environ['fr.route'] = f"{request.method} {rule.rule if rule else '<unmatched>'}"
+    _refresh_state()
+
+# --- Формат и сжатие ответов ---
+
+def _reply(data):
+    """Serialize ``data`` as MessagePack or JSON, as the client's Accept asks."""
+    if msgpack is not None:
+        best = request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE])
+        if best == MSGPACK_MIMETYPE:
+            with _timed('encode'):
+                resp = Response(msgpack.packb(data, use_bin_type=True), mimetype=MSGPACK_MIMETYPE)
+            resp.vary.add('Accept')
+            return resp
+    with _timed('encode'):
+        resp = jsonify(data)
+    if msgpack is not None:
+        resp.vary.add('Accept')
+    return resp
+
+
+def _compressors():
+    options = {}
+    if zstandard is not None:
+        options['zstd'] = lambda b: zstandard.ZstdCompressor(level=3).compress(b)
+    if brotli is not None:
+        options['br'] = lambda b: brotli.compress(b, quality=5)
+    options['gzip'] = lambda b: gzip.compress(b, compresslevel=6)
+    return options
+
+
+_COMPRESSORS = _compressors()
+
+
+@app.after_request
+def _compress(resp):
+    """Compress API payloads with the best encoding the client accepts."""
+    if (resp.direct_passthrough or resp.is_streamed or 'Content-Encoding' in resp.headers
+            or resp.mimetype not in ('application/json', MSGPACK_MIMETYPE)):
+        return resp
+    resp.vary.add('Accept-Encoding')
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return resp
+    encoding = request.accept_encodings.best_match(list(_COMPRESSORS))
+    if encoding is None:
+        return resp
+    with _timed('compress'):
+        resp.set_data(_COMPRESSORS[encoding](body))
+    resp.headers['Content-Encoding'] = encoding
+    return resp
 
 # Утилиты сохранения
 
 def _save_employees():
-    with open(EMP_META, 'w', encoding='utf-8') as f:
-        json.dump(list(employees.values()), f, ensure_ascii=False, indent=2)
+    _write_json(EMP_META, list(employees.values()))
 
 
 @app.route('/api/employees/version', methods=['GET'])
 def employees_version():
     """Return modification timestamp of employee metadata."""
-    return jsonify({'version': os.path.getmtime(EMP_META)})
+    return _reply({'version': os.path.getmtime(EMP_META)})
 
 
 def _save_environments():
-    with open(ENV_META, 'w', encoding='utf-8') as f:
-        json.dump(list(environments.values()), f, ensure_ascii=False, indent=2)
+    _write_json(ENV_META, list(environments.values()))
 
 def _save_assignments():
-    with open(ASSIGN_FILE, 'w', encoding='utf-8') as f:
-        json.dump(assignments, f, ensure_ascii=False, indent=2)
+    _write_json(ASSIGN_FILE, assignments)
+
+# --- Приём и уменьшенные варианты изображений ---
+
+def _ingest_image(upload, directory, stem, max_side):
+    """Store an uploaded image upright, downscaled and re-encoded as JPEG."""
+    fn = f"{stem}.jpg"
+    try:
+        with _timed('image'), Image.open(upload.stream) as img:
+            # JPEG декодируется сразу с уменьшением в 2/4/8 раз, если это возможно
+            img.draft('RGB', (max_side, max_side))
+            img = ImageOps.exif_transpose(img).convert('RGB')
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            img.save(os.path.join(directory, fn), format='JPEG',
+                     quality=INGEST_JPEG_QUALITY, optimize=True)
+    except (OSError, Image.DecompressionBombError):
+        abort(400)
+    return fn
+
+
+def _parse_size(value):
+    """Parse ``64`` or ``800x600`` into a (width, height) box or return None."""
+    if not value:
+        return None
+    try:
+        if 'x' in value:
+            w, h = (int(v) for v in value.lower().split('x', 1))
+        else:
+            w = h = int(value)
+    except ValueError:
+        abort(400)
+    if not (0 < w <= MAX_VARIANT_SIDE and 0 < h <= MAX_VARIANT_SIDE):
+        abort(400)
+    return w, h
+
+
+def _send_media(directory, filename):
+    """Send an immutable media file with ETag, Range and long-lived caching."""
+    resp = send_from_directory(directory, filename, conditional=True, etag=True,
+                               max_age=MEDIA_MAX_AGE)
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+def _send_image(directory, filename):
+    """Send an image or its downscaled variant cached on disk."""
+    size = _parse_size(request.args.get('size'))
+    if size is None:
+        return _send_media(directory, filename)
+    src = safe_join(directory, filename)
+    if src is None or not os.path.isfile(src):
+        abort(404)
+    stem = os.path.splitext(filename)[0]
+    variant = f"{stem}_{size[0]}x{size[1]}.jpg"
+    dst = os.path.join(CACHE_DIR, variant)
+    if not os.path.exists(dst):
+        # пишем во временный файл, чтобы параллельный запрос не получил половину
+        tmp = f"{dst}.{uuid.uuid4().hex}.tmp"
+        try:
+            with _timed('image'), Image.open(src) as img:
+                img = img.convert('RGB')
+                img.thumbnail(size, Image.LANCZOS)
+                img.save(tmp, format='JPEG', quality=85)
+        except (OSError, Image.DecompressionBombError):
+            # исходный файл не изображение, повреждён или слишком велик
+            # (UnidentifiedImageError — подкласс OSError)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            abort(415)
+        os.replace(tmp, dst)
+    return _send_media(CACHE_DIR, variant)
+
+
+def _drop_variants(filename):
+    """Remove cached variants of a deleted image."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    for path in glob.glob(os.path.join(CACHE_DIR, f"{glob.escape(stem)}_*")):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
 
 # --- REST для сотрудников ---
 @app.route('/api/employees', methods=['GET'])
 def list_employees():
-    return jsonify(list(employees.values()))
+    return _reply(list(employees.values()))
 
 @app.route('/api/employees', methods=['POST'])
 def add_employee():
     name = request.form['name']
     dept = request.form['dept']
     photo = request.files['photo']
-    ext = os.path.splitext(photo.filename)[1]
-    fn = f"{uuid.uuid4().hex}{ext}"
-    photo.save(os.path.join(EMP_DIR, fn))
+    fn = _ingest_image(photo, EMP_DIR, uuid.uuid4().hex, PHOTO_MAX_SIDE)
     entry = {'name': name, 'dept': dept, 'photo_url': f"/api/employees/photo/{fn}"}
-    employees[name] = entry
-    _save_employees()
-    return jsonify(entry), 201
+    with _state_lock():
+        employees[name] = entry
+        _save_employees()
+        _publish('employees', {'op': 'add', 'employee': entry,
+                               'version': os.path.getmtime(EMP_META)})
+    return _reply(entry), 201
 
 @app.route('/api/employees/<name>', methods=['DELETE'])
 def del_employee(name):
-    meta = employees.pop(name, None)
+    with _state_lock():
+        meta = employees.pop(name, None)
+        if meta:
+            _save_employees()
+            _publish('employees', {'op': 'delete', 'name': name,
+                                   'version': os.path.getmtime(EMP_META)})
     if meta:
         try:
             os.remove(os.path.join(EMP_DIR, os.path.basename(meta['photo_url'])))
         except OSError:
             pass
-        _save_employees()
-    return jsonify({'status': 'ok'})
+        _drop_variants(meta['photo_url'])
+    return _reply({'status': 'ok'})
 
 @app.route('/api/employees/photo/<filename>')
 def get_employee_photo(filename):
-    return send_from_directory(EMP_DIR, filename)
+    return _send_image(EMP_DIR, filename)
 
 # --- REST для помещений ---
 @app.route('/api/environments', methods=['GET'])
 def list_env():
-    return jsonify(list(environments.values()))
+    return _reply(list(environments.values()))
 
 @app.route('/api/environments', methods=['POST'])
 def add_env():
     nm = request.form['name']
     loc = request.form['location']
     img = request.files['image']
-    ext = os.path.splitext(img.filename)[1]
     eid = uuid.uuid4().hex
-    fn = f"{eid}{ext}"
-    img.save(os.path.join(ENV_DIR, fn))
+    fn = _ingest_image(img, ENV_DIR, eid, ENV_IMAGE_MAX_SIDE)
     entry = {'id': eid, 'name': nm, 'location': loc, 'image_url': f"/api/environments/image/{fn}"}
-    environments[eid] = entry
-    _save_environments()
-    return jsonify(entry), 201
+    with _state_lock():
+        environments[eid] = entry
+        _save_environments()
+        _publish('environments', {'op': 'add', 'environment': entry})
+    return _reply(entry), 201
 
 @app.route('/api/environments/<eid>', methods=['DELETE'])
 def del_env(eid):
-    env = environments.pop(eid, None)
+    with _state_lock():
+        env = environments.pop(eid, None)
+        if env:
+            _save_environments()
+            _publish('environments', {'op': 'delete', 'id': eid})
     if env:
         try:
             os.remove(os.path.join(ENV_DIR, os.path.basename(env['image_url'])))
         except OSError:
             pass
-        _save_environments()
-    return jsonify({'status': 'ok'})
+        _drop_variants(env['image_url'])
+    return _reply({'status': 'ok'})
 
 @app.route('/api/environments/image/<filename>')
 def get_env_img(filename):
-    return send_from_directory(ENV_DIR, filename)
+    return _send_image(ENV_DIR, filename)
 
 # --- REST для назначений ---
 @app.route('/api/assignments', methods=['GET'])
 def list_assignments():
-    return jsonify(assignments)
+    return _reply(assignments)
 
 @app.route('/api/assignments', methods=['POST'])
 def add_assignment_record():
     data = request.json
-    assignments.append(data)
-    _save_assignments()
-    return jsonify({'status': 'ok'}), 201
+    with _state_lock():
+        assignments.append(data)
+        _save_assignments()
+        _publish('assignments', {'op': 'add', 'record': data, 'count': len(assignments)})
+    return _reply({'status': 'ok'}), 201
 
 @app.route('/api/assignments/<int:idx>', methods=['DELETE'])
 def delete_assignment_record(idx):
-    if 0 <= idx < len(assignments):
-        assignments.pop(idx)
-        _save_assignments()
-    return jsonify({'status': 'ok'})
+    with _state_lock():
+        if 0 <= idx < len(assignments):
+            assignments.pop(idx)
+            _save_assignments()
+            _publish('assignments', {'op': 'delete', 'index': idx,
+                                     'count': len(assignments)})
+    return _reply({'status': 'ok'})
 
 # --- REST для зон ---
+# Разобранные зоны кэшируются в памяти по подписи файла: запрос стоит один
+# stat, а изменение, записанное другим воркером, замечается сразу.
+_zone_cache = {}
+
+
+def _zone_key(eid):
+    """Return the name of an environment's zone file; it also keys ``_zone_cache``."""
+    return os.path.basename(eid)
+
+
+def _zone_path(key):
+    return os.path.join(ZONE_DIR, f'{key}.json')
+
+
+def _load_zones(eid):
+    """Return ``(version, zones)`` for an environment."""
+    key = _zone_key(eid)
+    path = _zone_path(key)
+    try:
+        sig = _signature(path)
+    except OSError:
+        _zone_cache.pop(key, None)
+        return 0, []
+    cached = _zone_cache.get(key)
+    if cached is None or cached[0] != sig:
+        with open(path, 'r', encoding='utf-8') as f:
+            cached = (sig, json.load(f))
+        _zone_cache[key] = cached
+    return sig[0], cached[1]
+
+
 @app.route('/api/environments/<eid>/zones', methods=['GET'])
 def get_zones(eid):
-    path = os.path.join(ZONE_DIR, f'{eid}.json')
-    if os.path.exists(path):
-        with open(path, 'r', encoding='utf-8') as f:
-            zones = json.load(f)
-    else:
-        zones = []
-    return jsonify(zones)
+    version, zones = _load_zones(eid)
+    resp = _reply(zones)
+    resp.headers['X-Zones-Version'] = str(version)
+    return resp
 
 @app.route('/api/environments/<eid>/zones', methods=['POST'])
 def save_zones(eid):
-    zones = request.json.get('zones', [])
-    with open(os.path.join(ZONE_DIR, f'{eid}.json'), 'w', encoding='utf-8') as f:
-        json.dump(zones, f, ensure_ascii=False, indent=2)
-    return jsonify({'status': 'ok'})
+    key = _zone_key(eid)
+    data = request.get_json(silent=True)
+    zones = data.get('zones', []) if isinstance(data, dict) else None
+    if not key or not isinstance(zones, list) or not all(isinstance(z, dict) for z in zones):
+        abort(400)
+    path = _zone_path(key)
+    with _state_lock():
+        _write_json(path, zones)
+        _zone_cache[key] = (_signature(path), zones)
+        _publish('zones', {'env_id': eid, 'zones': zones})
+    return _reply({'status': 'ok'})
+
+@app.route('/api/zones', methods=['GET'])
+def get_zones_batch():
+    """Return zones of several environments: ``?ids=a,b`` or all of them."""
+    ids = request.args.get('ids')
+    ids = [i for i in ids.split(',') if i] if ids else list(environments)
+    result = {}
+    for eid in ids:
+        version, zones = _load_zones(eid)
+        result[eid] = {'version': version, 'zones': zones}
+    return _reply(result)
 
 # --- REST для логов ---
 @app.route('/api/logs', methods=['POST'])
 def post_log():
-    entry = request.json
-    with open(LOG_FILE, 'a', encoding='utf-8') as f:
-        f.write(f"{entry['timestamp']} {entry['level']}: {entry['message']}\n")
-    return jsonify({'status': 'ok'}), 201
+    """Append an event; the body follows the schema in ``events.py``."""
+    try:
+        entry = normalize_event(request.get_json(silent=True))
+    except ValueError:
+        abort(400)
+    raw = (json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+    with _timed('log_append'), open(LOG_FILE, 'ab') as f:
+        f.write(raw)
+        end = f.tell()
+    # смещения строки позволяют клиенту продолжить чтение с курсора
+    event = {'level': entry['level'], 'line': format_line(entry), 'event': entry,
+             'start': end - len(raw), 'end': end}
+    if entry['level'] == 'WARNING':
+        # нарушение получает номер и остаётся открытым до обработки
+        with _state_lock():
+            warning = dict(entry, id=warning_seq + 1)
+            _append_warning_op({'op': 'open', 'warning': warning})
+            event['warning'] = warning
+            _publish('log', event)
+    else:
+        _publish('log', event)
+    return _reply({'status': 'ok'}), 201
+
+def _log_after(pos, limit):
+    """Return up to ``limit`` complete raw lines from byte ``pos`` and the offset after them."""
+    lines = []
+    end = pos
+    with _timed('log_read'), open(LOG_FILE, 'rb') as f:
+        f.seek(pos)
+        for raw in f:
+            # последняя строка может ещё дописываться
+            if len(lines) >= limit or not raw.endswith(b'\n'):
+                break
+            lines.append(raw[:-1])
+            end += len(raw)
+    return lines, end
+
+
+def _log_before(pos, limit):
+    """Return up to ``limit`` complete raw lines ending at byte ``pos`` and the offset of the first."""
+    start = pos
+    buf = b''
+    with _timed('log_read'), open(LOG_FILE, 'rb') as f:
+        while start > 0 and buf.count(b'\n') <= limit:
+            step = min(LOG_READ_CHUNK, start)
+            start -= step
+            f.seek(start)
+            buf = f.read(step) + buf
+    cut = buf.rfind(b'\n') + 1
+    end = start + cut
+    parts = buf[:cut].split(b'\n')[:-1]
+    if start > 0:
+        # первый кусок — хвост строки, начало которой не прочитано
+        start += len(parts.pop(0)) + 1
+    for raw in parts[:-limit] if len(parts) > limit else ():
+        start += len(raw) + 1
+    return parts[-limit:], start, end
+
+
+def _decode_events(raws):
+    """Decode raw log lines; a line broken by a crash mid-write decodes to ``None``."""
+    if not raws:
+        return []
+    try:
+        # одним вызовом парсера в разы быстрее, чем по строке
+        return json.loads(b'[' + b','.join(raws) + b']')
+    except ValueError:
+        pass
+    events = []
+    for raw in raws:
+        try:
+            events.append(json.loads(raw))
+        except ValueError:
+            events.append(None)
+    return events
+
+
+def _log_filter(args):
+    """Build a predicate from the field filters of ``GET /api/logs`` or ``None``.
+
+    ``type`` and ``level`` take comma-separated values, ``env_id``,
+    ``employee`` and ``station`` exact values, ``since`` and ``until`` ISO
+    timestamps (inclusive and exclusive).
+    """
+    checks = []
+    for field in ('type', 'level'):
+        if args.get(field):
+            values = set(args[field].split(','))
+            checks.append(lambda e, field=field, values=values: e.get(field) in values)
+    for field in ('env_id', 'employee', 'station'):
+        if field in args:
+            checks.append(lambda e, field=field, value=args[field]: e.get(field) == value)
+    if args.get('since'):
+        checks.append(lambda e, since=args['since']: e['timestamp'] >= since)
+    if args.get('until'):
+        checks.append(lambda e, until=args['until']: e['timestamp'] < until)
+    if not checks:
+        return None
+    return lambda e: all(check(e) for check in checks)
+
+
+def _page_after(pos, limit, keep):
+    """Return up to ``limit`` events after byte ``pos`` accepted by ``keep``.
+
+    The result is ``(events, offsets, end)``: offsets are the cursors of
+    the events' lines and ``end`` the cursor after the page.
+    """
+    events, offsets = [], []
+    end = pos
+    while len(events) < limit:
+        raws, _ = _log_after(end, limit if keep is None else LOG_PAGE_MAX)
+        if not raws:
+            break
+        for raw, event in zip(raws, _decode_events(raws)):
+            line_start = end
+            end += len(raw) + 1
+            if event is not None and (keep is None or keep(event)):
+                events.append(event)
+                offsets.append(line_start)
+                if len(events) == limit:
+                    break
+    return events, offsets, end
+
+
+def _page_before(pos, limit, keep):
+    """Return up to ``limit`` events before byte ``pos`` accepted by ``keep``.
+
+    The result is ``(events, offsets, start, end)``: offsets are the
+    cursors of the events' lines, ``start`` and ``end`` surround the page.
+    """
+    events, offsets = [], []
+    start = end = None
+    while len(events) < limit and (start is None or start > 0):
+        raws, _, last = _log_before(pos if start is None else start,
+                                    limit if keep is None else LOG_PAGE_MAX)
+        if start is None:
+            # pos может указывать внутрь дописываемой строки
+            start = end = last
+        if not raws:
+            break
+        for raw, event in zip(reversed(raws), reversed(_decode_events(raws))):
+            start -= len(raw) + 1
+            if event is not None and (keep is None or keep(event)):
+                events.append(event)
+                offsets.append(start)
+                if len(events) == limit:
+                    break
+    events.reverse()
+    offsets.reverse()
+    return events, offsets, start, end
+
 
 @app.route('/api/logs', methods=['GET'])
 def get_logs():
+    """Return log lines or, with ``format=events``, the events themselves.
+
+    With ``after=<cursor>`` — lines written after the cursor; with
+    ``before=<cursor>`` or only ``limit`` — the lines just before the
+    cursor or the end of the log. Such pages are ``{'lines': [...]
+    (oldest first), 'offsets', 'start', 'end', 'more'}``, where
+    ``offsets`` are the cursors of the returned lines, ``start`` and
+    ``end`` are cursors around the page and ``more`` tells whether lines
+    remain in that direction; with ``format=events`` the list is
+    ``events``. Cursors are byte offsets in the stored log, so clients
+    must not derive them from the formatted lines.
+    Without these parameters the whole log is sorted by ``order``.
+    Field filters (see ``_log_filter``) apply to both modes.
+    """
+    args = request.args
+    keep = _log_filter(args)
+    as_events = args.get('format') == 'events'
+    if 'after' in args or 'before' in args or 'limit' in args:
+        limit = max(1, min(args.get('limit', LOG_PAGE_DEFAULT, type=int), LOG_PAGE_MAX))
+        size = os.path.getsize(LOG_FILE)
+        if 'after' in args:
+            start = min(max(0, args.get('after', 0, type=int)), size)
+            events, offsets, end = _page_after(start, limit, keep)
+            more = len(events) == limit and end < size
+        else:
+            pos = min(max(0, args.get('before', size, type=int)), size)
+            events, offsets, start, end = _page_before(pos, limit, keep)
+            more = start > 0
+        page = {'offsets': offsets, 'start': start, 'end': end, 'more': more}
+        if as_events:
+            page['events'] = events
+        else:
+            page['lines'] = [format_line(e) for e in events]
+        return _reply(page)
     order = request.args.get('order', 'desc')
     try:
-        lines = open(LOG_FILE, 'r', encoding='utf-8').read().splitlines()
+        with _timed('log_read'), open(LOG_FILE, 'rb') as f:
+            data = f.read()
     except FileNotFoundError:
-        lines = []
-    lines.sort(reverse=(order == 'desc'))
-    return jsonify(lines)
+        data = b''
+    # последняя строка может ещё дописываться
+    raws = data[:data.rfind(b'\n') + 1].split(b'\n')[:-1]
+    events = [e for e in _decode_events(raws) if e is not None and (keep is None or keep(e))]
+    events.sort(key=lambda e: e['timestamp'], reverse=(order == 'desc'))
+    return _reply(events if as_events else [format_line(e) for e in events])
+
+# --- Сводки событий ---
+# Каждый воркер дочитывает журнал событий с последнего смещения и считает
+# события по минутам и часам в разрезе типа и помещения, поэтому /api/stats
+# не сканирует журнал. Счётчики вместе со смещением периодически
+# сохраняются в ROLLUP_FILE: после перезапуска дочитывается только хвост.
+
+_rollup_lock = threading.Lock()
+# разрешение -> корзина (префикс времени) -> тип -> помещение -> число
+_rollups = {res: {} for res in ROLLUP_KEY_LEN}
+_rollup_cutoff = {res: '' for res in ROLLUP_KEY_LEN}
+_rollup_pos = 0
+_rollup_inode = None
+_rollup_saved = 0.0
+_rollup_pruned = 0.0
+
+
+def _rollup_key(resolution, moment):
+    return moment.isoformat()[:ROLLUP_KEY_LEN[resolution]]
+
+
+def _parse_moment(value):
+    """Parse an ISO date or timestamp into naive UTC like the logged ones; 400 if malformed."""
+    try:
+        moment = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        abort(400)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def _prune_rollups():
+    """Drop buckets older than ``ROLLUP_KEEP``; call under ``_rollup_lock``."""
+    global _rollup_pruned
+    now = datetime.datetime.utcnow()
+    for res, buckets in _rollups.items():
+        cutoff = _rollup_cutoff[res] = _rollup_key(res, now - ROLLUP_STEP[res] * ROLLUP_KEEP[res])
+        for key in [k for k in buckets if k < cutoff]:
+            del buckets[key]
+    _rollup_pruned = time.monotonic()
+
+
+def _count_event(event):
+    timestamp = event.get('timestamp') or ''
+    if len(timestamp) < ROLLUP_KEY_LEN['minute'] or timestamp[10:11] != 'T':
+        return
+    event_type = event.get('type', MESSAGE)
+    env_id = event.get('env_id', '')
+    for res, width in ROLLUP_KEY_LEN.items():
+        key = timestamp[:width]
+        if key < _rollup_cutoff[res]:
+            continue
+        envs = _rollups[res].setdefault(key, {}).setdefault(event_type, {})
+        envs[env_id] = envs.get(env_id, 0) + 1
+
+
+def _load_rollups(st):
+    """Start from the saved snapshot if it belongs to the current log."""
+    global _rollup_pos, _rollup_inode
+    try:
+        with _timed('load'), open(ROLLUP_FILE, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    if snapshot.get('inode') != st.st_ino or snapshot.get('pos', 0) > st.st_size:
+        return
+    for res in _rollups:
+        _rollups[res] = snapshot.get(res, {})
+    _rollup_pos = snapshot['pos']
+    _rollup_inode = st.st_ino
+
+
+def _sync_rollups():
+    """Count events appended to the log since the last call."""
+    global _rollup_pos, _rollup_inode, _rollup_saved
+    with _rollup_lock:
+        try:
+            st = os.stat(LOG_FILE)
+        except OSError:
+            return
+        if _rollup_inode is None:
+            _load_rollups(st)
+        if st.st_ino != _rollup_inode or st.st_size < _rollup_pos:
+            for buckets in _rollups.values():
+                buckets.clear()
+            _rollup_pos = 0
+            _rollup_inode = st.st_ino
+        if time.monotonic() - _rollup_pruned > 60:
+            _prune_rollups()
+        start = _rollup_pos
+        while _rollup_pos < st.st_size:
+            raws, end = _log_after(_rollup_pos, ROLLUP_READ_LINES)
+            if not raws:
+                break
+            for event in _decode_events(raws):
+                if event is not None:
+                    _count_event(event)
+            _rollup_pos = end
+        if _rollup_pos != start and time.monotonic() - _rollup_saved > ROLLUP_SAVE_INTERVAL:
+            _rollup_saved = time.monotonic()
+            snapshot = dict(_rollups, inode=_rollup_inode, pos=_rollup_pos)
+            try:
+                _write_json(ROLLUP_FILE, snapshot, 'rollups')
+            except OSError:
+                pass
+
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Return event counts per minute or hour by event type and environment.
+
+    ``resolution`` is ``minute`` (the last hour by default) or ``hour``
+    (the last day); ``since`` and ``until`` are ISO dates or timestamps
+    (with an offset they are converted to UTC), ``type``
+    and ``env_id`` comma-separated filters (an empty ``env_id`` matches
+    events without an environment). The answer is ``{'resolution',
+    'since', 'until', 'buckets': [{'start', 'type', 'env_id', 'count'}]
+    (oldest first), 'totals': {type: count}}``; it is built from the
+    rollups, not from the log.
+    """
+    args = request.args
+    resolution = args.get('resolution', 'hour')
+    if resolution not in ROLLUP_KEY_LEN:
+        abort(400)
+    _sync_rollups()
+    width = ROLLUP_KEY_LEN[resolution]
+    # дополнение префикса корзины до полного времени ISO
+    suffix = ':00:00'[:19 - width]
+    if args.get('since'):
+        since = _parse_moment(args['since'])
+    else:
+        since = datetime.datetime.utcnow() - ROLLUP_STEP[resolution] * (ROLLUP_DEFAULT_SPAN[resolution] - 1)
+    since_key = _rollup_key(resolution, since)
+    until = _parse_moment(args['until']).isoformat() if args.get('until') else None
+    types = set(args['type'].split(',')) if args.get('type') else None
+    envs = set(args['env_id'].split(',')) if 'env_id' in args else None
+    rows, totals = [], defaultdict(int)
+    with _rollup_lock:
+        buckets = _rollups[resolution]
+        for key in sorted(k for k in buckets
+                          if k >= since_key and (until is None or k + suffix < until)):
+            for event_type, counts in sorted(buckets[key].items()):
+                if types is not None and event_type not in types:
+                    continue
+                for env_id, count in sorted(counts.items()):
+                    if envs is not None and env_id not in envs:
+                        continue
+                    rows.append({'start': key + suffix, 'type': event_type,
+                                 'env_id': env_id, 'count': count})
+                    totals[event_type] += count
+    return _reply({'resolution': resolution, 'since': since_key + suffix, 'until': until,
+                   'buckets': rows, 'totals': totals})
+
+# --- Нарушения ---
+@app.route('/api/warnings', methods=['GET'])
+def list_warnings():
+    """Return open (not yet acknowledged) warnings, newest first by default."""
+    order = request.args.get('order', 'desc')
+    items = list(open_warnings.values())
+    if order == 'desc':
+        items.reverse()
+    return _reply(items)
+
+@app.route('/api/warnings/<int:wid>/ack', methods=['POST'])
+def ack_warning(wid):
+    """Acknowledge a warning for all stations; repeating the call is harmless."""
+    by = (request.get_json(silent=True) or {}).get('by', '')
+    with _state_lock():
+        warning = open_warnings.get(wid)
+        if warning is None:
+            if 0 < wid <= warning_seq:
+                return _reply({'status': 'ok'})
+            abort(404)
+        _append_warning_op({'op': 'ack', 'id': wid})
+        record = dict(warning, acked_at=datetime.datetime.utcnow().isoformat(), acked_by=by)
+        with _timed('log_append'), open(WARN_ACK_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        _publish('warnings', {'op': 'ack', 'id': wid, 'by': by})
+        if _warn_lines > WARN_COMPACT_LINES and _warn_lines > 2 * len(open_warnings):
+            _compact_warnings()
+    return _reply({'status': 'ok'})
+
+# --- Поток изменений (Server-Sent Events) ---
+@app.route('/api/events', methods=['GET'])
+def events():
+    """Stream employee, environment, assignment, zone, log and warning changes.
+
+    A client resumes after a reconnect with the ``Last-Event-ID`` header;
+    a new client only receives events published after it connected.
+    Each stream holds a worker, so run gunicorn with ``--threads`` or an
+    async worker class when many stations are connected.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(since)
+    except (TypeError, ValueError):
+        last_id = _feed_last_id()
+    return Response(stream_with_context(_feed_stream(last_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# --- Метрики запросов ---
+
+def _new_route_metrics():
+    return {'count': 0, 'errors': 0, 'seconds': 0.0, 'buckets': [0] * len(REQUEST_BUCKETS),
+            'request_bytes': 0, 'response_bytes': 0}
+
+
+def _record_request(environ, status, response_bytes, seconds):
+    route = environ.get('fr.route') or f"{environ.get('REQUEST_METHOD')} <unmatched>"
+    try:
+        request_bytes = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        request_bytes = 0
+    with _metrics_lock:
+        r = _metrics['routes'].get(route)
+        if r is None:
+            r = _metrics['routes'][route] = _new_route_metrics()
+        r['count'] += 1
+        r['errors'] += status >= 500
+        r['seconds'] += seconds
+        r['request_bytes'] += request_bytes
+        r['response_bytes'] += response_bytes
+        for i, bound in enumerate(REQUEST_BUCKETS):
+            if seconds <= bound:
+                r['buckets'][i] += 1
+                break
+    if seconds * 1000 >= SLOW_REQUEST_MS:
+        timings = environ['fr.timings']
+        parts = [f"{part} {t * 1000:.1f} мс" for part, t in
+                 sorted(timings.items(), key=lambda kv: -kv[1])]
+        other = seconds - sum(timings.values())
+        parts.append(f"прочее {max(other, 0) * 1000:.1f} мс")
+        app.logger.warning("Медленный запрос %s %s: %.1f мс, статус %d, принято %d Б, отдано %d Б; %s",
+                           environ.get('REQUEST_METHOD'), environ.get('PATH_INFO'), seconds * 1000,
+                           status, request_bytes, response_bytes, ', '.join(parts))
+
+
+def _flush_metrics(force=False):
+    """Save this worker's counters so any worker can report the total."""
+    global _metrics_flushed
+    now = time.monotonic()
+    if not force and now - _metrics_flushed < METRICS_FLUSH_INTERVAL:
+        return
+    _metrics_flushed = now
+    with _metrics_lock:
+        snapshot = copy.deepcopy(_metrics)
+    try:
+        _write_json(os.path.join(METRICS_DIR, f"worker-{os.getpid()}.json"), snapshot,
+                    'metrics')
+    except OSError:
+        pass
+
+
+def _worker_alive(pid):
+    """Whether the worker that saved metrics as ``pid`` is still running."""
+    if pid == os.getpid():
+        return True
+    if not fcntl:
+        # без fcntl несколько воркеров не поддерживаются: файлы остались от
+        # прошлых запусков (и os.kill на Windows завершил бы процесс)
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # процесс есть, но принадлежит другому пользователю
+        pass
+    return True
+
+
+class _RequestMetrics:
+    """WSGI middleware: per-route latency, payload sizes and slow-request log.
+
+    The time is measured until the application returns its response, so
+    streamed bodies (``/api/events``) count only up to the first chunk.
+    """
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        environ['fr.timings'] = defaultdict(float)
+        seen = {}
+
+        def _start_response(status, headers, exc_info=None):
+            seen['status'] = int(status.split(' ', 1)[0])
+            seen['length'] = next((int(v) for k, v in headers if k.lower() == 'content-length'), 0)
+            return start_response(status, headers, exc_info)
+
+        t0 = time.perf_counter()
+        result = self.wsgi_app(environ, _start_response)
+        _record_request(environ, seen.get('status', 500), seen.get('length', 0),
+                        time.perf_counter() - t0)
+        _flush_metrics()
+        return result
+
+
+app.wsgi_app = _RequestMetrics(app.wsgi_app)
+
+
+def _merged_metrics():
+    """Sum the counters saved by running workers, this one up to date.
+
+    Files of workers that have exited (restart, redeploy) are removed.
+    A new worker that got the PID of an exited one overwrites its file on
+    its first request.
+    """
+    _flush_metrics(force=True)
+    total = {'workers': 0, 'routes': {}, 'io': {}}
+    for path in glob.glob(os.path.join(METRICS_DIR, 'worker-*.json')):
+        pid = os.path.basename(path)[len('worker-'):-len('.json')]
+        if not pid.isdigit() or not _worker_alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        total['workers'] += 1
+        for route, r in data.get('routes', {}).items():
+            t = total['routes'].setdefault(route, _new_route_metrics())
+            for key in ('count', 'errors', 'seconds', 'request_bytes', 'response_bytes'):
+                t[key] += r[key]
+            if len(r['buckets']) == len(t['buckets']):
+                t['buckets'] = [a + b for a, b in zip(t['buckets'], r['buckets'])]
+        for part, v in data.get('io', {}).items():
+            t = total['io'].setdefault(part, {'count': 0, 'seconds': 0.0})
+            t['count'] += v['count']
+            t['seconds'] += v['seconds']
+    return total
+
+
+def _bucket_quantile(buckets, count, q):
+    """Upper bound (ms) of the bucket holding the ``q`` quantile, None past the last."""
+    seen = 0
+    for bound, n in zip(REQUEST_BUCKETS, buckets):
+        seen += n
+        if count and seen >= q * count:
+            return bound * 1000
+    return None
+
+
+def _metrics_text(total):
+    """Render merged metrics in the Prometheus text format."""
+    out = ['# HELP fr_http_request_duration_seconds Request handling time by route.',
+           '# TYPE fr_http_request_duration_seconds histogram']
+    errors, received, sent = [], [], []
+    for route, r in sorted(total['routes'].items()):
+        method, rule = route.split(' ', 1)
+        labels = f'method="{method}",route="{rule}"'
+        cumulative = 0
+        for bound, n in zip(REQUEST_BUCKETS, r['buckets']):
+            cumulative += n
+            out.append(f'fr_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+        out.append(f'fr_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {r["count"]}')
+        out.append(f'fr_http_request_duration_seconds_sum{{{labels}}} {r["seconds"]:.6f}')
+        out.append(f'fr_http_request_duration_seconds_count{{{labels}}} {r["count"]}')
+        errors.append(f'fr_http_request_errors_total{{{labels}}} {r["errors"]}')
+        received.append(f'fr_http_request_bytes_total{{{labels}}} {r["request_bytes"]}')
+        sent.append(f'fr_http_response_bytes_total{{{labels}}} {r["response_bytes"]}')
+    out += ['# HELP fr_http_request_errors_total Responses with status 5xx.',
+            '# TYPE fr_http_request_errors_total counter', *errors,
+            '# HELP fr_http_request_bytes_total Request body bytes.',
+            '# TYPE fr_http_request_bytes_total counter', *received,
+            '# HELP fr_http_response_bytes_total Response body bytes as sent.',
+            '# TYPE fr_http_response_bytes_total counter', *sent,
+            '# HELP fr_io_seconds_total Time spent in locks, persistence and encoding.',
+            '# TYPE fr_io_seconds_total counter']
+    out += [f'fr_io_seconds_total{{part="{part}"}} {v["seconds"]:.6f}'
+            for part, v in sorted(total['io'].items())]
+    out += ['# HELP fr_io_operations_total Number of timed operations.',
+            '# TYPE fr_io_operations_total counter']
+    out += [f'fr_io_operations_total{{part="{part}"}} {v["count"]}'
+            for part, v in sorted(total['io'].items())]
+    return '\n'.join(out) + '\n'
+
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request and I/O metrics of all workers.
+
+    JSON/MessagePack by default; the Prometheus text format with
+    ``?format=prometheus`` or ``Accept: text/plain``.
+    """
+    total = _merged_metrics()
+    best = request.accept_mimetypes.best_match(['application/json', MSGPACK_MIMETYPE, 'text/plain'])
+    if request.args.get('format') == 'prometheus' or best == 'text/plain':
+        return Response(_metrics_text(total), mimetype='text/plain; version=0.0.4')
+    routes = {}
+    for route, r in total['routes'].items():
+        routes[route] = dict(r, mean_ms=r['seconds'] / r['count'] * 1000 if r['count'] else 0.0,
+                             p50_ms=_bucket_quantile(r['buckets'], r['count'], 0.5),
+                             p95_ms=_bucket_quantile(r['buckets'], r['count'], 0.95))
+    return _reply({'workers': total['workers'], 'buckets_s': list(REQUEST_BUCKETS),
+                   'routes': routes, 'io': total['io']})
 
 if __name__ == '__main__':
+    # Отладочный сервер. В production запускайте несколько воркеров, например:
+    #   gunicorn -w 4 -b 0.0.0.0:5002 server:app
     app.run(host='0.0.0.0', port=5002)
@@ -0,0 +1,50 @@
+"""Проверки приёма записей журнала и сводок событий сервером."""
+import datetime
+import os
+import tempfile
+
+# сервер создаёт каталоги данных при импорте — подменяем их временными
+os.environ['FR_DATA_DIR'] = tempfile.mkdtemp(prefix='fr-test-')
+
+import pytest  # noqa: E402
+
+import server  # noqa: E402
+from events import normalize_event  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    return server.app.test_client()
+
+
+def test_critical_record_is_stored_as_error(client):
+    resp = client.post('/api/logs', json={'level': 'CRITICAL', 'message': 'Камера отключена'})
+    assert resp.status_code == 201
+    page = client.get('/api/logs', query_string={'limit': 1, 'format': 'events'}).get_json()
+    assert page['events'][-1]['message'] == 'Камера отключена'
+    assert page['events'][-1]['level'] == 'ERROR'
+
+
+@pytest.mark.parametrize('level, stored', [
+    ('critical', 'ERROR'), ('FATAL', 'ERROR'), ('WARN', 'WARNING'),
+    ('DEBUG', 'INFO'), ('NOTSET', 'INFO'), ('Level 25', 'INFO'), (None, 'INFO'),
+])
+def test_other_levels_map_onto_known_ones(level, stored):
+    assert normalize_event({'level': level, 'message': 'x'})['level'] == stored
+
+
+def test_malformed_entry_is_rejected(client):
+    assert client.post('/api/logs', json={'level': 'INFO'}).status_code == 400
+
+
+def test_stats_accept_dates_and_reject_malformed_bounds(client):
+    # вчерашний день: старые корзины сводок удаляются
+    day = datetime.date.today() - datetime.timedelta(days=1)
+    client.post('/api/logs', json={'timestamp': f'{day}T05:10:00', 'level': 'WARNING',
+                                   'type': 'fire', 'message': 'Возгорание'})
+    stats = client.get('/api/stats', query_string={
+        'since': str(day), 'until': str(day + datetime.timedelta(days=1)), 'type': 'fire'}).get_json()
+    assert stats['since'] == f'{day}T00:00:00'
+    assert stats['until'] == f'{day + datetime.timedelta(days=1)}T00:00:00'
+    assert stats['totals'] == {'fire': 1}
+    assert client.get('/api/stats', query_string={'since': 'вчера'}).status_code == 400